@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Асинхронный режим: клиент Avito и отправитель Telegram на одном event loop с общим пулом соединений
+"""
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+import metrics
+from async_http import AsyncHttpClient, AsyncResponse
+from avito_client import AvitoClient, MessagePager
+from models import AvitoChat, AvitoMessage
+from rate_limiter import TelegramRateLimiter
+from telegram_sender import DeliveryReport, SendResult, TelegramBotApi
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAvitoClient(AvitoClient):
+    """
+    Клиент Avito на корутинах: те же методы get_messages и mark_message_as_read, но async
+
+    Разбор страниц, отметки чатов, дедупликация и приведение сообщений к формату общие с AvitoClient,
+    здесь только запросы к API. Сообщения чатов загружаются конкурентно с ограничением max_in_flight.
+    Webhook в асинхронном режиме не поддерживается.
+    """
+
+    def __init__(self, config: Dict, http: AsyncHttpClient):
+        """
+        Инициализация клиента
+
+        Args:
+            config: Конфигурация Avito
+            http: Общий асинхронный HTTP клиент
+        """
+        super().__init__(config, transport=http)
+        self._fetch_slots: Optional[asyncio.Semaphore] = None
+
+    async def get_access_token(self) -> Optional[str]:
+        """
+        Получение access token (из кэша или одним общим запросом для всех корутин)
+
+        Returns:
+            Optional[str]: Access token или None при ошибке
+        """
+        return await self.token_manager.get_token_async()
+
+    async def _api_request(self, method: str, url: str, **kwargs) -> AsyncResponse:
+        """
+        Авторизованный запрос к API Avito с однократным повтором при 401
+
+        Raises:
+            OSError, httpx.HTTPError: Если токен не получен или соединение не удалось
+        """
+        response = None
+        for attempt in range(2):
+            access_token = await self.get_access_token()
+            if not access_token:
+                raise OSError("Не удалось получить access token")
+
+            headers = {'Authorization': f'Bearer {access_token}'}
+            with self._observe_request(method, url) as request_span:
+                response = await self.transport.request(method, url, headers=headers, **kwargs)
+                self._observe_response(request_span, url, response)
+
+            if response.status_code != 401:
+                break
+
+            logger.warning("Avito API вернул 401, обновляем access token")
+            self.token_manager.invalidate(access_token)
+
+        return response
+
+    def _slots(self) -> asyncio.Semaphore:
+        """Не больше max_in_flight одновременных запросов чатов (семафор создается на работающем loop)"""
+        if self._fetch_slots is None:
+            self._fetch_slots = asyncio.Semaphore(self.max_in_flight)
+        return self._fetch_slots
+
+    async def get_messages(self) -> List[AvitoMessage]:
+        """
+        Получение новых сообщений через API Avito
+
+        Returns:
+            List[AvitoMessage]: Список новых сообщений
+        """
+        if self.method != 'api':
+            logger.error(f"Асинхронный режим поддерживает только метод 'api' (указан '{self.method}')")
+            return []
+        return [message async for message in self.iter_new_messages()]
+
+    get_messages_via_api = get_messages
+
+    def iter_messages(self, auto_finish: bool = True) -> AsyncIterator[AvitoMessage]:
+        """Потоковое получение новых сообщений (только метод 'api')"""
+        return self.iter_new_messages(auto_finish)
+
+    async def iter_new_messages(self, auto_finish: bool = True) -> AsyncIterator[AvitoMessage]:
+        """
+        Потоковое получение новых сообщений: страница чатов загружается конкурентно,
+        сообщения отдаются в порядке списка чатов
+
+        Args:
+            auto_finish: См. AvitoClient.iter_new_messages
+
+        Yields:
+            AvitoMessage: Новое сообщение
+        """
+        if not self._has_credentials():
+            return
+
+        with span('avito.get_access_token'):
+            access_token = await self.get_access_token()
+        if not self._token_received(access_token):
+            return
+
+        try:
+            async for chats_page in self._iter_chat_pages():
+                chats = self._changed_chats(chats_page)
+                await self._lookup_ads(chats)
+                for chat, chat_messages in zip(chats, await self._fetch_chats_messages(chats)):
+                    for message in self._chat_new_messages(chat, chat_messages, auto_finish):
+                        yield message
+
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Ошибка API запроса к Avito: {e}")
+        finally:
+            self.save_user_cache()
+
+    async def _resolve_authors(self, chat_id: str, chat_messages: List[Dict]):
+        """Загрузка неизвестных авторов чата одним запросом чата (вместе с загрузкой его сообщений)"""
+        misses = self._author_misses(chat_messages)
+        if not misses:
+            return
+        try:
+            response = await self._api_request('GET', self._chat_url(chat_id))
+            response.raise_for_status()
+            self._remember_users(response.json().get('users'))
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить данные авторов чата {chat_id}: {e}")
+        for author_id in misses:
+            self._found_author(author_id)
+
+    async def _lookup_ads(self, chats: List[Dict]):
+        """Загрузка недостающих данных объявлений пакетами (пакеты запрашиваются одновременно)"""
+        misses = self._ad_misses(chats)
+        if not misses:
+            return
+        batches = self._ad_batches(misses)
+        payloads = await asyncio.gather(*(self._fetch_ads(batch) for batch in batches))
+        for batch, payload in zip(batches, payloads):
+            self._store_ads(batch, payload)
+        self._apply_ads(chats)
+
+    async def _fetch_ads(self, batch: List) -> Optional[Dict]:
+        try:
+            response = await self._api_request('GET', self._items_url(), params=self._items_params(batch))
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить данные объявлений: {e}")
+            return None
+
+    async def _iter_chat_pages(self) -> AsyncIterator[List[Dict]]:
+        offset = 0
+        while offset is not None:
+            response = await self._api_request('GET', self._chats_url(), params=self._chats_params(offset))
+            response.raise_for_status()
+            chats = response.json().get('chats', [])
+            if chats:
+                yield chats
+            offset = self._next_chats_offset(chats, offset)
+
+    async def _fetch_chats_messages(self, chats: List[Dict]) -> List[Optional[List[Dict]]]:
+        return list(await asyncio.gather(*(self._fetch_chat_messages(chat) for chat in chats)))
+
+    async def _fetch_chat_messages(self, chat: Dict) -> Optional[List[Dict]]:
+        """
+        Загрузка сообщений одного чата до сохраненной отметки (не больше max_in_flight чатов одновременно)
+
+        Returns:
+            Optional[List[Dict]]: Новые сообщения чата в формате API или None при ошибке
+        """
+        chat_id = chat.get('id')
+        pager = MessagePager(self.chat_watermarks.get(chat_id), self.messages_page_size)
+        try:
+            async with self._slots():
+                with span('avito.fetch_chat', chat_id=chat_id) as chat_span:
+                    while not pager.done:
+                        response = await self._api_request('GET', self._messages_url(chat_id),
+                                                           params=pager.params())
+                        response.raise_for_status()
+                        pager.add_page(response.json().get('messages', []))
+                    chat_span.set_attribute('messages', len(pager.messages))
+                    await self._resolve_authors(chat_id, pager.messages)
+            return pager.messages
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Ошибка получения сообщений чата {chat_id}: {e}")
+            return None
+
+    async def get_chat(self, chat_id: str) -> Optional[AvitoChat]:
+        """
+        Информация о чате (с кэшированием контекста объявления)
+
+        Args:
+            chat_id: ID чата
+
+        Returns:
+            Optional[AvitoChat]: Чат или None при ошибке
+        """
+        chat = self._chat_cache.get(chat_id)
+        if chat is not None:
+            return chat
+        try:
+            response = await self._api_request('GET', self._chat_url(chat_id))
+            response.raise_for_status()
+            return self._store_chat(chat_id, response.json())
+        except Exception as e:
+            logger.error(f"Ошибка получения информации о чате {chat_id}: {e}")
+            return None
+
+    def register_webhook(self, url: str) -> bool:
+        raise NotImplementedError("Webhook не поддерживается в асинхронном режиме")
+
+    def handle_webhook_message(self, value: Dict) -> Optional[AvitoMessage]:
+        raise NotImplementedError("Webhook не поддерживается в асинхронном режиме")
+
+    async def mark_message_as_read(self, message_id: str, chat_id: str) -> bool:
+        """
+        Отметить сообщение как прочитанное
+
+        Args:
+            message_id: ID сообщения
+            chat_id: ID чата
+
+        Returns:
+            bool: Успешность операции
+        """
+        if self.method != 'api' or not self.api_key or not self.user_id:
+            return False
+
+        try:
+            response = await self._api_request('POST', self._message_read_url(message_id, chat_id))
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка отметки сообщения как прочитанного: {e}")
+            return False
+
+    async def mark_chats_read(self, chat_ids: Iterable[str]) -> Dict[str, bool]:
+        """
+        Отметить чаты прочитанными: один запрос на чат, не больше max_in_flight одновременно
+
+        Args:
+            chat_ids: ID чатов (повторы отбрасываются)
+
+        Returns:
+            Dict[str, bool]: Успешность операции для каждого чата
+        """
+        chat_ids = list(dict.fromkeys(str(chat_id) for chat_id in chat_ids if chat_id))
+        if not chat_ids or self.method != 'api' or not self.api_key or not self.user_id:
+            return {}
+
+        with span('avito.mark_chats_read', chats=len(chat_ids)):
+            results = dict(zip(chat_ids, await asyncio.gather(*(self._mark_chat_read(c) for c in chat_ids))))
+        marked = sum(1 for ok in results.values() if ok)
+        logger.info(f"Отмечено прочитанными {marked} из {len(chat_ids)} чатов Avito")
+        return results
+
+    async def _mark_chat_read(self, chat_id: str) -> bool:
+        try:
+            async with self._slots():
+                response = await self._api_request('POST', self._chat_read_url(chat_id))
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Ошибка отметки чата {chat_id} как прочитанного: {e}")
+            return False
+
+    def close(self):
+        """Сохранение кэша авторов и закрытие хранилища сообщений (соединения закрывает владелец AsyncHttpClient)"""
+        self.save_user_cache(force=True)
+        self.processed_messages.close()
+
+
+class AsyncTelegramSender(TelegramBotApi):
+    """Отправка в Telegram корутинами: все получатели одновременно, сообщения в один чат - по очереди"""
+
+    def __init__(self, bot_token: str, chat_ids: List[str], http: AsyncHttpClient,
+                 parse_mode: str = 'HTML', api_url: str = 'https://api.telegram.org',
+                 rate_limiter: Optional[TelegramRateLimiter] = None, max_retries: int = 5):
+        """
+        Инициализация отправителя
+
+        Args:
+            bot_token: Токен бота
+            chat_ids: Список chat_id получателей
+            http: Общий асинхронный HTTP клиент
+            parse_mode: Режим разметки Telegram
+            api_url: Адрес Bot API
+            rate_limiter: Ограничитель частоты (по умолчанию лимиты Telegram: 30/с и 1/с на чат)
+            max_retries: Сколько раз повторять отправку после ответа 429
+        """
+        super().__init__(bot_token, chat_ids, parse_mode, api_url, rate_limiter, max_retries)
+        self.http = http
+        # asyncio.Lock обслуживает ожидающих по очереди, поэтому порядок сообщений в чате сохраняется
+        self._lanes: Dict[str, asyncio.Lock] = {}
+
+    async def send_to_chat(self, chat_id: str, text: str) -> SendResult:
+        """
+        Отправка сообщения в один чат (после предыдущих сообщений этого чата)
+
+        Args:
+            chat_id: ID чата Telegram
+            text: Текст сообщения
+
+        Returns:
+            SendResult: Результат отправки
+        """
+        chat_id = str(chat_id)
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            lane = self._lanes[chat_id] = asyncio.Lock()
+
+        async with lane:
+            with span('telegram.send', chat_id=chat_id, text_length=len(text)) as send_span:
+                result = await self._send_to_chat(chat_id, text)
+                send_span.set_attribute('http.status_code', result.status_code or 0)
+                send_span.set_attribute('ok', result.ok)
+            return result
+
+    async def _send_to_chat(self, chat_id: str, text: str) -> SendResult:
+        url = self._send_url()
+        data = self._send_data(chat_id, text)
+        try:
+            for attempt in range(self.max_retries + 1):
+                await self.rate_limiter.acquire_async(chat_id)
+                started = time.perf_counter()
+                response = await self.http.post(url, data=data)
+                metrics.TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started)
+                result = self._send_result(chat_id, response, attempt)
+                if result is not None:
+                    return result
+        except Exception as e:
+            return self._send_failed(chat_id, e)
+
+    async def send(self, text: str, chat_ids: Optional[List[str]] = None) -> DeliveryReport:
+        """
+        Отправка сообщения всем получателям одновременно
+
+        Args:
+            text: Текст сообщения
+            chat_ids: Получатели (по умолчанию все настроенные)
+
+        Returns:
+            DeliveryReport: Результаты по каждому chat_id
+        """
+        chat_ids = [str(chat_id) for chat_id in (chat_ids or self.chat_ids)]
+        results = await asyncio.gather(*(self.send_to_chat(chat_id, text) for chat_id in chat_ids))
+        return DeliveryReport(dict(zip(chat_ids, results)))
+
+    async def send_many(self, texts: List[str], chat_ids: Optional[List[str]] = None) -> List[DeliveryReport]:
+        """
+        Отправка нескольких сообщений: получатели обслуживаются параллельно, в каждый чат - в порядке texts
+
+        Args:
+            texts: Тексты сообщений
+            chat_ids: Получатели (по умолчанию все настроенные)
+
+        Returns:
+            List[DeliveryReport]: Результаты для каждого сообщения
+        """
+        return list(await asyncio.gather(*(self.send(text, chat_ids) for text in texts)))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Асинхронный HTTP клиент на httpx: пул keep-alive соединений, таймауты и повторы
+для асинхронного режима работы с Avito и Telegram (те же настройки, что у HttpTransport)
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from http_transport import DEFAULT_HTTP_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Ответ и ошибка кода ответа (raise_for_status) - типы httpx
+AsyncResponse = httpx.Response
+HttpStatusError = httpx.HTTPStatusError
+
+
+class AsyncHttpClient:
+    """
+    Общий httpx.AsyncClient для корутин: тысячи одновременных запросов в одном потоке
+
+    Прокси берутся из переменных окружения (HTTPS_PROXY и т.п.), сжатые ответы распаковываются httpx.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        Инициализация клиента
+
+        Args:
+            config: Секция "http" из config.json (те же ключи, что у HttpTransport)
+        """
+        self.config = {**DEFAULT_HTTP_CONFIG, **(config or {})}
+        self.pool_size = max(1, int(self.config['pool_size']))
+        self.retry_methods = frozenset(m.upper() for m in self.config['retry_methods'])
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.config['read_timeout'], connect=self.config['connect_timeout'],
+                                  pool=None),
+            # Свободные соединения держатся для двух хостов: Avito и Telegram
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=self.pool_size * 2)
+        )
+        # Не больше pool_size одновременных запросов к одному хосту, как у HttpTransport
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+
+    async def get(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> AsyncResponse:
+        return await self.request('POST', url, **kwargs)
+
+    async def request(self, method: str, url: str, **kwargs) -> AsyncResponse:
+        """
+        HTTP запрос с повторами при ошибках соединения и кодах из status_forcelist
+
+        Повторяются только идемпотентные методы из retry_methods (POST не повторяется,
+        как и в HttpTransport), заголовок Retry-After учитывается.
+
+        Args:
+            method: HTTP метод
+            url: Адрес запроса
+            **kwargs: Параметры httpx (params, data, json, headers)
+
+        Returns:
+            AsyncResponse: Ответ сервера
+
+        Raises:
+            httpx.TransportError: Если соединение не удалось после всех повторов
+        """
+        method = method.upper()
+        retries = self.config['retries'] if method in self.retry_methods else 0
+        slots = self._host_slots(url)
+        for attempt in range(retries + 1):
+            try:
+                async with slots:
+                    response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= retries:
+                    raise
+                logger.debug(f"Ошибка соединения {method} {url}: {e}, повтор")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            if response.status_code in self.config['status_forcelist'] and attempt < retries:
+                await asyncio.sleep(self._retry_delay(response, attempt))
+                continue
+            return response
+        return response
+
+    def _host_slots(self, url: str) -> asyncio.Semaphore:
+        parts = urlsplit(url)
+        key = f"{parts.scheme}://{parts.netloc}"
+        slots = self._slots.get(key)
+        if slots is None:
+            slots = self._slots[key] = asyncio.Semaphore(self.pool_size)
+        return slots
+
+    def _backoff(self, attempt: int) -> float:
+        return self.config['backoff_factor'] * (2 ** attempt)
+
+    def _retry_delay(self, response: AsyncResponse, attempt: int) -> float:
+        try:
+            return max(float(response.headers.get('retry-after')), 0.0)
+        except (TypeError, ValueError):
+            return self._backoff(attempt)
+
+    async def close(self):
+        """Закрытие всех соединений"""
+        await self.client.aclose()
@@ -7,136 +7,745 @@
 import requests
 import json
 import logging
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 from datetime import datetime
+import contextvars
+import threading
+from contextlib import contextmanager
 import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import metrics
+from tracing import span
+
+from avito_token import AvitoTokenManager
+from dedup_store import create_dedup_store
+from http_transport import HttpTransport
+from models import AdInfo, AvitoChat, AvitoMessage, AvitoUser
+from ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
 
+class MessagePager:
+    """
+    Постраничная загрузка сообщений чата до сохраненной отметки (limit/offset, новые первыми)
+
+    Только разбор страниц, без запросов: общий для AvitoClient и AsyncAvitoClient.
+    """
+
+    def __init__(self, watermark: Optional[Dict], page_size: int):
+        """
+        Args:
+            watermark: Отметка чата ({'last_id', 'last_created'}) или None - тогда загружается одна страница
+            page_size: Размер страницы
+        """
+        self.last_created = watermark.get('last_created', 0) if watermark else 0
+        self.last_id = watermark.get('last_id') if watermark else None
+        self.single_page = watermark is None
+        self.page_size = page_size
+        self.offset = 0
+        self.messages: List[Dict] = []
+        self.done = False
+
+    def params(self) -> Dict:
+        """Параметры запроса следующей страницы"""
+        return {'limit': self.page_size, 'offset': self.offset}
+
+    def add_page(self, page: List[Dict]):
+        """Сообщения страницы новее отметки; done - больше страниц не нужно"""
+        for message in page:
+            if message.get('id') == self.last_id or (message.get('created') or 0) < self.last_created:
+                self.done = True
+                return
+            self.messages.append(message)
+        if self.single_page or len(page) < self.page_size:
+            self.done = True
+        else:
+            self.offset += len(page)
+
+
 class AvitoClient:
     """Клиент для работы с Avito"""
     
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, transport: Optional[HttpTransport] = None):
         """
         Инициализация клиента
         
         Args:
             config: Конфигурация Avito
+            transport: Общий HTTP транспорт (если не передан, создается собственный)
         """
         self.config = config
         self.api_key = config.get('api_key')
         self.user_id = config.get('user_id')
         self.method = config.get('method', 'api')  # 'api' или 'scraping'
-        self.base_url = 'https://api.avito.ru'
-        self.processed_messages = set()  # Для отслеживания обработанных сообщений
+        self.base_url = config.get('base_url', 'https://api.avito.ru')
+        # 'sequential' - чаты по очереди, 'threads' - параллельно в пуле потоков
+        self.fetch_engine = config.get('fetch_engine', 'threads')
+        self.max_in_flight = max(1, int(config.get('max_in_flight', 8)))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Для отслеживания обработанных сообщений (ограниченное, при желании постоянное хранилище)
+        self.processed_messages = create_dedup_store(config.get('dedup', {}))
+        # Отметки последней активности чатов: chat_id -> {'activity', 'last_id', 'last_created'}
+        self.chat_watermarks: Dict[str, Dict] = {}
+        # Контекст чатов (объявление) для сообщений, пришедших через webhook
+        self._chat_cache: Dict[str, AvitoChat] = {}
+        # Данные объявлений по ID: из контекста чатов, недостающие - пакетными запросами списка объявлений
+        ad_cache_config = config.get('ad_cache', {})
+        self.ad_cache: Optional[TTLCache[AdInfo]] = None
+        if ad_cache_config.get('enabled', True):
+            self.ad_cache = TTLCache(max_size=ad_cache_config.get('max_size', 10000),
+                                     ttl=ad_cache_config.get('ttl', 3600))
+        self.ad_lookup = bool(ad_cache_config.get('lookup', True))
+        self.ad_lookup_batch = max(1, int(ad_cache_config.get('batch_size', 100)))
+        # Имена и профили авторов по ID: из поля users чатов, неизвестные - запросом чата;
+        # кэш можно сохранять между перезапусками (user_cache.file)
+        user_cache_config = config.get('user_cache', {})
+        self.user_cache: Optional[TTLCache[AvitoUser]] = None
+        self.user_cache_file = user_cache_config.get('file')
+        if user_cache_config.get('enabled', True):
+            self.user_cache = TTLCache(max_size=user_cache_config.get('max_size', 50000),
+                                       ttl=user_cache_config.get('ttl', 86400))
+            if self.user_cache_file:
+                loaded = self.user_cache.load(self.user_cache_file, lambda value: AvitoUser(*value))
+                if loaded:
+                    logger.info(f"Загружено авторов из кэша {self.user_cache_file}: {loaded}")
+        self.user_lookup = bool(user_cache_config.get('lookup', True))
+        self.user_cache_save_interval = float(user_cache_config.get('save_interval', 300))
+        self._users_changed = False
+        self._users_saved_at = time.monotonic()
+        # Проверка и резервирование ID сообщения - одним шагом под общей блокировкой для опроса и webhook;
+        # в processed_messages ID попадает только после того, как сообщение принято к доставке
+        self._dedup_lock = threading.Lock()
+        self._reserved_messages = set()
+        # Загруженные, но еще не принятые сообщения чатов: отметка чата не обгоняет первое из них
+        # (chat_id -> {'activity', 'messages', 'unsettled'}, message_id -> chat_id)
+        self._pending_chats: Dict[str, Dict] = {}
+        self._pending_messages: Dict = {}
+        # Счетчики запросов к API и ошибок (для планировщика опроса)
+        self.stats = {'requests': 0, 'errors': 0}
+        self._stats_lock = threading.Lock()
+        self.messages_page_size = int(config.get('messages_page_size', 100))
+        self.chats_page_size = int(config.get('chats_page_size', 100))
+        self.unread_only = bool(config.get('unread_only', False))
+        self.transport = transport or HttpTransport()
+        self.token_manager = AvitoTokenManager(
+            client_id=self.user_id,
+            client_secret=self.api_key,
+            token_url=f'{self.base_url}/token',
+            refresh_margin=config.get('token_refresh_margin', 60),
+            cache_file=config.get('token_cache_file'),
+            http=self.transport
+        )
         
     def get_access_token(self) -> Optional[str]:
         """
-        Получение access token через OAuth 2.0
+        Получение access token через OAuth 2.0 (с кэшированием до истечения срока)
         
         Returns:
             Optional[str]: Access token или None при ошибке
         """
-        try:
-            auth_url = 'https://api.avito.ru/token'
+        return self.token_manager.get_token()
+
+    def get_token_stats(self) -> Dict:
+        """
+        Статистика запросов токена: fetches - обращения к /token, cache_hits - попадания в кэш
+        
+        Returns:
+            Dict: Счетчики менеджера токенов
+        """
+        return self.token_manager.get_stats()
+
+    def _api_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Авторизованный запрос к API Avito с однократным повтором при 401
+        
+        Args:
+            method: HTTP метод
+            url: Адрес запроса
+            **kwargs: Дополнительные параметры requests
+            
+        Returns:
+            requests.Response: Ответ API
             
-            data = {
-                'grant_type': 'client_credentials',
-                'client_id': self.user_id,
-                'client_secret': self.api_key
+        Raises:
+            requests.RequestException: Если токен не получен или запрос не удался
+        """
+        response = None
+        for attempt in range(2):
+            access_token = self.get_access_token()
+            if not access_token:
+                raise requests.RequestException("Не удалось получить access token")
+            
+            headers = {
+                'Authorization': f'Bearer {access_token}',
+                'Content-Type': 'application/json'
             }
+            with self._observe_request(method, url) as request_span:
+                response = self.transport.request(method, url, headers=headers, **kwargs)
+                self._observe_response(request_span, url, response)
             
-            response = requests.post(auth_url, data=data)
+            if response.status_code != 401:
+                break
             
-            if response.status_code == 200:
-                token_data = response.json()
-                return token_data.get('access_token')
-            else:
-                logger.error(f"Ошибка получения токена: {response.status_code}, {response.text}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Ошибка при получении токена: {e}")
-            return None
+            # Токен отозван или истек раньше срока - сбрасываем и пробуем еще раз
+            logger.warning("Avito API вернул 401, обновляем access token")
+            self.token_manager.invalidate(access_token)
+        
+        return response
+
+    @contextmanager
+    def _observe_request(self, method: str, url: str):
+        """
+        Счетчик запросов, span трассировки и время запроса к API (общие для sync и async)
+        
+        Yields:
+            Span: Span запроса (ответ записывается через _observe_response)
+        """
+        self._count('requests')
+        endpoint = self._endpoint_name(url)
+        with span(f'avito.{endpoint}', **{'http.method': method}) as request_span, \
+                metrics.AVITO_REQUEST_SECONDS.time(endpoint=endpoint):
+            try:
+                yield request_span
+            except Exception:
+                metrics.AVITO_REQUESTS.inc(endpoint=endpoint, status='error')
+                raise
+
+    def _observe_response(self, request_span, url: str, response):
+        """Код и размер ответа в span и метрике запросов"""
+        request_span.set_attribute('http.status_code', response.status_code)
+        request_span.set_attribute('http.response_content_length', len(response.content))
+        metrics.AVITO_REQUESTS.inc(endpoint=self._endpoint_name(url), status=response.status_code)
+
+    @staticmethod
+    def _endpoint_name(url: str) -> str:
+        """Вид запроса к API для меток метрик (без ID чатов и сообщений)"""
+        path = urlsplit(url).path.rstrip('/')
+        if path.endswith('/read'):
+            return 'read'
+        if path.endswith('/messages'):
+            return 'messages'
+        if path.endswith('/chats'):
+            return 'chats'
+        if '/chats/' in path:
+            return 'chat'
+        if path.endswith('/webhook'):
+            return 'webhook'
+        if path.endswith('/items'):
+            return 'items'
+        return 'other'
+
+    def _count(self, name: str, value: int = 1):
+        """Увеличение счетчика статистики"""
+        with self._stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + value
+
+    def get_stats(self) -> Dict:
+        """
+        Статистика клиента: запросы к API, ошибки и работа кэша токена
+        
+        Returns:
+            Dict: Счетчики
+        """
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['token'] = self.get_token_stats()
+        return stats
 
-    def get_messages_via_api(self) -> List[Dict]:
+    def get_messages_via_api(self) -> List[AvitoMessage]:
         """
         Получение сообщений через официальный API Avito
         
         Returns:
-            List[Dict]: Список сообщений
+            List[AvitoMessage]: Список сообщений
         """
-        messages = []
+        return list(self.iter_new_messages())
+
+    def iter_new_messages(self, auto_finish: bool = True) -> Iterator[AvitoMessage]:
+        """
+        Потоковое получение новых сообщений через API Avito
         
-        if not self.api_key or not self.user_id:
-            logger.error("Client ID или Client Secret не настроены")
-            return messages
+        Список чатов читается страницами (limit/offset), сообщения отдаются по мере загрузки,
+        поэтому обработка первых сообщений начинается до загрузки следующих страниц.
+        
+        Args:
+            auto_finish: Отмечать сообщение принятым, когда получатель запросил следующее;
+                False - получатель сам вызывает finish_message для каждого полученного сообщения
+        
+        Yields:
+            AvitoMessage: Новое сообщение
+        """
+        if not self._has_credentials():
+            return
         
         # Получаем access token
-        access_token = self.get_access_token()
-        if not access_token:
-            logger.error("Не удалось получить access token")
-            return messages
+        with span('avito.get_access_token'):
+            access_token = self.get_access_token()
+        if not self._token_received(access_token):
+            return
             
         try:
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Получаем список чатов
-            chats_url = f'{self.base_url}/messenger/v1/accounts/{self.user_id}/chats'
-            response = requests.get(chats_url, headers=headers)
-            response.raise_for_status()
-            
-            chats_data = response.json()
-            
-            # Обрабатываем каждый чат
-            for chat in chats_data.get('chats', []):
-                chat_id = chat.get('id')
-                if not chat_id:
-                    continue
-                    
-                # Получаем сообщения из чата
-                messages_url = f'{self.base_url}/messenger/v1/accounts/{self.user_id}/chats/{chat_id}/messages'
-                messages_response = requests.get(messages_url, headers=headers)
-                messages_response.raise_for_status()
+            for chats_page in self._iter_chat_pages():
+                chats = self._changed_chats(chats_page)
+                # Объявления без данных в контексте - одним запросом на страницу
+                self._lookup_ads(chats)
                 
-                messages_data = messages_response.json()
-                
-                # Обрабатываем новые сообщения
-                for message in messages_data.get('messages', []):
-                    message_id = message.get('id')
-                    
-                    # Пропускаем уже обработанные сообщения
-                    if message_id in self.processed_messages:
-                        continue
-                        
-                    # Пропускаем свои сообщения
-                    if message.get('author_id') == self.user_id:
-                        continue
-                        
-                    processed_message = {
-                        'id': message_id,
-                        'text': message.get('content', {}).get('text', ''),
-                        'sender': message.get('author_id'),
-                        'timestamp': message.get('created'),
-                        'chat_id': chat_id,
-                        'ad_title': chat.get('context', {}).get('value', {}).get('title', 'Неизвестно'),
-                        'ad_url': chat.get('context', {}).get('value', {}).get('url', '')
-                    }
-                    
-                    messages.append(processed_message)
-                    self.processed_messages.add(message_id)
+                # Загружаем сообщения чатов (результаты идут в порядке списка чатов)
+                for chat, chat_messages in zip(chats, self._fetch_chats_messages(chats)):
+                    yield from self._chat_new_messages(chat, chat_messages, auto_finish)
                     
         except requests.RequestException as e:
+            self._count('errors')
             logger.error(f"Ошибка API запроса к Avito: {e}")
         except Exception as e:
+            self._count('errors')
             logger.error(f"Неожиданная ошибка при получении сообщений через API: {e}")
+        finally:
+            self.save_user_cache()
+
+    def _has_credentials(self) -> bool:
+        if not self.api_key or not self.user_id:
+            logger.error("Client ID или Client Secret не настроены")
+            return False
+        return True
+
+    def _token_received(self, access_token: Optional[str]) -> bool:
+        if not access_token:
+            self._count('errors')
+            logger.error("Не удалось получить access token")
+            return False
+        return True
+
+    def _changed_chats(self, chats_page: List[Dict]) -> List[Dict]:
+        """
+        Модели чатов страницы (с участниками в кэше авторов) и чаты, в которых была активность
+        
+        Общая часть sync и async режимов, без запросов к API.
+        
+        Args:
+            chats_page: Страница списка чатов
             
-        return messages
+        Returns:
+            List[Dict]: Чаты, сообщения которых нужно загрузить
+        """
+        for chat in chats_page:
+            if chat.get('id'):
+                # Одна модель чата на все его сообщения: данные объявления не копируются
+                self._chat_cache[chat['id']] = self._chat_model(chat)
+                self._remember_users(chat.get('users'))
+        # Пропускаем чаты, в которых ничего не изменилось с прошлой проверки
+        return [chat for chat in chats_page if chat.get('id') and self._chat_changed(chat)]
+
+    def _chat_new_messages(self, chat: Dict, chat_messages: Optional[List[Dict]],
+                           auto_finish: bool = True) -> Iterator[AvitoMessage]:
+        """
+        Новые сообщения загруженного чата без своих и уже обработанных (общая часть sync и async режимов)
+        
+        Args:
+            chat: Чат из ответа /chats
+            chat_messages: Загруженные сообщения чата или None при ошибке загрузки
+            auto_finish: Отмечать сообщение принятым, когда получатель запросил следующее
+            
+        Yields:
+            AvitoMessage: Новое сообщение
+        """
+        if chat_messages is None:
+            # Ошибка загрузки - отметку не двигаем, чат будет запрошен снова
+            return
+        self._track_chat(chat, chat_messages)
+        chat_model = self._chat_cache[chat.get('id')]
+        
+        for message in chat_messages:
+            message_id = message.get('id')
+            
+            # Пропускаем свои сообщения
+            if message.get('author_id') == self.user_id:
+                continue
+            
+            # Пропускаем уже обработанные и пересылаемые сейчас (например, через webhook)
+            if not self.reserve_message(message_id):
+                continue
+            
+            try:
+                avito_message = AvitoMessage.from_api(message, chat_model,
+                                                      self._message_author(message.get('author_id')))
+            except Exception:
+                self.finish_message(message_id, False)
+                raise
+            if not auto_finish:
+                # Получатель сам отмечает сообщение через finish_message
+                yield avito_message
+                continue
+            
+            accepted = False
+            try:
+                yield avito_message
+                accepted = True
+            finally:
+                # Отмечаем после того, как получатель принял сообщение (доставка не менее одного раза)
+                self.finish_message(message_id, accepted)
+
+    def _chat_model(self, chat: Dict) -> AvitoChat:
+        """
+        Модель чата с данными объявления
+        
+        Данные из контекста чата записываются в кэш объявлений, при их отсутствии берутся из кэша.
+        
+        Args:
+            chat: Чат в формате API
+            
+        Returns:
+            AvitoChat: Чат
+        """
+        model = AvitoChat.from_api(chat)
+        if self.ad_cache is None or model.ad_id is None:
+            return model
+        value = (chat.get('context') or {}).get('value') or {}
+        if value.get('title'):
+            ad = AdInfo.from_api(value)
+            self.ad_cache.set(model.ad_id, ad)
+            return model.with_ad(ad)
+        ad = self.ad_cache.get(model.ad_id)
+        return model.with_ad(ad) if ad is not None else model
+
+    def _ad_misses(self, chats: List[Dict]) -> List:
+        """ID объявлений чатов, данных о которых нет ни в контексте, ни в кэше"""
+        if self.ad_cache is None or not self.ad_lookup:
+            return []
+        misses = []
+        for chat in chats:
+            model = self._chat_cache.get(chat.get('id'))
+            if model is not None and model.ad_id is not None and model.ad_id not in self.ad_cache:
+                misses.append(model.ad_id)
+        return list(dict.fromkeys(misses))
+
+    def _items_url(self) -> str:
+        return f'{self.base_url}/core/v1/accounts/{self.user_id}/items'
+
+    def _store_ads(self, ad_ids: List, payload: Optional[Dict]):
+        """
+        Запись результата пакетного запроса в кэш объявлений
+        
+        Объявления, которых нет в ответе (или при ошибке запроса), кэшируются пустыми,
+        чтобы не запрашивать их в каждом цикле.
+        
+        Args:
+            ad_ids: Запрошенные ID объявлений
+            payload: Ответ /core/v1/accounts/{user_id}/items или None при ошибке
+        """
+        wanted = {str(ad_id): ad_id for ad_id in ad_ids}
+        for item in (payload or {}).get('resources') or (payload or {}).get('items') or []:
+            key = wanted.pop(str(item.get('id')), None)
+            if key is not None:
+                self.ad_cache.set(key, AdInfo.from_api(item))
+        empty_ttl = self.ad_cache.ttl if payload is not None else min(self.ad_cache.ttl or 300, 300)
+        for key in wanted.values():
+            self.ad_cache.set(key, AdInfo(key), ttl=empty_ttl)
+
+    def _apply_ads(self, chats: List[Dict]):
+        """Обновление моделей чатов данными из кэша объявлений"""
+        for chat in chats:
+            model = self._chat_cache.get(chat.get('id'))
+            if model is None or model.ad_id is None:
+                continue
+            ad = self.ad_cache.get(model.ad_id)
+            if ad is not None:
+                self._chat_cache[model.id] = model.with_ad(ad)
+
+    def _lookup_ads(self, chats: List[Dict]):
+        """
+        Загрузка недостающих данных объявлений пакетами по ad_cache.batch_size
+        
+        Args:
+            chats: Чаты, сообщения которых будут загружены
+        """
+        misses = self._ad_misses(chats)
+        if not misses:
+            return
+        for batch in self._ad_batches(misses):
+            payload = None
+            try:
+                response = self._api_request('GET', self._items_url(), params=self._items_params(batch))
+                response.raise_for_status()
+                payload = response.json()
+            except Exception as e:
+                logger.warning(f"Не удалось загрузить данные объявлений: {e}")
+            self._store_ads(batch, payload)
+        self._apply_ads(chats)
+
+    def _ad_batches(self, misses: List) -> List[List]:
+        """Пакеты ID объявлений по ad_cache.batch_size"""
+        return [misses[start:start + self.ad_lookup_batch] for start in range(0, len(misses), self.ad_lookup_batch)]
+
+    @staticmethod
+    def _items_params(batch: List) -> Dict:
+        return {'ids': ','.join(str(ad_id) for ad_id in batch)}
+
+    def _remember_users(self, users: Optional[List[Dict]]):
+        """Запись участников чата (поле users) в кэш авторов; неизменившиеся записи не трогаются"""
+        if self.user_cache is None or not users:
+            return
+        for user in users:
+            user_id = user.get('id')
+            if user_id is None or user_id == self.user_id:
+                continue
+            model = AvitoUser.from_api(user)
+            if self.user_cache.peek(user_id) != model:
+                self.user_cache.set(user_id, model)
+                self._users_changed = True
+
+    def _author_misses(self, chat_messages: List[Dict]) -> List:
+        """ID авторов сообщений чата (кроме своих), которых нет в кэше авторов"""
+        if self.user_cache is None or not self.user_lookup:
+            return []
+        misses = [message.get('author_id') for message in chat_messages
+                  if message.get('author_id') is not None and message.get('author_id') != self.user_id
+                  and message.get('author_id') not in self.user_cache]
+        return list(dict.fromkeys(misses))
+
+    def _resolve_authors(self, chat_id: str, chat_messages: List[Dict]):
+        """
+        Загрузка неизвестных авторов чата одним запросом чата (его поле users)
+
+        Вызывается вместе с загрузкой сообщений чата в пуле потоков, поэтому при холодном кэше
+        запросы разных чатов идут параллельно, а не по одному в цикле обработки сообщений.
+
+        Args:
+            chat_id: ID чата
+            chat_messages: Новые сообщения чата в формате API
+        """
+        misses = self._author_misses(chat_messages)
+        if not misses:
+            return
+        try:
+            response = self._api_request('GET', self._chat_url(chat_id))
+            response.raise_for_status()
+            self._remember_users(response.json().get('users'))
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить данные авторов чата {chat_id}: {e}")
+        for author_id in misses:
+            self._found_author(author_id)
+
+    def _message_author(self, author_id) -> Optional[AvitoUser]:
+        """
+        Автор сообщения из кэша (неизвестные авторы запрошены заранее в _resolve_authors)
+        
+        Args:
+            author_id: ID автора
+            
+        Returns:
+            Optional[AvitoUser]: Автор или None, если кэш авторов выключен
+        """
+        if self.user_cache is None or author_id is None:
+            return None
+        return self.user_cache.get(author_id)
+
+    def _found_author(self, author_id) -> AvitoUser:
+        """Автор после запроса чата; не найденный кэшируется без имени, чтобы не запрашивать его снова"""
+        author = self.user_cache.peek(author_id)
+        if author is None:
+            author = AvitoUser(author_id)
+            self.user_cache.set(author_id, author, ttl=min(self.user_cache.ttl or 300, 300))
+        return author
+
+    def save_user_cache(self, force: bool = False):
+        """
+        Сохранение кэша авторов в user_cache.file (не чаще user_cache.save_interval, если не force)
+        
+        Args:
+            force: Сохранить сразу, если кэш изменился
+        """
+        if self.user_cache is None or not self.user_cache_file or not self._users_changed:
+            return
+        if not force and time.monotonic() - self._users_saved_at < self.user_cache_save_interval:
+            return
+        self._users_changed = False
+        self._users_saved_at = time.monotonic()
+        self.user_cache.save(self.user_cache_file)
+
+    def _chat_url(self, chat_id: str) -> str:
+        return f'{self.base_url}/messenger/v2/accounts/{self.user_id}/chats/{chat_id}'
+
+    def _iter_chat_pages(self) -> Iterator[List[Dict]]:
+        """
+        Постраничное чтение списка чатов
+        
+        Yields:
+            List[Dict]: Очередная страница чатов
+        """
+        offset = 0
+        while offset is not None:
+            response = self._api_request('GET', self._chats_url(), params=self._chats_params(offset))
+            response.raise_for_status()
+            chats = response.json().get('chats', [])
+            if chats:
+                yield chats
+            offset = self._next_chats_offset(chats, offset)
+
+    def _chats_url(self) -> str:
+        return f'{self.base_url}/messenger/v1/accounts/{self.user_id}/chats'
+
+    def _chats_params(self, offset: int) -> Dict:
+        params = {'limit': self.chats_page_size, 'offset': offset}
+        if self.unread_only:
+            params['unread_only'] = 'true'
+        return params
+
+    def _next_chats_offset(self, chats: List[Dict], offset: int) -> Optional[int]:
+        """Смещение следующей страницы чатов или None, если страница последняя"""
+        if len(chats) < self.chats_page_size:
+            return None
+        return offset + len(chats)
+
+    def _chat_read_url(self, chat_id: str) -> str:
+        return f'{self.base_url}/messenger/v1/accounts/{self.user_id}/chats/{chat_id}/read'
+
+    def _message_read_url(self, message_id: str, chat_id: str) -> str:
+        return f'{self.base_url}/messenger/v1/accounts/{self.user_id}/chats/{chat_id}/messages/{message_id}/read'
+
+    def _messages_url(self, chat_id: str) -> str:
+        return f'{self.base_url}/messenger/v1/accounts/{self.user_id}/chats/{chat_id}/messages'
     
+    @staticmethod
+    def _chat_activity(chat: Dict):
+        """Отметка последней активности чата из ответа /chats"""
+        last_message = chat.get('last_message') or {}
+        return chat.get('updated') or last_message.get('created') or last_message.get('id')
+
+    def _chat_changed(self, chat: Dict) -> bool:
+        """
+        Проверка, была ли активность в чате с прошлой проверки
+        
+        Args:
+            chat: Чат из ответа /chats
+            
+        Returns:
+            bool: True, если чат нужно загрузить
+        """
+        watermark = self.chat_watermarks.get(chat.get('id'))
+        activity = self._chat_activity(chat)
+        if watermark is None or activity is None:
+            return True
+        return activity != watermark.get('activity')
+
+    def _track_chat(self, chat: Dict, chat_messages: List[Dict]):
+        """
+        Запоминание загруженных сообщений чата для отметки
+        
+        Свои и уже обработанные сообщения приняты сразу, остальные - после finish_message(id, True).
+        Отметка двигается только по принятым сообщениям (от старых к новым, до первого непринятого),
+        активность чата - когда приняты все: иначе непринятое сообщение загружается снова.
+        
+        Args:
+            chat: Чат из ответа /chats
+            chat_messages: Загруженные сообщения чата (новые первыми)
+        """
+        chat_id = chat.get('id')
+        with self._dedup_lock:
+            previous = self._pending_chats.pop(chat_id, None)
+            if previous:
+                for message_id in previous['unsettled']:
+                    self._pending_messages.pop(message_id, None)
+            unsettled = set()
+            for message in chat_messages:
+                message_id = message.get('id')
+                if (message_id is None or message.get('author_id') == self.user_id
+                        or message_id in self.processed_messages):
+                    continue
+                unsettled.add(message_id)
+                self._pending_messages[message_id] = chat_id
+            self._pending_chats[chat_id] = {
+                'activity': self._chat_activity(chat),
+                'messages': [(message.get('id'), message.get('created') or 0) for message in chat_messages],
+                'unsettled': unsettled
+            }
+            self._advance_watermark(chat_id)
+
+    def _advance_watermark(self, chat_id: str):
+        """Сдвиг отметки чата по принятым сообщениям (вызывается под _dedup_lock)"""
+        pending = self._pending_chats[chat_id]
+        messages = pending['messages']
+        watermark = dict(self.chat_watermarks.get(chat_id) or {})
+        while messages and messages[-1][0] not in pending['unsettled']:
+            message_id, created = messages.pop()
+            if created >= watermark.get('last_created', 0):
+                watermark['last_created'] = created
+                watermark['last_id'] = message_id
+        if not messages:
+            watermark['activity'] = pending['activity']
+            del self._pending_chats[chat_id]
+        if watermark:
+            # Новый словарь целиком: потоки загрузки читают отметки без блокировки
+            self.chat_watermarks[chat_id] = watermark
+
+    def _fetch_chat_messages(self, chat: Dict) -> Optional[List[Dict]]:
+        """
+        Загрузка сообщений одного чата, более новых чем сохраненная отметка
+        
+        Сообщения запрашиваются страницами (limit/offset, новые первыми) до тех пор,
+        пока не встретится уже известное сообщение. Без отметки загружается одна страница.
+        Неизвестные авторы загружаются тут же, одним запросом чата.
+        
+        Args:
+            chat: Чат из ответа /chats
+            
+        Returns:
+            Optional[List[Dict]]: Новые сообщения чата в формате API или None при ошибке
+        """
+        chat_id = chat.get('id')
+        pager = MessagePager(self.chat_watermarks.get(chat_id), self.messages_page_size)
+        try:
+            with span('avito.fetch_chat', chat_id=chat_id) as chat_span:
+                while not pager.done:
+                    response = self._api_request('GET', self._messages_url(chat_id), params=pager.params())
+                    response.raise_for_status()
+                    pager.add_page(response.json().get('messages', []))
+                chat_span.set_attribute('messages', len(pager.messages))
+                self._resolve_authors(chat_id, pager.messages)
+            return pager.messages
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Ошибка получения сообщений чата {chat_id}: {e}")
+            return None
+
+    def _fetch_chats_messages(self, chats: List[Dict]) -> List[Optional[List[Dict]]]:
+        """
+        Загрузка сообщений нескольких чатов с ограничением числа одновременных запросов
+        
+        Args:
+            chats: Список чатов
+            
+        Returns:
+            List[Optional[List[Dict]]]: Сообщения каждого чата в том же порядке, что и chats
+        """
+        return self._map_chats(self._fetch_chat_messages, chats)
+
+    def _map_chats(self, func, items: List) -> List:
+        """Вызов func для каждого элемента в пуле потоков (не больше max_in_flight одновременно)"""
+        if self.fetch_engine == 'sequential' or self.max_in_flight == 1 or len(items) < 2:
+            return [func(item) for item in items]
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_in_flight,
+                thread_name_prefix='avito-fetch'
+            )
+        # map сохраняет порядок результатов независимо от порядка завершения.
+        # Контекст (текущий span трассировки) передается в потоки пула
+        contexts = [contextvars.copy_context() for _ in items]
+        return list(self._executor.map(lambda context, item: context.run(func, item), contexts, items))
+
+    def close(self):
+        """Остановка пула потоков загрузки, сохранение кэша авторов и закрытие хранилища обработанных сообщений"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.save_user_cache(force=True)
+        self.processed_messages.close()
+
     def get_messages_via_scraping(self) -> List[Dict]:
         """
         Получение сообщений через веб-скрапинг (упрощенная версия без Selenium)
@@ -149,12 +758,12 @@ class AvitoClient:
         logger.info("Для работы через API настройте 'method': 'api' в config.json")
         return messages
     
-    def get_messages(self) -> List[Dict]:
+    def get_messages(self) -> List[AvitoMessage]:
         """
         Получение сообщений (выбирает метод в зависимости от конфигурации)
         
         Returns:
-            List[Dict]: Список новых сообщений
+            List[AvitoMessage]: Список новых сообщений
         """
         if self.method == 'api':
             return self.get_messages_via_api()
@@ -167,33 +776,168 @@ class AvitoClient:
             logger.error(f"Неизвестный метод получения сообщений: {self.method}")
             return []
     
-    def mark_message_as_read(self, message_id: str, chat_id: str) -> bool:
+    def iter_messages(self, auto_finish: bool = True) -> Iterator[AvitoMessage]:
         """
-        Отметить сообщение как прочитанное
+        Потоковое получение новых сообщений (выбирает метод в зависимости от конфигурации)
+        
+        Args:
+            auto_finish: См. iter_new_messages
+        
+        Yields:
+            AvitoMessage: Новое сообщение
+        """
+        if self.method == 'api':
+            yield from self.iter_new_messages(auto_finish)
+        else:
+            yield from self.get_messages()
+    
+    def get_chat(self, chat_id: str) -> Optional[AvitoChat]:
+        """
+        Информация о чате (с кэшированием контекста объявления)
         
         Args:
-            message_id: ID сообщения
             chat_id: ID чата
             
+        Returns:
+            Optional[AvitoChat]: Чат или None при ошибке
+        """
+        chat = self._chat_cache.get(chat_id)
+        if chat is not None:
+            return chat
+        
+        try:
+            response = self._api_request('GET', self._chat_url(chat_id))
+            response.raise_for_status()
+            return self._store_chat(chat_id, response.json())
+        except Exception as e:
+            logger.error(f"Ошибка получения информации о чате {chat_id}: {e}")
+            return None
+
+    def _store_chat(self, chat_id: str, data: Dict) -> AvitoChat:
+        """Модель чата из ответа /chats/{chat_id} в кэше чатов; участники - в кэше авторов"""
+        chat = self._chat_model({'id': chat_id, 'context': data.get('context')})
+        self._remember_users(data.get('users'))
+        self._chat_cache[chat_id] = chat
+        return chat
+
+    def register_webhook(self, url: str) -> bool:
+        """
+        Подписка на уведомления о новых сообщениях (webhook Avito Messenger)
+        
+        Args:
+            url: Публичный адрес, на который Avito будет отправлять уведомления
+            
         Returns:
             bool: Успешность операции
         """
         if self.method != 'api' or not self.api_key or not self.user_id:
             return False
         
-        # Получаем access token
-        access_token = self.get_access_token()
-        if not access_token:
+        try:
+            response = self._api_request('POST', f'{self.base_url}/messenger/v3/webhook', json={'url': url})
+            response.raise_for_status()
+            logger.info(f"Webhook Avito зарегистрирован: {url}")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка регистрации webhook Avito: {e}")
             return False
+
+    def handle_webhook_message(self, value: Dict) -> Optional[AvitoMessage]:
+        """
+        Обработка сообщения из webhook: отсев дубликатов и своих сообщений, приведение к формату
+        
+        Возвращенное сообщение зарезервировано: после доставки вызывающий код отмечает его
+        через finish_message.
+        
+        Args:
+            value: Поле payload.value уведомления Avito
             
+        Returns:
+            Optional[AvitoMessage]: Новое сообщение или None, если его не нужно пересылать
+        """
+        message_id = value.get('id')
+        chat_id = value.get('chat_id')
+        if not message_id or not chat_id:
+            return None
+        
+        # Свои сообщения: автор совпадает с владельцем аккаунта
+        author_id = value.get('author_id')
+        if author_id == self.user_id or (author_id is not None and author_id == value.get('user_id')):
+            return None
+        
+        if not self.reserve_message(message_id):
+            return None
+        
         try:
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            }
+            chat = self.get_chat(chat_id)
+            if chat is None:
+                chat = AvitoChat(chat_id)
+            else:
+                self._lookup_ads([{'id': chat_id}])
+                chat = self._chat_cache.get(chat_id, chat)
+            self._resolve_authors(chat_id, [value])
+            return AvitoMessage.from_api(value, chat, self._message_author(author_id))
+        except Exception:
+            self.finish_message(message_id, False)
+            raise
+
+    def reserve_message(self, message_id) -> bool:
+        """
+        Проверка и резервирование сообщения одним шагом
+        
+        Args:
+            message_id: ID сообщения
             
-            url = f'{self.base_url}/messenger/v1/accounts/{self.user_id}/chats/{chat_id}/messages/{message_id}/read'
-            response = requests.post(url, headers=headers)
+        Returns:
+            bool: True, если сообщение новое и еще никем не пересылается (его нужно завершить finish_message)
+        """
+        with self._dedup_lock:
+            if message_id in self._reserved_messages or message_id in self.processed_messages:
+                return False
+            # Общее хранилище: сообщение может пересылать другой экземпляр (например, после смены аренды)
+            if not self.processed_messages.claim(message_id):
+                return False
+            self._reserved_messages.add(message_id)
+            return True
+
+    def finish_message(self, message_id, accepted: bool):
+        """
+        Снятие резерва: принятое к доставке сообщение отмечается обработанным,
+        непринятое будет получено снова при следующей проверке
+        
+        Args:
+            message_id: ID сообщения
+            accepted: Сообщение отправлено или поставлено в очередь уведомлений
+        """
+        with self._dedup_lock:
+            self._reserved_messages.discard(message_id)
+            if not accepted:
+                self.processed_messages.release(message_id)
+                return
+            # Захват снимается после отметки: между ними ID не достанется другому экземпляру
+            self.processed_messages.add(message_id)
+            self.processed_messages.release(message_id)
+            chat_id = self._pending_messages.pop(message_id, None)
+            if chat_id is not None:
+                self._pending_chats[chat_id]['unsettled'].discard(message_id)
+                self._advance_watermark(chat_id)
+
+    def mark_message_as_read(self, message_id: str, chat_id: str) -> bool:
+        """
+        Отметить сообщение как прочитанное
+        
+        Args:
+            message_id: ID сообщения
+            chat_id: ID чата
+            
+        Returns:
+            bool: Успешность операции
+        """
+        if self.method != 'api' or not self.api_key or not self.user_id:
+            return False
+        
+        try:
+            response = self._api_request('POST', self._message_read_url(message_id, chat_id))
             response.raise_for_status()
             
             return True
@@ -201,3 +945,36 @@ class AvitoClient:
         except Exception as e:
             logger.error(f"Ошибка отметки сообщения как прочитанного: {e}")
             return False
+
+    def mark_chats_read(self, chat_ids: Iterable[str]) -> Dict[str, bool]:
+        """
+        Отметить чаты прочитанными: один запрос на чат вместо запроса на каждое сообщение
+        
+        Запросы выполняются параллельно (не больше max_in_flight одновременно).
+        
+        Args:
+            chat_ids: ID чатов (повторы отбрасываются)
+            
+        Returns:
+            Dict[str, bool]: Успешность операции для каждого чата
+        """
+        chat_ids = list(dict.fromkeys(str(chat_id) for chat_id in chat_ids if chat_id))
+        if not chat_ids or self.method != 'api' or not self.api_key or not self.user_id:
+            return {}
+        
+        with span('avito.mark_chats_read', chats=len(chat_ids)):
+            results = dict(zip(chat_ids, self._map_chats(self._mark_chat_read, chat_ids)))
+        marked = sum(1 for ok in results.values() if ok)
+        logger.info(f"Отмечено прочитанными {marked} из {len(chat_ids)} чатов Avito")
+        return results
+
+    def _mark_chat_read(self, chat_id: str) -> bool:
+        """Отметка всех сообщений чата прочитанными"""
+        try:
+            response = self._api_request('POST', self._chat_read_url(chat_id))
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            self._count('errors')
+            logger.error(f"Ошибка отметки чата {chat_id} как прочитанного: {e}")
+            return False
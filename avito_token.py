@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэширование и обновление OAuth access token Avito
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AvitoTokenManager:
+    """Хранит access token в памяти и обновляет его незадолго до истечения"""
+
+    def __init__(self, client_id: str, client_secret: str,
+                 token_url: str = 'https://api.avito.ru/token',
+                 refresh_margin: int = 60,
+                 cache_file: Optional[str] = None,
+                 http=None):
+        """
+        Инициализация менеджера токенов
+
+        Args:
+            client_id: Client ID приложения Avito
+            client_secret: Client Secret приложения Avito
+            token_url: Адрес получения токена
+            refresh_margin: За сколько секунд до истечения обновлять токен
+            cache_file: Файл для сохранения токена между перезапусками (необязательно)
+            http: Объект с методом post() (по умолчанию модуль requests; для get_token_async - AsyncHttpClient)
+        """
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin
+        self.cache_file = cache_file
+        self.http = http or requests
+
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._async_lock: Optional[asyncio.Lock] = None
+        self.stats = {'fetches': 0, 'cache_hits': 0, 'fetch_errors': 0, 'invalidations': 0}
+
+        if self.cache_file:
+            self._load_cache()
+
+    def _is_fresh(self) -> bool:
+        """Токен есть и не требует обновления"""
+        return bool(self._token) and time.time() < self._expires_at - self.refresh_margin
+
+    def get_token(self) -> Optional[str]:
+        """
+        Получение действующего access token (из кэша или через /token)
+
+        Конкурентные вызовы во время обновления ждут один общий запрос.
+
+        Returns:
+            Optional[str]: Access token или None при ошибке
+        """
+        if self._is_fresh():
+            self.stats['cache_hits'] += 1
+            return self._token
+
+        with self._lock:
+            # Пока ждали блокировку, токен мог обновить другой поток
+            if self._is_fresh():
+                self.stats['cache_hits'] += 1
+                return self._token
+            return self._fetch_token()
+
+    async def get_token_async(self) -> Optional[str]:
+        """
+        Асинхронное получение access token (http должен быть AsyncHttpClient)
+
+        Конкурентные корутины во время обновления ждут один общий запрос.
+
+        Returns:
+            Optional[str]: Access token или None при ошибке
+        """
+        if self._is_fresh():
+            self.stats['cache_hits'] += 1
+            return self._token
+
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if self._is_fresh():
+                self.stats['cache_hits'] += 1
+                return self._token
+            try:
+                self.stats['fetches'] += 1
+                started = time.perf_counter()
+                response = await self.http.post(self.token_url, data=self._token_request_data())
+                metrics.TOKEN_FETCH_SECONDS.observe(time.perf_counter() - started)
+                return self._handle_token_response(response)
+            except Exception as e:
+                logger.error(f"Ошибка при получении токена: {e}")
+                self.stats['fetch_errors'] += 1
+                metrics.TOKEN_FETCHES.inc(result='error')
+                return None
+
+    def invalidate(self, token: Optional[str] = None):
+        """
+        Сброс токена (например, после ответа 401)
+
+        Args:
+            token: Токен, который был отклонен. Если он уже заменен новым, сброс не нужен
+        """
+        with self._lock:
+            if token is not None and token != self._token:
+                return
+            self._token = None
+            self._expires_at = 0.0
+            self.stats['invalidations'] += 1
+
+    def _fetch_token(self) -> Optional[str]:
+        """Запрос нового токена. Вызывается под блокировкой"""
+        try:
+            self.stats['fetches'] += 1
+            started = time.perf_counter()
+            response = self.http.post(self.token_url, data=self._token_request_data())
+            metrics.TOKEN_FETCH_SECONDS.observe(time.perf_counter() - started)
+            return self._handle_token_response(response)
+        except Exception as e:
+            logger.error(f"Ошибка при получении токена: {e}")
+            self.stats['fetch_errors'] += 1
+            metrics.TOKEN_FETCHES.inc(result='error')
+            return None
+
+    def _token_request_data(self) -> Dict:
+        return {
+            'grant_type': 'client_credentials',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret
+        }
+
+    def _handle_token_response(self, response) -> Optional[str]:
+        """Разбор ответа /token и сохранение токена"""
+        if response.status_code != 200:
+            logger.error(f"Ошибка получения токена: {response.status_code}, {response.text}")
+            self.stats['fetch_errors'] += 1
+            metrics.TOKEN_FETCHES.inc(result='error')
+            return None
+
+        token_data = response.json()
+        token = token_data.get('access_token')
+        if not token:
+            logger.error(f"Access token отсутствует в ответе: {response.text}")
+            self.stats['fetch_errors'] += 1
+            metrics.TOKEN_FETCHES.inc(result='error')
+            return None
+        metrics.TOKEN_FETCHES.inc(result='ok')
+
+        expires_in = int(token_data.get('expires_in') or 3600)
+        self._token = token
+        self._expires_at = time.time() + expires_in
+        logger.info(f"Получен новый access token Avito (действует {expires_in} сек)")
+
+        if self.cache_file:
+            self._save_cache()
+        return token
+
+    def _load_cache(self):
+        """Загрузка токена из файла, если он еще действителен"""
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать кэш токена {self.cache_file}: {e}")
+            return
+
+        if data.get('client_id') != self.client_id:
+            return
+
+        self._token = data.get('access_token')
+        self._expires_at = float(data.get('expires_at', 0))
+        if self._is_fresh():
+            logger.info("Access token Avito загружен из кэша")
+        else:
+            self._token = None
+            self._expires_at = 0.0
+
+    def _save_cache(self):
+        """Атомарная запись токена в файл"""
+        data = {
+            'client_id': self.client_id,
+            'access_token': self._token,
+            'expires_at': self._expires_at
+        }
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить кэш токена {self.cache_file}: {e}")
+
+    def get_stats(self) -> Dict:
+        """
+        Счетчики запросов токена и попаданий в кэш
+
+        Returns:
+            Dict: Статистика менеджера токенов
+        """
+        return dict(self.stats)
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарки AvitoClient и AvitoMessageForwarder на локальном mock сервере Avito и Telegram
+
+Сценарии пересылки запускают форвардер в отдельном процессе: пиковая память (RSS)
+относится только к нему, а mock сервер не отнимает у него GIL.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+from avito_client import AvitoClient
+from http_transport import HttpTransport
+from mock_server import MockServer, MockState
+from models import AvitoChat, AvitoMessage, AvitoUser
+from templates import PARSE_MODES, MessageTemplate
+
+
+def make_avito_config(server: MockServer, **overrides) -> Dict:
+    """Конфигурация AvitoClient для работы с mock сервером"""
+    config = {
+        'api_key': 'mock-secret',
+        'user_id': server.state.user_id,
+        'method': 'api',
+        'base_url': server.base_url,
+        # Mock сервер каждый раз новый - обработанные сообщения не должны сохраняться между запусками
+        'dedup': {'backend': 'memory'}
+    }
+    config.update(overrides)
+    return config
+
+
+# Сценарии пересылки: чаты и сообщения при старте, всплеск сообщений после первого цикла и поведение Telegram
+SCENARIOS = {
+    'chats10k': {'chats': 10000, 'messages_per_chat': 1, 'burst': 0},
+    'burst': {'chats': 100, 'messages_per_chat': 0, 'burst': 5000},
+    'storm429': {'chats': 200, 'messages_per_chat': 0, 'burst': 2000,
+                 'telegram_storm_seconds': 3, 'telegram_429_rate': 0.02, 'retry_after': 1},
+}
+
+
+def make_forward_config(server: MockServer, recipients: int, max_in_flight: int) -> Dict:
+    """
+    Конфигурация форвардера для работы с mock сервером
+
+    Ограничения частоты Telegram сняты: измеряется сам форвардер, а не лимиты Bot API
+    (ответы 429 mock сервер выдает сам).
+    """
+    unlimited = 1000000
+    return {
+        'avito': make_avito_config(server, fetch_engine='threads', max_in_flight=max_in_flight),
+        'telegram': {
+            'bot_token': 'mock-bot',
+            'chat_ids': [str(100 + i) for i in range(recipients)],
+            'api_url': server.base_url,
+            'workers': recipients,
+            'rate_limit': {'global_per_second': unlimited, 'per_chat_per_second': unlimited,
+                           'per_chat_burst': unlimited, 'max_retries': 10}
+        },
+        'schedule': {'adaptive': False},
+        'http': {'pool_size': max_in_flight + recipients}
+    }
+
+
+def _run_forwarder(config: Dict, engine: str, expected: int, warmup: bool, log_level: str,
+                   ready, go, results, timeout: float):
+    """
+    Прогон форвардера в дочернем процессе: циклы опроса до получения expected сообщений
+
+    Args:
+        config: Конфигурация форвардера
+        engine: sync или async
+        expected: Сколько новых сообщений нужно получить
+        warmup: Выполнить пустой цикл до сигнала go (запоминание чатов, получение токена)
+        log_level: Уровень логирования форвардера
+        ready: Событие "форвардер готов"
+        go: Событие "сообщения добавлены, можно начинать"
+        results: Очередь для результата
+        timeout: Максимальная длительность прогона в секундах
+    """
+    # Логи форвардера не пишутся в avito_forwarder.log рабочей копии
+    logging.basicConfig(level=getattr(logging, log_level), handlers=[logging.StreamHandler()])
+    from main import AsyncMessageForwarder, AvitoMessageForwarder
+
+    loop = None
+    if engine == 'async':
+        loop = asyncio.new_event_loop()
+        forwarder = AsyncMessageForwarder(config)
+
+        def cycle():
+            return loop.run_until_complete(forwarder.run_cycle())
+    else:
+        forwarder = AvitoMessageForwarder(config)
+        cycle = forwarder.run_cycle
+
+    if warmup:
+        cycle()
+    received_before = forwarder.stats['new_messages']
+    ready.set()
+    go.wait()
+
+    started = time.perf_counter()
+    cycles = 0
+    while forwarder.stats['new_messages'] - received_before < expected:
+        if time.perf_counter() - started > timeout:
+            break
+        cycle()
+        cycles += 1
+    elapsed = time.perf_counter() - started
+
+    forwarder.close()
+    if loop is not None:
+        loop.run_until_complete(forwarder.http.close())
+        loop.close()
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss //= 1024  # На macOS ru_maxrss в байтах, на Linux - в килобайтах
+    results.put({
+        'received': forwarder.stats['new_messages'] - received_before,
+        'cycles': cycles,
+        'forwarder_seconds': round(elapsed, 4),
+        'peak_rss_mb': round(peak_rss / 1024, 1)
+    })
+
+
+def _percentile(values: List[float], percent: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method='inclusive')[percent - 1]
+
+
+def bench_forward(scenario: str, engine: str, params: Dict, recipients: int, latency: float,
+                  telegram_latency: float, error_rate: float, max_in_flight: int,
+                  timeout: float, log_level: str = 'ERROR') -> Dict:
+    """
+    Прогон сценария пересылки: сообщения Avito -> форвардер -> mock Telegram
+
+    Задержка доставки считается для каждого уведомления: от появления сообщения на mock
+    сервере (или от старта прогона для сообщений, созданных заранее) до приема sendMessage.
+
+    Args:
+        scenario: Имя сценария
+        engine: sync или async
+        params: Параметры сценария (см. SCENARIOS)
+        recipients: Количество получателей Telegram
+        latency: Задержка ответов Avito в секундах
+        telegram_latency: Задержка ответов sendMessage в секундах
+        error_rate: Доля ответов 500 от Avito
+        max_in_flight: Одновременных запросов к Avito
+        timeout: Максимальная длительность прогона в секундах
+        log_level: Уровень логирования форвардера
+
+    Returns:
+        Dict: Результат прогона
+    """
+    state = MockState(
+        chats=params['chats'],
+        messages_per_chat=params.get('messages_per_chat', 0),
+        latency=latency,
+        error_rate=error_rate,
+        telegram_latency=telegram_latency,
+        telegram_429_rate=params.get('telegram_429_rate', 0.0),
+        telegram_storm_seconds=params.get('telegram_storm_seconds', 0.0),
+        retry_after=params.get('retry_after', 1)
+    )
+    burst = params.get('burst', 0)
+    expected = params['chats'] * params.get('messages_per_chat', 0) + burst
+
+    context = multiprocessing.get_context('spawn')
+    ready, go, results = context.Event(), context.Event(), context.Queue()
+    child: Optional[Dict] = None
+    with MockServer(state) as server:
+        config = make_forward_config(server, recipients, max_in_flight)
+        process = context.Process(target=_run_forwarder, args=(
+            config, engine, expected, bool(burst), log_level, ready, go, results, timeout))
+        process.start()
+        try:
+            if not ready.wait(timeout):
+                raise RuntimeError(f"Форвардер не запустился за {timeout} сек")
+            started = time.time()
+            for i in range(burst):
+                state.add_message(f'chat-{i % params["chats"]}')
+            go.set()
+            child = results.get(timeout=timeout + 60)
+        finally:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+
+    with state.lock:
+        deliveries = list(state.deliveries)
+    latencies = sorted(received - max(state.created_at.get(number, started), started)
+                       for number, _, received in deliveries)
+    receivers: Dict[int, int] = {}
+    for number, _, _ in deliveries:
+        receivers[number] = receivers.get(number, 0) + 1
+    delivered = sum(1 for count in receivers.values() if count >= recipients)
+    seconds = (max(received for _, _, received in deliveries) - started) if deliveries else 0.0
+
+    return {
+        'scenario': scenario,
+        'engine': engine,
+        'chats': params['chats'],
+        'recipients': recipients,
+        'messages': expected,
+        'delivered': delivered,
+        'notifications': len(deliveries),
+        'seconds': round(seconds, 4),
+        'messages_per_second': round(delivered / seconds, 1) if seconds else 0.0,
+        'latency_p50_ms': round(_percentile(latencies, 50) * 1000, 1),
+        'latency_p99_ms': round(_percentile(latencies, 99) * 1000, 1),
+        'peak_rss_mb': child['peak_rss_mb'],
+        'cycles': child['cycles'],
+        'requests': dict(state.request_counts)
+    }
+
+
+def bench_fetch(chat_counts: List[int], latency: float, max_in_flight: int) -> List[Dict]:
+    """
+    Сравнение последовательной и параллельной загрузки чатов
+
+    Args:
+        chat_counts: Количества чатов для прогонов
+        latency: Задержка ответа mock сервера в секундах
+        max_in_flight: Максимум одновременных запросов в режиме threads
+
+    Returns:
+        List[Dict]: Результаты прогонов
+    """
+    results = []
+    for chats in chat_counts:
+        for engine in ('sequential', 'threads'):
+            state = MockState(chats=chats, messages_per_chat=3, latency=latency)
+            with MockServer(state) as server:
+                transport = HttpTransport({'pool_size': max_in_flight})
+                client = AvitoClient(make_avito_config(
+                    server, fetch_engine=engine, max_in_flight=max_in_flight), transport=transport)
+                started = time.perf_counter()
+                messages = client.get_messages()
+                elapsed = time.perf_counter() - started
+                client.close()
+                transport.close()
+
+            results.append({
+                'scenario': 'fetch',
+                'engine': engine,
+                'chats': chats,
+                'messages': len(messages),
+                'seconds': round(elapsed, 4),
+                'requests': dict(state.request_counts)
+            })
+    return results
+
+
+def make_format_messages(count: int) -> List[Dict]:
+    """Сообщения для бенчмарка форматирования (со спецсимволами разметки, время - как у Avito)"""
+    base = 1700000000
+    return [{
+        'id': f'msg-{i}',
+        'text': f'Здравствуйте! Цена <{i} руб> & доставка (до 5-{i % 7} дней), актуально?',
+        'sender': f'buyer-{i % 500}',
+        'timestamp': base + i // 10,
+        'chat_id': f'chat-{i % 1000}',
+        'ad_title': f'Объявление_{i % 300} [новое]',
+        'ad_url': f'https://www.avito.ru/item/{1000 + i % 300}'
+    } for i in range(count)]
+
+
+def bench_format(count: int, repeat: int) -> List[Dict]:
+    """
+    Скорость форматирования уведомлений: по одному сообщению и пачкой, для каждого parse_mode
+
+    Args:
+        count: Сообщений в прогоне
+        repeat: Количество прогонов (берется лучший)
+
+    Returns:
+        List[Dict]: Результаты прогонов
+    """
+    messages = make_format_messages(count)
+    results = []
+    for parse_mode in PARSE_MODES:
+        template = MessageTemplate(parse_mode=parse_mode)
+        for mode in ('single', 'batch'):
+            best = None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                if mode == 'batch':
+                    template.render_many(messages)
+                else:
+                    for message in messages:
+                        template.render(message)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            results.append({
+                'scenario': 'format',
+                'parse_mode': parse_mode,
+                'mode': mode,
+                'messages': count,
+                'seconds': round(best, 4),
+                'messages_per_second': round(count / best) if best else 0
+            })
+    return results
+
+
+def _dict_authors(chat: Dict) -> Dict:
+    """Авторы чата из users в виде словарей (разбираются один раз на чат, как и AvitoUser)"""
+    return {user['id']: {'name': user.get('name'), 'url': (user.get('public_user_profile') or {}).get('url')}
+            for user in chat.get('users', [])}
+
+
+def _dict_message(message: Dict, chat: Dict, author: Optional[Dict] = None) -> Dict:
+    """Сообщение в виде словаря (формат до появления AvitoMessage с полями автора) - для сравнения"""
+    author = author or {}
+    return {
+        'id': message.get('id'),
+        'text': message.get('content', {}).get('text', ''),
+        'sender': author.get('name') or message.get('author_id'),
+        'sender_url': author.get('url'),
+        'timestamp': message.get('created'),
+        'chat_id': chat.get('id'),
+        'ad_title': chat.get('context', {}).get('value', {}).get('title', 'Неизвестно'),
+        'ad_url': chat.get('context', {}).get('value', {}).get('url', '')
+    }
+
+
+def bench_parse(count: int, messages_per_chat: int) -> List[Dict]:
+    """
+    Разбор ответа API в словари и в модели AvitoMessage: время и память на сообщение
+
+    Время измеряется при потоковой обработке (как в форвардере: сообщение разбирается и сразу
+    передается дальше), память - для сохраненной пачки всех сообщений.
+
+    Args:
+        count: Количество сообщений
+        messages_per_chat: Сообщений в одном чате (данные объявления общие для чата)
+
+    Returns:
+        List[Dict]: Результаты прогонов
+    """
+    state = MockState(chats=max(1, count // messages_per_chat), messages_per_chat=messages_per_chat)
+    # Ответы API разбираются json заново, как при реальной загрузке (строки не общие)
+    chats = json.loads(json.dumps(state.chats, ensure_ascii=False))
+    raw = json.loads(json.dumps(state.messages, ensure_ascii=False))
+
+    # Обе стороны делают одну работу: авторы разбираются из users один раз на чат,
+    # сообщение получает имя и ссылку на профиль автора
+    def parse_dicts():
+        for chat in chats:
+            authors = _dict_authors(chat)
+            for message in raw[chat['id']]:
+                yield _dict_message(message, chat, authors.get(message.get('author_id')))
+
+    def parse_models():
+        for chat in chats:
+            chat_model = AvitoChat.from_api(chat)
+            authors = {user['id']: AvitoUser.from_api(user) for user in chat.get('users', [])}
+            for message in raw[chat['id']]:
+                yield AvitoMessage.from_api(message, chat_model, authors.get(message.get('author_id')))
+
+    results = []
+    for name, parse in (('dict', parse_dicts), ('model', parse_models)):
+        best = None
+        for _ in range(3):
+            started = time.perf_counter()
+            for _message in parse():
+                pass
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        tracemalloc.start()
+        parsed = list(parse())
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append({
+            'scenario': 'parse',
+            'engine': name,
+            'messages': len(parsed),
+            'seconds': round(best, 4),
+            'bytes_per_message': round(memory / max(1, len(parsed)), 1)
+        })
+        del parsed
+    return results
+
+
+def print_table(results: List[Dict]):
+    """Вывод результатов таблицей"""
+    print(f"{'engine':<12} {'chats':>7} {'messages':>9} {'seconds':>9}")
+    for row in results:
+        print(f"{row['engine']:<12} {row['chats']:>7} {row['messages']:>9} {row['seconds']:>9.3f}")
+
+
+def print_format_table(results: List[Dict]):
+    """Вывод результатов бенчмарка форматирования таблицей"""
+    print(f"{'parse_mode':<11} {'mode':<7} {'messages':>9} {'seconds':>9} {'msg/s':>11}")
+    for row in results:
+        print(f"{row['parse_mode']:<11} {row['mode']:<7} {row['messages']:>9} {row['seconds']:>9.4f} "
+              f"{row['messages_per_second']:>11}")
+
+
+def print_forward_table(results: List[Dict]):
+    """Вывод результатов сценариев пересылки таблицей"""
+    print(f"{'scenario':<10} {'engine':<6} {'messages':>9} {'delivered':>9} {'seconds':>9} "
+          f"{'msg/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'rss MB':>8} {'429':>6}")
+    for row in results:
+        print(f"{row['scenario']:<10} {row['engine']:<6} {row['messages']:>9} {row['delivered']:>9} "
+              f"{row['seconds']:>9.3f} {row['messages_per_second']:>9.1f} {row['latency_p50_ms']:>9.1f} "
+              f"{row['latency_p99_ms']:>9.1f} {row['peak_rss_mb']:>8.1f} "
+              f"{row['requests'].get('sendMessage_429', 0):>6}")
+
+
+def main():
+    """Запуск бенчмарков из командной строки"""
+    parser = argparse.ArgumentParser(description='Бенчмарки Avito Message Forwarder на mock сервере')
+    parser.add_argument('scenario', choices=['fetch', 'format', 'parse', 'forward'] + list(SCENARIOS),
+                        help='Сценарий (forward - все сценарии пересылки)')
+    parser.add_argument('--chats', default='10,50,200', help='Количества чатов через запятую (fetch)')
+    parser.add_argument('--latency', type=float, default=0.02, help='Задержка mock сервера, сек')
+    parser.add_argument('--max-in-flight', type=int, default=16, help='Одновременных запросов')
+    parser.add_argument('--messages', type=int, default=100000, help='Сообщений в прогоне (format, parse)')
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов прогона, берется лучший (format)')
+    parser.add_argument('--engine', default='sync,async', help='Режимы форвардера через запятую')
+    parser.add_argument('--recipients', type=int, default=3, help='Получателей Telegram')
+    parser.add_argument('--telegram-latency', type=float, default=0.01, help='Задержка sendMessage, сек')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 500 от Avito')
+    parser.add_argument('--scale', type=float, default=1.0, help='Множитель количества чатов и сообщений')
+    parser.add_argument('--timeout', type=float, default=600, help='Предел длительности прогона, сек')
+    parser.add_argument('--log-level', default='ERROR', help='Уровень логирования форвардера')
+    parser.add_argument('--json', dest='json_file', help='Сохранить результаты в JSON файл')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.scenario == 'fetch':
+        chat_counts = [int(x) for x in args.chats.split(',') if x.strip()]
+        results = bench_fetch(chat_counts, args.latency, args.max_in_flight)
+        print_table(results)
+    elif args.scenario == 'parse':
+        results = bench_parse(args.messages, messages_per_chat=10)
+        print(f"{'engine':<8} {'messages':>9} {'seconds':>9} {'bytes/msg':>10}")
+        for row in results:
+            print(f"{row['engine']:<8} {row['messages']:>9} {row['seconds']:>9.4f} {row['bytes_per_message']:>10.1f}")
+    elif args.scenario == 'format':
+        results = bench_format(args.messages, args.repeat)
+        print_format_table(results)
+    else:
+        names = list(SCENARIOS) if args.scenario == 'forward' else [args.scenario]
+        engines = [x.strip() for x in args.engine.split(',') if x.strip()]
+        results = []
+        for name in names:
+            params = dict(SCENARIOS[name])
+            params['chats'] = max(1, int(params['chats'] * args.scale))
+            params['burst'] = int(params['burst'] * args.scale)
+            for engine in engines:
+                results.append(bench_forward(
+                    name, engine, params, args.recipients, args.latency, args.telegram_latency,
+                    args.error_rate, args.max_in_flight, args.timeout, args.log_level))
+        print_forward_table(results)
+
+    if args.json_file:
+        with open(args.json_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Распределение аккаунтов Avito между несколькими экземплярами форвардера через аренды в общем SQLite
+"""
+
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseCoordinator:
+    """Аренда аккаунтов с ограниченным сроком, продлением по heartbeat и перехватом после падения владельца"""
+
+    def __init__(self, path: str, resources: List[str], instance_id: Optional[str] = None,
+                 lease_ttl: float = 60, heartbeat_interval: Optional[float] = None):
+        """
+        Args:
+            path: Файл SQLite на общем томе
+            resources: Имена аккаунтов, которые нужно распределить
+            instance_id: Идентификатор экземпляра (по умолчанию hostname-pid-случайный суффикс)
+            lease_ttl: Срок аренды в секундах
+            heartbeat_interval: Период продления (по умолчанию треть срока аренды)
+        """
+        self.path = path
+        self.resources = list(resources)
+        self.instance_id = instance_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval or lease_ttl / 3
+        self._owned: Set[str] = set()
+        self._owned_until = 0.0
+        # Аккаунты, цикл которых сейчас выполняется: их аренда не отдается при перераспределении
+        self._busy: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA busy_timeout=10000')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS instances (
+                instance_id TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                resource TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+        ''')
+
+    def owns(self, resource: str) -> bool:
+        """Арендован ли аккаунт этим экземпляром (и аренда не истекла)"""
+        with self._lock:
+            return resource in self._owned and time.time() < self._owned_until
+
+    def owned(self) -> Set[str]:
+        with self._lock:
+            return set(self._owned)
+
+    def begin_cycle(self, resource: str) -> bool:
+        """
+        Начало цикла аккаунта: до end_cycle аренда продлевается и не отдается другому экземпляру
+
+        Returns:
+            bool: True, если аккаунт арендован этим экземпляром
+        """
+        with self._lock:
+            if resource not in self._owned or time.time() >= self._owned_until:
+                return False
+            self._busy.add(resource)
+            return True
+
+    def end_cycle(self, resource: str):
+        """Завершение цикла аккаунта, начатого begin_cycle"""
+        with self._lock:
+            self._busy.discard(resource)
+
+    def heartbeat(self):
+        """
+        Продление своих аренд и перераспределение аккаунтов
+
+        Каждый живой экземпляр держит не больше ceil(аккаунтов / экземпляров) аккаунтов,
+        поэтому при добавлении реплики часть аккаунтов освобождается и переходит к ней.
+        Аккаунт с незавершенным циклом освобождается при следующем продлении после его окончания.
+        """
+        now = time.time()
+        expires = now + self.lease_ttl
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute(
+                    'INSERT INTO instances (instance_id, heartbeat) VALUES (?, ?) '
+                    'ON CONFLICT(instance_id) DO UPDATE SET heartbeat = excluded.heartbeat',
+                    (self.instance_id, now)
+                )
+                self._conn.execute('DELETE FROM instances WHERE heartbeat < ?', (now - self.lease_ttl,))
+                live = self._conn.execute('SELECT COUNT(*) FROM instances').fetchone()[0]
+                share = math.ceil(len(self.resources) / max(1, live))
+
+                rows = self._conn.execute('SELECT resource, owner, expires FROM leases').fetchall()
+                leases = {resource: (owner, lease_expires) for resource, owner, lease_expires in rows}
+                mine = sorted(r for r in self.resources
+                              if leases.get(r, ('', 0))[0] == self.instance_id and leases[r][1] >= now)
+
+                # Отдаем лишнее, если экземпляров стало больше (кроме аккаунтов с идущим циклом)
+                idle = [resource for resource in mine if resource not in self._busy]
+                while len(mine) > share and idle:
+                    resource = idle.pop()
+                    mine.remove(resource)
+                    self._conn.execute('DELETE FROM leases WHERE resource = ? AND owner = ?',
+                                       (resource, self.instance_id))
+                    logger.info(f"Аккаунт {resource} освобожден для другого экземпляра")
+
+                for resource in mine:
+                    self._conn.execute('UPDATE leases SET expires = ? WHERE resource = ? AND owner = ?',
+                                       (expires, resource, self.instance_id))
+
+                # Берем свободные и просроченные аренды до своей доли
+                for resource in self.resources:
+                    if len(mine) >= share:
+                        break
+                    if resource in mine:
+                        continue
+                    lease = leases.get(resource)
+                    if lease is None or lease[1] < now:
+                        self._conn.execute(
+                            'INSERT INTO leases (resource, owner, expires) VALUES (?, ?, ?) '
+                            'ON CONFLICT(resource) DO UPDATE SET owner = excluded.owner, expires = excluded.expires',
+                            (resource, self.instance_id, expires)
+                        )
+                        mine.append(resource)
+                        previous = f" (перехвачен у {lease[0]})" if lease and lease[0] != self.instance_id else ''
+                        logger.info(f"Аккаунт {resource} арендован экземпляром {self.instance_id}{previous}")
+
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._owned = set(mine)
+            self._owned_until = expires
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"Ошибка продления аренды аккаунтов: {e}")
+                # Не смогли продлить - считаем аренды потерянными, чтобы не было двойной обработки
+                with self._lock:
+                    self._owned = set()
+
+    def start(self):
+        """Первое распределение и запуск потока продления"""
+        self.heartbeat()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='lease-heartbeat', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Остановка и освобождение своих аренд"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.heartbeat_interval)
+            self._thread = None
+        with self._lock:
+            try:
+                self._conn.execute('DELETE FROM leases WHERE owner = ?', (self.instance_id,))
+                self._conn.execute('DELETE FROM instances WHERE instance_id = ?', (self.instance_id,))
+            except Exception as e:
+                logger.error(f"Ошибка освобождения аренд: {e}")
+            self._owned = set()
+            self._conn.close()
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилища ID обработанных сообщений с ограничением по возрасту и размеру
+"""
+
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Файл по умолчанию лежит в logs/ - этот каталог смонтирован томом в docker-compose.yml
+DEFAULT_SQLITE_PATH = 'logs/processed_messages.db'
+
+
+class DedupStore(ABC):
+    """Базовый интерфейс: поддерживает `id in store`, store.add(id) и len(store)"""
+
+    def __init__(self, max_age: Optional[float] = None, max_size: Optional[int] = None):
+        """
+        Args:
+            max_age: Сколько секунд помнить ID (None - без ограничения)
+            max_size: Максимальное количество ID (None - без ограничения)
+        """
+        self.max_age = max_age
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def __contains__(self, message_id) -> bool:
+        """Есть ли ID среди обработанных"""
+
+    @abstractmethod
+    def add(self, message_id):
+        """Отметка ID обработанным"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Количество хранимых ID"""
+
+    @abstractmethod
+    def ids(self) -> Iterable[str]:
+        """Все хранимые ID (для перестроения фильтра Блума)"""
+
+    def claim(self, message_id) -> bool:
+        """
+        Захват ID на время пересылки (для хранилища, общего с другими экземплярами)
+
+        Args:
+            message_id: ID сообщения
+
+        Returns:
+            bool: True, если ID не обработан и не захвачен другим экземпляром
+        """
+        return True
+
+    def release(self, message_id):
+        """Снятие захвата после завершения пересылки"""
+
+    def close(self):
+        """Освобождение ресурсов"""
+
+
+class MemoryDedupStore(DedupStore):
+    """Ограниченное хранилище в памяти (состояние теряется при перезапуске)"""
+
+    def __init__(self, max_age: Optional[float] = None, max_size: Optional[int] = None):
+        super().__init__(max_age, max_size)
+        self._items: 'OrderedDict[str, float]' = OrderedDict()
+
+    def __contains__(self, message_id) -> bool:
+        return str(message_id) in self._items
+
+    def add(self, message_id):
+        with self._lock:
+            key = str(message_id)
+            self._items.pop(key, None)
+            self._items[key] = time.time()
+            self._evict()
+
+    def _evict(self):
+        """Удаление старых записей (самые старые в начале OrderedDict)"""
+        if self.max_size is not None:
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        if self.max_age is not None:
+            threshold = time.time() - self.max_age
+            while self._items:
+                key, added = next(iter(self._items.items()))
+                if added >= threshold:
+                    break
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def ids(self) -> Iterable[str]:
+        return list(self._items.keys())
+
+
+class AppendLogDedupStore(MemoryDedupStore):
+    """Журнал на диске (строки "время<TAB>id") с индексом в памяти"""
+
+    def __init__(self, path: str, max_age: Optional[float] = None, max_size: Optional[int] = None):
+        """
+        Args:
+            path: Файл журнала
+            max_age: Сколько секунд помнить ID
+            max_size: Максимальное количество ID
+        """
+        super().__init__(max_age, max_size)
+        self.path = path
+        self._log_lines = 0
+        self._load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        """Восстановление индекса из журнала"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    added, _, key = line.rstrip('\n').partition('\t')
+                    if not key:
+                        continue
+                    self._log_lines += 1
+                    self._items.pop(key, None)
+                    try:
+                        self._items[key] = float(added)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            return
+        self._evict()
+        logger.info(f"Загружено {len(self._items)} обработанных сообщений из {self.path}")
+        if self._log_lines > 2 * max(len(self._items), 1000):
+            self._compact()
+
+    def add(self, message_id):
+        with self._lock:
+            key = str(message_id)
+            added = time.time()
+            self._items.pop(key, None)
+            self._items[key] = added
+            self._file.write(f"{added:.3f}\t{key}\n")
+            self._file.flush()
+            self._log_lines += 1
+            self._evict()
+            # Журнал сильно длиннее живого индекса - переписываем его
+            if self._log_lines > 2 * max(len(self._items), 1000):
+                self._compact()
+
+    def _compact(self):
+        """Перезапись журнала только с актуальными записями"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key, added in self._items.items():
+                f.write(f"{added:.3f}\t{key}\n")
+        if getattr(self, '_file', None):
+            self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._log_lines = len(self._items)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class SQLiteDedupStore(DedupStore):
+    """Хранилище в SQLite (режим WAL), подходит для общего доступа нескольких процессов"""
+
+    # Как часто (в добавлениях) запускать очистку устаревших записей
+    EVICT_EVERY = 500
+
+    def __init__(self, path: str, max_age: Optional[float] = None, max_size: Optional[int] = None,
+                 claim_ttl: Optional[float] = None):
+        """
+        Args:
+            path: Файл базы данных
+            max_age: Сколько секунд помнить ID
+            max_size: Максимальное количество ID
+            claim_ttl: Срок захвата ID на время пересылки (None - без захватов, один экземпляр)
+        """
+        super().__init__(max_age, max_size)
+        self.path = path
+        self.claim_ttl = claim_ttl
+        self.owner = uuid.uuid4().hex
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS processed_messages ('
+            'id TEXT PRIMARY KEY, added REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS processed_messages_added ON processed_messages (added)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS claimed_messages ('
+            'id TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)'
+        )
+        self._adds_since_evict = 0
+        with self._lock:
+            self._evict()
+
+    def __contains__(self, message_id) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM processed_messages WHERE id = ?', (str(message_id),)
+            ).fetchone()
+        return row is not None
+
+    def add(self, message_id):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO processed_messages (id, added) VALUES (?, ?)',
+                (str(message_id), time.time())
+            )
+            self._adds_since_evict += 1
+            if self._adds_since_evict >= self.EVICT_EVERY:
+                self._evict()
+
+    def claim(self, message_id) -> bool:
+        """
+        Захват ID одним шагом (INSERT OR IGNORE): из экземпляров с общим файлом сообщение пересылает
+        только захвативший; захват упавшего экземпляра перехватывается после claim_ttl
+        """
+        if self.claim_ttl is None:
+            return True
+        key = str(message_id)
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self._conn.execute('SELECT 1 FROM processed_messages WHERE id = ?', (key,)).fetchone():
+                    claimed = False
+                else:
+                    self._conn.execute('DELETE FROM claimed_messages WHERE id = ? AND expires < ?', (key, now))
+                    claimed = self._conn.execute(
+                        'INSERT OR IGNORE INTO claimed_messages (id, owner, expires) VALUES (?, ?, ?)',
+                        (key, self.owner, now + self.claim_ttl)
+                    ).rowcount > 0
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return claimed
+
+    def release(self, message_id):
+        if self.claim_ttl is None:
+            return
+        with self._lock:
+            self._conn.execute('DELETE FROM claimed_messages WHERE id = ? AND owner = ?',
+                               (str(message_id), self.owner))
+
+    def _evict(self):
+        """Удаление записей старше max_age и сверх max_size. Вызывается под блокировкой"""
+        self._adds_since_evict = 0
+        if self.claim_ttl is not None:
+            self._conn.execute('DELETE FROM claimed_messages WHERE expires < ?', (time.time(),))
+        if self.max_age is not None:
+            self._conn.execute(
+                'DELETE FROM processed_messages WHERE added < ?', (time.time() - self.max_age,)
+            )
+        if self.max_size is not None:
+            self._conn.execute(
+                'DELETE FROM processed_messages WHERE id IN ('
+                'SELECT id FROM processed_messages ORDER BY added DESC LIMIT -1 OFFSET ?)',
+                (self.max_size,)
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM processed_messages').fetchone()[0]
+
+    def ids(self) -> Iterable[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute('SELECT id FROM processed_messages')]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BloomFilter:
+    """Фильтр Блума на bytearray"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """
+        Args:
+            capacity: Ожидаемое количество элементов
+            error_rate: Допустимая доля ложноположительных ответов
+        """
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class BloomDedupStore(DedupStore):
+    """Фильтр Блума перед хранилищем: отрицательный ответ не требует обращения к диску"""
+
+    def __init__(self, backend: DedupStore, capacity: int = 1000000, error_rate: float = 0.001):
+        """
+        Args:
+            backend: Основное хранилище (источник истины)
+            capacity: Ожидаемое количество ID
+            error_rate: Допустимая доля ложноположительных ответов фильтра
+        """
+        super().__init__(backend.max_age, backend.max_size)
+        self.backend = backend
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._rebuild()
+
+    def _rebuild(self):
+        """Перестроение фильтра по содержимому хранилища (после вытеснения записей)"""
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        for key in self.backend.ids():
+            bloom.add(key)
+        self.bloom = bloom
+
+    def __contains__(self, message_id) -> bool:
+        key = str(message_id)
+        if key not in self.bloom:
+            return False
+        return key in self.backend
+
+    def add(self, message_id):
+        key = str(message_id)
+        self.backend.add(key)
+        self.bloom.add(key)
+        # Из фильтра нельзя удалять, поэтому при переполнении строим его заново
+        if self.bloom.count > self.capacity:
+            self._rebuild()
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+    def ids(self) -> Iterable[str]:
+        return self.backend.ids()
+
+    def claim(self, message_id) -> bool:
+        return self.backend.claim(str(message_id))
+
+    def release(self, message_id):
+        self.backend.release(str(message_id))
+
+    def close(self):
+        self.backend.close()
+
+
+def create_dedup_store(config: Optional[Dict] = None) -> DedupStore:
+    """
+    Создание хранилища по секции "dedup" конфигурации Avito
+
+    По умолчанию используется SQLite в logs/ (том контейнера), чтобы после перезапуска
+    и обновления уже пересланные сообщения не отправлялись повторно.
+
+    Args:
+        config: {"backend": "sqlite" | "memory" | "log", "path": ..., "max_age": ...,
+                 "max_size": ..., "claim_ttl": ..., "bloom": false, "bloom_capacity": ..., "bloom_error_rate": ...}
+
+    Returns:
+        DedupStore: Хранилище обработанных сообщений
+    """
+    config = config or {}
+    backend = config.get('backend', 'sqlite')
+    max_age = config.get('max_age', 30 * 24 * 3600)
+    max_size = config.get('max_size', 100000)
+
+    if backend == 'sqlite':
+        store = SQLiteDedupStore(config.get('path', DEFAULT_SQLITE_PATH), max_age, max_size,
+                                 claim_ttl=config.get('claim_ttl'))
+    elif backend == 'log':
+        store = AppendLogDedupStore(config.get('path', 'processed_messages.log'), max_age, max_size)
+    else:
+        if backend != 'memory':
+            logger.error(f"Неизвестное хранилище обработанных сообщений: {backend}, используется memory")
+        store = MemoryDedupStore(max_age, max_size)
+
+    if config.get('bloom'):
+        store = BloomDedupStore(
+            store,
+            capacity=config.get('bloom_capacity', 1000000),
+            error_rate=config.get('bloom_error_rate', 0.001)
+        )
+    return store
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Постоянная очередь исходящих уведомлений между опросом Avito и отправкой в Telegram
+"""
+
+import logging
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+INFLIGHT = 'inflight'
+DONE = 'done'
+DEAD = 'dead'
+
+
+class DeliveryQueue:
+    """Очередь в SQLite: одна запись на пару (сообщение, chat_id), доставка не менее одного раза"""
+
+    def __init__(self, path: str = 'outbox.db', max_attempts: int = 8,
+                 base_delay: float = 5, max_delay: float = 3600, lease: float = 120):
+        """
+        Инициализация очереди
+
+        Args:
+            path: Файл базы данных
+            max_attempts: После скольких неудачных попыток запись уходит в dead
+            base_delay: Начальная задержка повтора в секундах
+            max_delay: Максимальная задержка повтора в секундах
+            lease: Через сколько секунд запись inflight считается брошенной и выдается снова
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA busy_timeout=5000')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_key TEXT,
+                chat_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                UNIQUE (message_key, chat_id)
+            );
+            CREATE INDEX IF NOT EXISTS outbox_due ON outbox (state, next_attempt);
+            CREATE INDEX IF NOT EXISTS outbox_chat ON outbox (chat_id, state, id);
+        ''')
+
+    def enqueue(self, chat_id: str, text: str, message_key: Optional[str] = None) -> bool:
+        """
+        Добавление уведомления в очередь
+
+        Args:
+            chat_id: ID чата Telegram
+            text: Готовый текст сообщения
+            message_key: ID исходного сообщения (повторная постановка с тем же ключом игнорируется)
+
+        Returns:
+            bool: True, если запись добавлена
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO outbox (message_key, chat_id, text, next_attempt, created, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (message_key, str(chat_id), text, now, now, now)
+            )
+        return cursor.rowcount > 0
+
+    def claim(self, limit: int = 20) -> List[Dict]:
+        """
+        Выдача готовых к отправке записей
+
+        Выдается только первая незавершенная запись каждого чата, поэтому повтор
+        не обгоняет более ранние сообщения того же чата.
+
+        Args:
+            limit: Максимум записей
+
+        Returns:
+            List[Dict]: Записи (id, chat_id, text, attempts), переведенные в inflight
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Возвращаем записи, обработчик которых не отчитался за время аренды
+                self._conn.execute(
+                    'UPDATE outbox SET state = ? WHERE state = ? AND next_attempt <= ?',
+                    (PENDING, INFLIGHT, now)
+                )
+                rows = self._conn.execute(
+                    'SELECT o.id, o.chat_id, o.text, o.attempts FROM outbox o '
+                    'WHERE o.state = ? AND o.next_attempt <= ? AND NOT EXISTS ('
+                    '  SELECT 1 FROM outbox p WHERE p.chat_id = o.chat_id AND p.id < o.id '
+                    '  AND p.state IN (?, ?)) '
+                    'ORDER BY o.id LIMIT ?',
+                    (PENDING, now, PENDING, INFLIGHT, limit)
+                ).fetchall()
+                for row in rows:
+                    self._conn.execute(
+                        'UPDATE outbox SET state = ?, next_attempt = ?, updated = ? WHERE id = ?',
+                        (INFLIGHT, now + self.lease, now, row[0])
+                    )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return [{'id': row[0], 'chat_id': row[1], 'text': row[2], 'attempts': row[3]} for row in rows]
+
+    def ack(self, item_id: int):
+        """Отметка об успешной доставке"""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE outbox SET state = ?, updated = ?, last_error = NULL WHERE id = ?',
+                (DONE, time.time(), item_id)
+            )
+
+    def fail(self, item_id: int, error: str, permanent: bool = False) -> str:
+        """
+        Отметка о неудачной попытке
+
+        Args:
+            item_id: ID записи
+            error: Описание ошибки
+            permanent: Ошибка не исправится повтором (запись сразу уходит в dead)
+
+        Returns:
+            str: Новое состояние записи (pending или dead)
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT attempts FROM outbox WHERE id = ?', (item_id,)).fetchone()
+            if row is None:
+                return DEAD
+            attempts = row[0] + 1
+            if permanent or attempts >= self.max_attempts:
+                state, next_attempt = DEAD, now
+            else:
+                delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+                state, next_attempt = PENDING, now + delay * random.uniform(0.8, 1.2)
+            self._conn.execute(
+                'UPDATE outbox SET state = ?, attempts = ?, next_attempt = ?, last_error = ?, updated = ? '
+                'WHERE id = ?',
+                (state, attempts, next_attempt, error, now, item_id)
+            )
+        return state
+
+    def next_due(self) -> Optional[float]:
+        """
+        Время ближайшей записи к отправке
+
+        Учитываются только первые незавершенные записи чатов (как в claim): запись за повтором
+        в том же чате не будет выдана раньше него, даже если ее время уже наступило.
+
+        Returns:
+            Optional[float]: Unix time или None, если очередь пуста
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT MIN(o.next_attempt) FROM outbox o '
+                'WHERE o.state IN (?, ?) AND NOT EXISTS ('
+                '  SELECT 1 FROM outbox p WHERE p.chat_id = o.chat_id AND p.id < o.id '
+                '  AND p.state IN (?, ?))',
+                (PENDING, INFLIGHT, PENDING, INFLIGHT)
+            ).fetchone()
+        return row[0]
+
+    def requeue_dead(self) -> int:
+        """
+        Возврат записей из dead в очередь
+
+        Returns:
+            int: Количество возвращенных записей
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE outbox SET state = ?, attempts = 0, next_attempt = ?, updated = ? WHERE state = ?',
+                (PENDING, now, now, DEAD)
+            )
+        return cursor.rowcount
+
+    def purge_done(self, older_than: float = 86400) -> int:
+        """
+        Удаление доставленных записей старше older_than секунд
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'DELETE FROM outbox WHERE state = ? AND updated < ?', (DONE, time.time() - older_than)
+            )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Количество записей по состояниям
+
+        Returns:
+            Dict[str, int]: pending, inflight, done, dead
+        """
+        result = {PENDING: 0, INFLIGHT: 0, DONE: 0, DEAD: 0}
+        with self._lock:
+            for state, count in self._conn.execute('SELECT state, COUNT(*) FROM outbox GROUP BY state'):
+                result[state] = count
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class DeliveryWorker:
+    """Фоновый поток, который разбирает очередь и отправляет уведомления в Telegram"""
+
+    def __init__(self, queue: DeliveryQueue, sender, batch_size: int = 20, idle_interval: float = 5):
+        """
+        Args:
+            queue: Очередь уведомлений
+            sender: TelegramSender
+            batch_size: Сколько записей забирать за раз
+            idle_interval: Максимальная пауза между проверками очереди в секундах
+        """
+        self.queue = queue
+        self.sender = sender
+        self.batch_size = batch_size
+        self.idle_interval = idle_interval
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_purge = 0.0
+
+    def run_once(self) -> int:
+        """
+        Отправка одной партии записей
+
+        Returns:
+            int: Количество обработанных записей
+        """
+        items = self.queue.claim(self.batch_size)
+        tickets = [(item, self.sender.submit(item['text'], [item['chat_id']])) for item in items]
+
+        for item, ticket in tickets:
+            result = ticket.wait().results.get(item['chat_id'])
+            if result is not None and result.ok:
+                self.queue.ack(item['id'])
+                continue
+
+            error = result.error if result else 'нет результата'
+            status = result.status_code if result else None
+            # 4xx (кроме 429) - ошибка в самом сообщении или чате, повтор не поможет
+            permanent = status is not None and 400 <= status < 500 and status != 429
+            state = self.queue.fail(item['id'], f"{status} {error}", permanent=permanent)
+            if state == DEAD:
+                logger.error(f"Уведомление {item['id']} для chat_id {item['chat_id']} "
+                             f"не доставлено и перемещено в dead: {error}")
+            else:
+                logger.warning(f"Уведомление {item['id']} для chat_id {item['chat_id']} "
+                               f"будет отправлено повторно: {error}")
+
+        if time.time() - self._last_purge > 3600:
+            self._last_purge = time.time()
+            self.queue.purge_done()
+        return len(items)
+
+    def drain(self):
+        """Отправка всех записей, готовых к отправке прямо сейчас"""
+        while self.run_once():
+            pass
+
+    def notify(self):
+        """Сигнал о новых записях в очереди"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+                next_due = self.queue.next_due()
+                timeout = self.idle_interval
+                if next_due is not None:
+                    timeout = min(timeout, max(0.0, next_due - time.time()))
+            except Exception as e:
+                logger.error(f"Ошибка обработки очереди уведомлений: {e}")
+                timeout = self.idle_interval
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Запуск фонового потока"""
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='delivery-worker', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Остановка фонового потока"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Диагностика подключения: одновременная проверка Avito API, Telegram Bot API (getMe и каждый chat_id),
+DNS и TLS с жесткими таймаутами и временем этапов каждого запроса (DNS, connect, TLS, TTFB)
+"""
+
+import asyncio
+import json
+import socket
+import ssl
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpcore  # noqa: F401 - httpx загружает его при первом запросе, это не должно попасть в замеры
+import httpx
+
+from async_http import AsyncResponse
+
+CHECKS = ('network', 'avito', 'telegram', 'healthz')
+PHASES = ('dns', 'connect', 'tls', 'ttfb')
+
+DEFAULT_TIMEOUT = 5.0
+
+
+@dataclass
+class ProbeResult:
+    """Результат одной проверки; время этапов и общее - в миллисекундах"""
+    name: str
+    check: str
+    ok: bool = False
+    skipped: bool = False
+    status: Optional[int] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    total_ms: Optional[float] = None
+    detail: str = ''
+    # Этап, который не успел завершиться (при ошибке или таймауте)
+    stage: Optional[str] = None
+
+
+class _PhaseTimer:
+    """Отметки этапов запроса в result.timings"""
+
+    def __init__(self, result: ProbeResult):
+        self.result = result
+        self.result.stage = 'dns'
+        self.started = self.mark = time.perf_counter()
+
+    def phase(self, name: str, next_stage: str):
+        now = time.perf_counter()
+        self.result.timings[name] = round((now - self.mark) * 1000, 1)
+        self.result.stage = next_stage
+        self.mark = now
+
+    def finish(self):
+        self.result.total_ms = round((time.perf_counter() - self.started) * 1000, 1)
+        self.result.stage = None
+
+
+async def _open(url: str, timer: _PhaseTimer, ssl_context: ssl.SSLContext
+                ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Новое соединение с отдельным замером DNS, TCP connect и TLS handshake"""
+    parts = urlsplit(url)
+    secure = parts.scheme == 'https'
+    host = parts.hostname
+    port = parts.port or (443 if secure else 80)
+
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    timer.phase('dns', 'connect')
+    address = infos[0][4][0]
+    if secure and not hasattr(asyncio.StreamWriter, 'start_tls'):
+        # До Python 3.11 TLS нельзя включить на открытом соединении: connect и TLS замеряются вместе
+        reader, writer = await asyncio.open_connection(address, port, ssl=ssl_context, server_hostname=host)
+        timer.phase('connect', 'ttfb')
+        return reader, writer
+
+    reader, writer = await asyncio.open_connection(address, port)
+    timer.phase('connect', 'tls' if secure else 'ttfb')
+    if secure:
+        try:
+            await writer.start_tls(ssl_context, server_hostname=host)
+        except BaseException:
+            writer.close()
+            raise
+        timer.phase('tls', 'ttfb')
+    return reader, writer
+
+
+async def timed_request(method: str, url: str, result: ProbeResult, ssl_context: ssl.SSLContext,
+                        params: Optional[Dict] = None, data: Optional[Dict] = None,
+                        headers: Optional[Dict[str, str]] = None) -> AsyncResponse:
+    """
+    HTTP запрос по новому прямому соединению (без прокси) с замером этапов в result.timings
+
+    Адрес разрешается отдельно, затем httpx соединяется с этим адресом (SNI и Host - исходное имя),
+    время connect, TLS и TTFB берется из событий trace httpcore.
+
+    Args:
+        method: HTTP метод
+        url: Адрес
+        result: Результат проверки, в который записывается время
+        ssl_context: Контекст TLS
+        params: Параметры строки запроса
+        data: Тело формы (application/x-www-form-urlencoded)
+        headers: Дополнительные заголовки
+
+    Returns:
+        AsyncResponse: Ответ сервера
+    """
+    parts = urlsplit(url)
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+
+    async def trace(event: str, info: Dict):
+        if event == 'connection.connect_tcp.complete':
+            timer.phase('connect', 'tls' if secure else 'ttfb')
+        elif event == 'connection.start_tls.complete':
+            timer.phase('tls', 'ttfb')
+        elif event == 'http11.receive_response_headers.complete':
+            timer.phase('ttfb', 'body')
+
+    extensions = {'trace': trace}
+    if secure:
+        extensions['sni_hostname'] = parts.hostname
+    async with httpx.AsyncClient(verify=ssl_context, trust_env=False, timeout=None) as client:
+        timer = _PhaseTimer(result)
+        infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+        timer.phase('dns', 'connect')
+        address = infos[0][4][0]
+        netloc = f"[{address}]:{port}" if ':' in address else f"{address}:{port}"
+        response = await client.request(
+            method, parts._replace(netloc=netloc).geturl(), params=params, data=data,
+            headers={'Host': parts.netloc, **(headers or {})}, extensions=extensions)
+    timer.finish()
+    result.status = response.status_code
+    return response
+
+
+class Diagnostics:
+    """Набор проверок по конфигурации форвардера"""
+
+    def __init__(self, config: Dict, checks: Tuple[str, ...] = CHECKS, timeout: float = DEFAULT_TIMEOUT):
+        """
+        Args:
+            config: Конфигурация форвардера (config.json)
+            checks: Группы проверок из CHECKS
+            timeout: Предельное время одной проверки в секундах
+        """
+        self.config = config
+        self.checks = checks
+        self.timeout = timeout
+        self.ssl_context = ssl.create_default_context()
+        self.results: List[ProbeResult] = []
+
+    def _result(self, name: str, check: str) -> ProbeResult:
+        result = ProbeResult(name, check)
+        self.results.append(result)
+        return result
+
+    def _skip(self, name: str, check: str, detail: str):
+        result = self._result(name, check)
+        result.ok = result.skipped = True
+        result.detail = detail
+
+    async def _probe(self, result: ProbeResult, coro):
+        """Выполнение проверки с таймаутом; ошибка и этап, на котором она произошла, - в detail"""
+        try:
+            await asyncio.wait_for(coro, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            result.ok = False
+            result.detail = f"таймаут {self.timeout:g} с" + (f" (этап {result.stage})" if result.stage else '')
+        except Exception as e:
+            result.ok = False
+            result.detail = (f"{type(e).__name__}: {e}" if str(e) else type(e).__name__) + \
+                (f" (этап {result.stage})" if result.stage else '')
+
+    async def _request(self, result: ProbeResult, method: str, url: str, **kwargs) -> AsyncResponse:
+        response = await timed_request(method, url, result, self.ssl_context, **kwargs)
+        result.ok = 200 <= response.status_code < 300
+        if not result.ok:
+            result.detail = _error_detail(response)
+        return response
+
+    def accounts(self) -> List[Tuple[str, Dict]]:
+        """Аккаунты Avito: avito_accounts или единственная секция avito"""
+        accounts = self.config.get('avito_accounts')
+        if accounts:
+            return [(account.get('name') or f"account-{index + 1}", account)
+                    for index, account in enumerate(accounts)]
+        return [('avito', self.config.get('avito', {}))]
+
+    def chat_ids(self) -> List[str]:
+        """Все получатели Telegram, включая chat_ids отдельных аккаунтов"""
+        telegram_config = self.config.get('telegram', {})
+        chat_ids = list(telegram_config.get('chat_ids') or [])
+        if not chat_ids and telegram_config.get('chat_id'):
+            chat_ids = [telegram_config['chat_id']]
+        for account in self.config.get('avito_accounts') or []:
+            chat_ids.extend(account.get('chat_ids') or [])
+        return list(dict.fromkeys(str(chat_id) for chat_id in chat_ids))
+
+    def hosts(self) -> List[str]:
+        """Адреса (схема, хост, порт) всех внешних API из конфигурации"""
+        urls = [self.config.get('telegram', {}).get('api_url', 'https://api.telegram.org')]
+        urls.extend(account.get('base_url', 'https://api.avito.ru') for _, account in self.accounts()
+                    if account.get('method', 'api') == 'api')
+        return list(dict.fromkeys(f"{urlsplit(url).scheme}://{urlsplit(url).netloc}" for url in urls))
+
+    async def check_network(self, origin: str):
+        """DNS и TLS хоста: адреса, время этапов и срок действия сертификата"""
+        result = self._result(f"host {urlsplit(origin).netloc}", 'network')
+
+        async def probe():
+            timer = _PhaseTimer(result)
+            _, writer = await _open(origin, timer, self.ssl_context)
+            timer.finish()
+            try:
+                ssl_object = writer.get_extra_info('ssl_object')
+                if ssl_object is None:
+                    result.detail = f"{writer.get_extra_info('peername')[0]} без TLS"
+                else:
+                    expires = datetime.fromtimestamp(
+                        ssl.cert_time_to_seconds(ssl_object.getpeercert()['notAfter']), timezone.utc)
+                    days = (expires - datetime.now(timezone.utc)).days
+                    result.detail = f"{ssl_object.version()}, сертификат до {expires:%Y-%m-%d} ({days} дн.)"
+                result.ok = True
+            finally:
+                writer.close()
+
+        await self._probe(result, probe())
+
+    async def check_avito(self, name: str, account: Dict):
+        """Получение токена, затем одновременно - основные методы API аккаунта"""
+        prefix = name if name == 'avito' else f"avito[{name}]"
+        if account.get('method', 'api') != 'api':
+            self._skip(f"{prefix} api", 'avito', "method не api")
+            return
+        client_id, client_secret = account.get('user_id'), account.get('api_key')
+        if not client_id or not client_secret:
+            self._skip(f"{prefix} api", 'avito', "не заданы user_id и api_key")
+            return
+
+        base_url = account.get('base_url', 'https://api.avito.ru')
+        token_result = self._result(f"{prefix} token", 'avito')
+        token: Dict[str, str] = {}
+
+        async def get_token():
+            response = await self._request(token_result, 'POST', f"{base_url}/token", data={
+                'grant_type': 'client_credentials', 'client_id': client_id, 'client_secret': client_secret})
+            if token_result.ok:
+                payload = response.json()
+                token['access_token'] = payload.get('access_token')
+                token_result.ok = bool(token['access_token'])
+                token_result.detail = (f"expires_in {payload.get('expires_in')}" if token_result.ok
+                                       else "в ответе нет access_token")
+
+        await self._probe(token_result, get_token())
+
+        endpoints = [
+            ('chats', f"{base_url}/messenger/v2/accounts/{client_id}/chats", {'limit': 1}),
+            ('items', f"{base_url}/core/v1/accounts/{client_id}/items", {'per_page': 1}),
+            ('self', f"{base_url}/core/v1/accounts/self", None),
+        ]
+        if not token.get('access_token'):
+            for endpoint, _, _ in endpoints:
+                self._skip(f"{prefix} {endpoint}", 'avito', "нет токена")
+            return
+
+        headers = {'Authorization': f"Bearer {token['access_token']}"}
+
+        async def call(result: ProbeResult, url: str, params: Optional[Dict]):
+            await self._request(result, 'GET', url, params=params, headers=headers)
+
+        probes = []
+        for endpoint, url, params in endpoints:
+            result = self._result(f"{prefix} {endpoint}", 'avito')
+            probes.append(self._probe(result, call(result, url, params)))
+        await asyncio.gather(*probes)
+
+    async def check_telegram(self):
+        """getMe бота и getChat для каждого получателя (без отправки сообщений)"""
+        telegram_config = self.config.get('telegram', {})
+        bot_token = telegram_config.get('bot_token')
+        if not bot_token:
+            self._skip('telegram getMe', 'telegram', "не задан bot_token")
+            return
+        api = f"{telegram_config.get('api_url', 'https://api.telegram.org').rstrip('/')}/bot{bot_token}"
+
+        async def get_me(result: ProbeResult):
+            response = await self._request(result, 'GET', f"{api}/getMe")
+            if result.ok:
+                result.detail = f"@{response.json().get('result', {}).get('username')}"
+
+        async def get_chat(result: ProbeResult, chat_id: str):
+            response = await self._request(result, 'GET', f"{api}/getChat", params={'chat_id': chat_id})
+            if result.ok:
+                chat = response.json().get('result', {})
+                title = chat.get('title') or chat.get('username') or chat.get('first_name')
+                result.detail = f"{chat.get('type')}: {title}"
+
+        result = self._result('telegram getMe', 'telegram')
+        probes = [self._probe(result, get_me(result))]
+        for chat_id in self.chat_ids():
+            result = self._result(f"telegram chat {chat_id}", 'telegram')
+            probes.append(self._probe(result, get_chat(result, chat_id)))
+        await asyncio.gather(*probes)
+
+    async def check_healthz(self):
+        """/healthz работающего форвардера (если включен сервер метрик)"""
+        metrics_config = self.config.get('metrics', {})
+        if not metrics_config.get('enabled'):
+            self._skip('healthz', 'healthz', "metrics.enabled выключен")
+            return
+        host = metrics_config.get('host', '0.0.0.0')
+        host = '127.0.0.1' if host in ('0.0.0.0', '') else host
+        result = self._result('healthz', 'healthz')
+
+        async def get():
+            url = f"http://{host}:{metrics_config.get('port', 9100)}/healthz"
+            response = await self._request(result, 'GET', url)
+            if result.ok:
+                result.detail = response.text.strip()[:80]
+
+        await self._probe(result, get())
+
+    async def run(self) -> List[ProbeResult]:
+        """
+        Все выбранные проверки одновременно
+
+        Returns:
+            List[ProbeResult]: Результаты в порядке групп
+        """
+        probes = []
+        if 'network' in self.checks:
+            probes.extend(self.check_network(origin) for origin in self.hosts())
+        if 'avito' in self.checks:
+            probes.extend(self.check_avito(name, account) for name, account in self.accounts())
+        if 'telegram' in self.checks:
+            probes.append(self.check_telegram())
+        if 'healthz' in self.checks:
+            probes.append(self.check_healthz())
+        await asyncio.gather(*probes)
+        order = {check: index for index, check in enumerate(CHECKS)}
+        self.results.sort(key=lambda result: order[result.check])
+        return self.results
+
+
+def _error_detail(response: AsyncResponse) -> str:
+    """Краткое описание ответа с ошибкой (description Telegram или message Avito)"""
+    try:
+        payload = response.json()
+    except ValueError:
+        payload = None
+    if isinstance(payload, dict):
+        error = payload.get('error')
+        message = (payload.get('description') or payload.get('message')
+                   or (error.get('message') if isinstance(error, dict) else error))
+        if message:
+            return f"HTTP {response.status_code}: {str(message)[:80]}"
+    return f"HTTP {response.status_code}"
+
+
+def print_report(results: List[ProbeResult], elapsed: float):
+    """Вывод результатов таблицей"""
+    columns = f"{'проверка':<32} {'итог':<5} {'HTTP':>4} " + ' '.join(f"{phase:>7}" for phase in PHASES)
+    print(f"{columns} {'всего':>7}  подробности")
+    for result in results:
+        mark = 'SKIP' if result.skipped else ('OK' if result.ok else 'FAIL')
+        timings = ' '.join(f"{result.timings[phase]:>7.1f}" if phase in result.timings else f"{'-':>7}"
+                           for phase in PHASES)
+        total = f"{result.total_ms:>7.1f}" if result.total_ms is not None else f"{'-':>7}"
+        print(f"{result.name[:32]:<32} {mark:<5} {result.status or '-':>4} {timings} {total}  {result.detail}")
+    failed = sum(1 for result in results if not result.ok)
+    print(f"\nПроверок: {len(results)}, с ошибкой: {failed}, время: {elapsed * 1000:.0f} мс (этапы в мс)")
+
+
+def run_diagnostics(config: Dict, checks: Tuple[str, ...] = CHECKS, timeout: float = DEFAULT_TIMEOUT,
+                    output: str = 'table') -> int:
+    """
+    Запуск диагностики и вывод отчета
+
+    Проверки выполняются одновременно, каждая не дольше timeout (проверки Avito после
+    получения токена - еще не дольше timeout), поэтому недоступный хост не задерживает остальные.
+
+    Args:
+        config: Конфигурация форвардера
+        checks: Группы проверок из CHECKS
+        timeout: Предельное время одной проверки в секундах
+        output: 'table' или 'json'
+
+    Returns:
+        int: Код завершения: 0 - все проверки прошли, 1 - есть ошибки (для healthcheck контейнера)
+    """
+    started = time.perf_counter()
+    results = asyncio.run(Diagnostics(config, checks, timeout).run())
+    elapsed = time.perf_counter() - started
+    ok = all(result.ok for result in results)
+    if output == 'json':
+        print(json.dumps({'ok': ok, 'elapsed_ms': round(elapsed * 1000, 1),
+                          'results': [asdict(result) for result in results]}, ensure_ascii=False, indent=2))
+    else:
+        print_report(results, elapsed)
+    return 0 if ok else 1
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Режим дайджеста: упаковка многих сообщений Avito в минимум сообщений Telegram
+"""
+
+import html
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+# Лимит длины текста сообщения Telegram
+TELEGRAM_MAX_LENGTH = 4096
+
+_TOKEN_RE = re.compile(r'<[^>]*>|&#?\w+;|[^<&]+|[<&]')
+_TAG_NAME_RE = re.compile(r'</?\s*([a-zA-Z0-9-]+)')
+
+
+def split_html(text: str, limit: int = TELEGRAM_MAX_LENGTH) -> List[str]:
+    """
+    Разбиение HTML текста Telegram на части не длиннее limit
+
+    Теги и HTML сущности (&amp; и т.п.) не разрываются, открытые теги закрываются
+    в конце части и открываются заново в начале следующей. По возможности текст
+    режется по переводу строки или пробелу.
+
+    Args:
+        text: HTML текст
+        limit: Максимальная длина части
+
+    Returns:
+        List[str]: Части текста
+    """
+    if len(text) <= limit:
+        return [text]
+
+    chunks: List[str] = []
+    current = ''
+    stack: List[Tuple[str, str]] = []  # (имя тега, открывающий тег)
+
+    def opening() -> str:
+        return ''.join(tag for _, tag in stack)
+
+    def closing() -> str:
+        return ''.join(f'</{name}>' for name, _ in reversed(stack))
+
+    def flush():
+        nonlocal current
+        chunk = current + closing()
+        if chunk.strip():
+            chunks.append(chunk)
+        current = opening()
+
+    for token in _TOKEN_RE.findall(text):
+        if token.startswith('<') and len(token) > 1 and token.endswith('>'):
+            match = _TAG_NAME_RE.match(token)
+            name = match.group(1).lower() if match else ''
+            if token.startswith('</'):
+                if stack and stack[-1][0] == name:
+                    stack.pop()
+                current += token
+            else:
+                if len(current) + len(token) + len(closing()) + len(name) + 3 > limit:
+                    flush()
+                current += token
+                stack.append((name, token))
+            continue
+
+        if token.startswith('&') and token.endswith(';') or len(token) == 1:
+            # Сущность или одиночный символ - неделимы
+            if len(current) + len(token) + len(closing()) > limit:
+                flush()
+            current += token
+            continue
+
+        # Обычный текст - режем по свободному месту
+        while token:
+            room = limit - len(current) - len(closing())
+            if len(token) <= room:
+                current += token
+                break
+            if room <= 0:
+                flush()
+                continue
+            piece = token[:room]
+            cut = max(piece.rfind('\n'), piece.rfind(' '))
+            if cut <= 0 and current != opening() and len(token) <= limit - len(opening()) - len(closing()):
+                # Короткое слово целиком переносится в следующую часть
+                flush()
+                continue
+            if cut <= 0 or cut < room // 2:
+                cut = room
+            current += token[:cut]
+            token = token[cut:].lstrip(' ') if cut < room else token[cut:]
+            flush()
+
+    if current and current != opening():
+        chunks.append(current + closing())
+    return chunks
+
+
+def _format_time(timestamp) -> str:
+    """Время сообщения Avito (unix time) в виде ЧЧ:ММ"""
+    try:
+        return datetime.fromtimestamp(float(timestamp)).strftime('%H:%M')
+    except (TypeError, ValueError, OverflowError, OSError):
+        return ''
+
+
+class DigestBuilder:
+    """Накопление сообщений по объявлению или чату и упаковка в сообщения Telegram"""
+
+    def __init__(self, group_by: str = 'ad', max_wait: float = 0, max_messages: int = 50,
+                 max_length: int = TELEGRAM_MAX_LENGTH):
+        """
+        Args:
+            group_by: 'ad' - группировать по объявлению, 'chat' - по чату Avito
+            max_wait: Сколько секунд копить сообщения группы (0 - отправлять в конце каждого цикла)
+            max_messages: Сколько сообщений группы отправлять сразу, не дожидаясь max_wait
+            max_length: Лимит длины одного сообщения Telegram
+        """
+        self.group_by = group_by
+        self.max_wait = max_wait
+        self.max_messages = max_messages
+        self.max_length = max_length
+        # ключ группы -> {'title', 'messages', 'started'}
+        self._groups: 'OrderedDict[str, Dict]' = OrderedDict()
+
+    def _group_key(self, message: Dict) -> Tuple[str, str]:
+        if self.group_by == 'chat':
+            return str(message.get('chat_id')), message.get('ad_title', 'Неизвестно')
+        title = message.get('ad_title', 'Неизвестно')
+        return title, title
+
+    def add(self, message: Dict) -> List[Tuple[List[Dict], str]]:
+        """
+        Добавление сообщения
+
+        Args:
+            message: Сообщение Avito
+
+        Returns:
+            List[Tuple[List[Dict], str]]: Готовые к отправке тексты, если группа набрала max_messages
+        """
+        key, title = self._group_key(message)
+        group = self._groups.get(key)
+        if group is None:
+            group = {'title': title, 'messages': [], 'started': time.monotonic()}
+            self._groups[key] = group
+        group['messages'].append(message)
+
+        if len(group['messages']) >= self.max_messages:
+            del self._groups[key]
+            return self._pack([group])
+        return []
+
+    def flush(self, force: bool = False) -> List[Tuple[List[Dict], str]]:
+        """
+        Упаковка групп, которые ждут дольше max_wait
+
+        Args:
+            force: Упаковать все группы независимо от времени
+
+        Returns:
+            List[Tuple[List[Dict], str]]: Пары (сообщения Avito, текст Telegram)
+        """
+        now = time.monotonic()
+        ready = []
+        for key in list(self._groups):
+            group = self._groups[key]
+            if force or self.max_wait <= 0 or now - group['started'] >= self.max_wait:
+                ready.append(self._groups.pop(key))
+        return self._pack(ready)
+
+    def pending_count(self) -> int:
+        """Количество сообщений, ожидающих упаковки"""
+        return sum(len(group['messages']) for group in self._groups.values())
+
+    def pending_ids(self) -> set:
+        """ID сообщений, ожидающих упаковки"""
+        return {message.get('id') for group in self._groups.values() for message in group['messages']}
+
+    def _format_entry(self, message: Dict) -> str:
+        sender = html.escape(str(message.get('sender') or 'Неизвестно'))
+        text = html.escape(message.get('text') or 'Пустое сообщение')
+        entry_time = _format_time(message.get('timestamp'))
+        prefix = f"👤 <b>{sender}</b>" + (f" · {entry_time}" if entry_time else '')
+        return f"{prefix}\n{text}\n\n"
+
+    def _format_header(self, title: str, count: int, continued: bool = False) -> str:
+        suffix = ' (продолжение)' if continued else ''
+        return (f"📬 <b>Новые сообщения с Avito: {count}</b>{suffix}\n"
+                f"📋 <b>Объявление:</b> {html.escape(title)}\n\n")
+
+    def _pack(self, groups: List[Dict]) -> List[Tuple[List[Dict], str]]:
+        """Упаковка групп в минимальное число сообщений не длиннее max_length"""
+        packed: List[Tuple[List[Dict], str]] = []
+        current_text = ''
+        current_messages: List[Dict] = []
+
+        def emit():
+            nonlocal current_text, current_messages
+            if current_messages:
+                packed.append((current_messages, current_text.rstrip('\n')))
+            current_text = ''
+            current_messages = []
+
+        for group in groups:
+            count = len(group['messages'])
+            header = self._format_header(group['title'], count)
+            continued_header = self._format_header(group['title'], count, continued=True)
+            in_current = False  # заголовок группы уже есть в текущем сообщении
+            started = False     # часть группы уже упакована
+
+            for message in group['messages']:
+                entry = self._format_entry(message)
+                prefix = '' if in_current else (continued_header if started else header)
+                if len(current_text) + len(prefix) + len(entry) <= self.max_length:
+                    current_text += prefix + entry
+                    current_messages.append(message)
+                    in_current = started = True
+                    continue
+
+                emit()
+                prefix = continued_header if started else header
+                started = True
+                if len(prefix) + len(entry) <= self.max_length:
+                    current_text = prefix + entry
+                    current_messages = [message]
+                    in_current = True
+                    continue
+
+                # Одно сообщение длиннее лимита - режем с сохранением HTML разметки
+                for part in split_html(prefix + entry, self.max_length):
+                    packed.append(([message], part.rstrip('\n')))
+                in_current = False
+        emit()
+        return packed
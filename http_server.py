@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Минимальный asyncio HTTP сервер (только стандартная библиотека) для webhook и служебных endpoint
+"""
+
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер тела запроса
+MAX_BODY_SIZE = 1024 * 1024
+
+REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+
+class PayloadTooLarge(Exception):
+    """Тело запроса больше MAX_BODY_SIZE"""
+
+
+class Request:
+    """Входящий HTTP запрос"""
+
+    def __init__(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+
+# Ответ обработчика: (статус, заголовки, тело)
+Response = Tuple[int, Dict[str, str], bytes]
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+def json_response(status: int, payload) -> Response:
+    """Ответ в формате JSON"""
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    return status, {'Content-Type': 'application/json; charset=utf-8'}, body
+
+
+def text_response(status: int, text: str, content_type: str = 'text/plain; charset=utf-8') -> Response:
+    """Текстовый ответ"""
+    return status, {'Content-Type': content_type}, text.encode('utf-8')
+
+
+class AsyncHttpServer:
+    """HTTP/1.1 сервер на asyncio streams с маршрутизацией по (метод, путь)"""
+
+    def __init__(self, host: str = '0.0.0.0', port: int = 8080):
+        """
+        Args:
+            host: Адрес для прослушивания
+            port: Порт (0 - выбрать свободный)
+        """
+        self.host = host
+        self.port = port
+        self._routes: Dict[Tuple[str, str], Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def add_route(self, method: str, path: str, handler: Handler):
+        """
+        Регистрация обработчика
+
+        Args:
+            method: HTTP метод
+            path: Путь без query string
+            handler: async функция, принимающая Request и возвращающая (статус, заголовки, тело)
+        """
+        self._routes[(method.upper(), path)] = handler
+
+    async def start(self):
+        """Запуск сервера"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        sockname = self._server.sockets[0].getsockname()
+        self.port = sockname[1]
+        logger.info(f"HTTP сервер запущен на {self.host}:{self.port}")
+
+    async def stop(self):
+        """Остановка сервера"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        """
+        Чтение одного запроса
+
+        Raises:
+            PayloadTooLarge: Тело больше MAX_BODY_SIZE
+            ValueError: Некорректная строка запроса или Content-Length
+        """
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.decode('latin-1').rstrip('\r\n').split(' ')
+        if len(parts) != 3 or not parts[0] or not parts[1]:
+            raise ValueError('malformed request line')
+        method, target, _ = parts
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length') or 0)
+        if length < 0:
+            raise ValueError('negative content-length')
+        if length > MAX_BODY_SIZE:
+            raise PayloadTooLarge()
+        body = await reader.readexactly(length) if length else b''
+        return Request(method.upper(), target, headers, body)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), timeout=30)
+                except PayloadTooLarge:
+                    await self._write(writer, *text_response(413, 'payload too large'), keep_alive=False)
+                    return
+                except ValueError:
+                    await self._write(writer, *text_response(400, 'bad request'), keep_alive=False)
+                    return
+                if request is None:
+                    return
+
+                handler = self._routes.get((request.method, request.path))
+                if handler is None:
+                    allowed = any(path == request.path for _, path in self._routes)
+                    response = text_response(405 if allowed else 404, 'not found')
+                else:
+                    try:
+                        response = await handler(request)
+                    except Exception as e:
+                        logger.error(f"Ошибка обработки запроса {request.method} {request.path}: {e}")
+                        response = text_response(500, 'internal error')
+
+                keep_alive = request.headers.get('connection', '').lower() != 'close'
+                await self._write(writer, *response, keep_alive=keep_alive)
+                if not keep_alive:
+                    return
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            return
+        except Exception as e:
+            logger.error(f"Ошибка HTTP соединения: {e}")
+        finally:
+            writer.close()
+
+    async def _write(self, writer: asyncio.StreamWriter, status: int, headers: Dict[str, str],
+                     body: bytes, keep_alive: bool = True):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}"]
+        for name, value in headers.items():
+            lines.append(f"{name}: {value}")
+        lines.append(f"Content-Length: {len(body)}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
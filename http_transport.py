@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общий HTTP транспорт: пул keep-alive соединений, таймауты и повторы для Avito и Telegram
+"""
+
+import logging
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Значения по умолчанию для секции "http" в config.json
+DEFAULT_HTTP_CONFIG = {
+    'pool_size': 10,
+    'connect_timeout': 5,
+    'read_timeout': 30,
+    'retries': 3,
+    'backoff_factor': 0.5,
+    'status_forcelist': [429, 500, 502, 503, 504],
+    'retry_methods': ['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']
+}
+
+
+class HttpTransport:
+    """Пул requests.Session по хостам с общими таймаутами и политикой повторов"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        Инициализация транспорта
+
+        Args:
+            config: Секция "http" из config.json (все ключи необязательны)
+        """
+        self.config = {**DEFAULT_HTTP_CONFIG, **(config or {})}
+        self.timeout = (self.config['connect_timeout'], self.config['read_timeout'])
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def _build_retry(self) -> Retry:
+        """Политика повторов urllib3 с экспоненциальной задержкой"""
+        return Retry(
+            total=self.config['retries'],
+            connect=self.config['retries'],
+            read=self.config['retries'],
+            status=self.config['retries'],
+            backoff_factor=self.config['backoff_factor'],
+            status_forcelist=self.config['status_forcelist'],
+            allowed_methods=frozenset(m.upper() for m in self.config['retry_methods']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+
+    def _create_session(self) -> requests.Session:
+        """Создание сессии с пулом соединений нужного размера"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.config['pool_size'],
+            max_retries=self._build_retry()
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def session_for(self, url: str) -> requests.Session:
+        """
+        Сессия для хоста из URL (создается при первом обращении)
+
+        Args:
+            url: Адрес запроса
+
+        Returns:
+            requests.Session: Сессия этого хоста
+        """
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = self._create_session()
+                    self._sessions[host] = session
+                    logger.debug(f"Создана HTTP сессия для {host}")
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        HTTP запрос через пул соединений хоста
+
+        Args:
+            method: HTTP метод
+            url: Адрес запроса
+            **kwargs: Параметры requests (timeout подставляется по умолчанию)
+
+        Returns:
+            requests.Response: Ответ сервера
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session_for(url).request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET запрос"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """POST запрос"""
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        """Закрытие всех сессий"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Необязательная настройка логирования: запись в фоновом потоке (QueueHandler/QueueListener),
+ротация файла, JSON формат и ограничение частоты записей по этапам
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from tracing import current_span
+
+DEFAULT_LOGGING_CONFIG = {
+    'format': 'text',
+    'level': 'INFO',
+    'file': 'avito_forwarder.log',
+    'max_bytes': 10 * 1024 * 1024,
+    'backup_count': 5,
+    'rotate_when': None,
+    'console': True,
+    'queue_size': 10000,
+    'sampling': {}
+}
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Поля LogRecord, которые не переносятся в JSON как дополнительные (extra)
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - один JSON объект: время, уровень, этап (logger), сообщение, трасса и поля extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'stage': getattr(record, 'stage', record.name),
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and key != 'stage':
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class StageSampler(logging.Filter):
+    """
+    Ограничение частоты записей ниже WARNING по этапам (имя logger или extra={'stage': ...})
+
+    Для каждого этапа - token bucket на rate записей в секунду. Пропущенные записи не теряются
+    бесследно: их количество добавляется полем dropped к следующей записи этапа.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        """
+        Args:
+            rates: {этап: записей в секунду}, ключ "default" - для остальных этапов (0 - без ограничения)
+        """
+        super().__init__()
+        self.rates = {stage: float(rate) for stage, rate in rates.items()}
+        self._buckets: Dict[str, List[float]] = {}
+        self._dropped: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        stage = getattr(record, 'stage', record.name)
+        rate = self.rates.get(stage, self.rates.get('default', 0))
+        if not rate:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(stage)
+            if bucket is None:
+                # [доступные записи, время последнего пополнения]; запас - одна секунда
+                bucket = self._buckets[stage] = [rate, now]
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                self._dropped[stage] = self._dropped.get(stage, 0) + 1
+                return False
+            bucket[0] -= 1
+            dropped = self._dropped.pop(stage, 0)
+        if dropped:
+            record.dropped = dropped
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Постановка записи в очередь без форматирования в вызывающем потоке
+
+    Сообщение (msg % args) собирается в потоке QueueListener. При переполнении очереди запись
+    отбрасывается, а не задерживает пересылку.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Контекст трассировки доступен только в потоке вызова - запоминаем его сразу
+        current = current_span()
+        if current is not None:
+            record.trace_id = current.trace_id
+            record.span_id = current.span_id
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _BlockingSentinelListener(logging.handlers.QueueListener):
+    """QueueListener, который при остановке дожидается места в заполненной очереди"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class LoggingPipeline:
+    """Настроенные обработчики логов и фоновый поток записи"""
+
+    def __init__(self, listener: logging.handlers.QueueListener, queue_handler: NonBlockingQueueHandler):
+        self.listener = listener
+        self.queue_handler = queue_handler
+
+    def stop(self):
+        """Запись оставшихся в очереди сообщений и остановка фонового потока"""
+        logging.getLogger().removeHandler(self.queue_handler)
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        if self.queue_handler.dropped:
+            logging.getLogger(__name__).warning(
+                "Очередь логов была переполнена, отброшено записей: %s", self.queue_handler.dropped)
+
+
+def build_handlers(config: Dict) -> List[logging.Handler]:
+    """
+    Обработчики записи: файл с ротацией по размеру или по времени и консоль
+
+    Args:
+        config: Секция logging (с умолчаниями DEFAULT_LOGGING_CONFIG)
+
+    Returns:
+        List[logging.Handler]: Обработчики с выбранным форматом
+    """
+    formatter = JsonFormatter() if config['format'] == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers: List[logging.Handler] = []
+    if config['file']:
+        if config['rotate_when']:
+            # Например "midnight" или "H" - см. TimedRotatingFileHandler
+            file_handler = logging.handlers.TimedRotatingFileHandler(
+                config['file'], when=config['rotate_when'], backupCount=config['backup_count'],
+                encoding='utf-8')
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(
+                config['file'], maxBytes=config['max_bytes'] or 0, backupCount=config['backup_count'],
+                encoding='utf-8')
+        handlers.append(file_handler)
+    if config['console']:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging(logging_config: Optional[Dict]) -> Optional[LoggingPipeline]:
+    """
+    Замена обработчиков корневого logger на запись через очередь в фоновом потоке
+
+    Без секции logging в конфигурации ничего не меняется.
+
+    Args:
+        logging_config: Секция logging конфигурации, например
+            {"format": "json", "max_bytes": 10485760, "backup_count": 5,
+             "sampling": {"default": 50, "telegram_sender": 5}}
+
+    Returns:
+        Optional[LoggingPipeline]: Настроенный конвейер (его нужно остановить при выходе) или None
+    """
+    if not logging_config:
+        return None
+    config = {**DEFAULT_LOGGING_CONFIG, **logging_config}
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+    log_queue: queue.Queue = queue.Queue(maxsize=max(0, int(config['queue_size'])))
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    if config['sampling']:
+        queue_handler.addFilter(StageSampler(config['sampling']))
+    listener = _BlockingSentinelListener(log_queue, *build_handlers(config), respect_handler_level=True)
+
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, str(config['level']).upper(), logging.INFO))
+    listener.start()
+    return LoggingPipeline(listener, queue_handler)
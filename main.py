@@ -4,15 +4,38 @@
 Программа для отправки сообщений с Avito на почту и в Telegram
 """
 
-import requests
+import argparse
+import hashlib
 import json
 import logging
+import sys
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
 import time
+import asyncio
+import heapq
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from async_engine import AsyncAvitoClient, AsyncTelegramSender
+from async_http import AsyncHttpClient
 from avito_client import AvitoClient
+from coordination import LeaseCoordinator
+from delivery_queue import DeliveryQueue, DeliveryWorker
+from diagnostics import CHECKS, DEFAULT_TIMEOUT, run_diagnostics
+from digest import DigestBuilder
+from http_server import AsyncHttpServer
+from http_transport import HttpTransport
+from log_setup import configure_logging
+from metrics import (CYCLE_SECONDS, DEDUP_SIZE, LAST_SUCCESS, MESSAGES_FORWARDED, MESSAGES_RECEIVED,
+                     QUEUE_DEPTH, MetricsEndpoint, MetricsServer)
+from models import AvitoMessage
+from rate_limiter import TelegramRateLimiter
+from scheduler import AdaptiveScheduler
+from telegram_sender import DeliveryReport, TelegramSender
+from templates import MessageTemplate, build_template
+from tracing import TRACER, configure_tracing, span
+from webhook_server import AvitoWebhookReceiver
 
-# Настройка логирования
+# Настройка логирования (секция logging в config.json заменяет ее при запуске)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -24,22 +47,236 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def build_telegram_sender(telegram_config: Dict, transport: HttpTransport) -> TelegramSender:
+    """
+    Создание отправителя Telegram с ограничением частоты
+    
+    Args:
+        telegram_config: Секция telegram конфигурации
+        transport: HTTP транспорт
+        
+    Returns:
+        TelegramSender: Отправитель
+    """
+    chat_ids = telegram_config.get('chat_ids', [])
+    if not chat_ids and telegram_config.get('chat_id'):
+        chat_ids = [telegram_config.get('chat_id')]
+    
+    rate_limit = telegram_config.get('rate_limit', {})
+    return TelegramSender(
+        telegram_config.get('bot_token'),
+        chat_ids,
+        transport,
+        api_url=telegram_config.get('api_url', 'https://api.telegram.org'),
+        workers=telegram_config.get('workers', 4),
+        parse_mode=telegram_parse_mode(telegram_config),
+        rate_limiter=build_rate_limiter(rate_limit),
+        max_retries=rate_limit.get('max_retries', 5)
+    )
+
+
+def telegram_parse_mode(telegram_config: Dict) -> str:
+    """
+    Режим разметки уведомлений Telegram
+    
+    Дайджест формируется в HTML, поэтому при включенном дайджесте всегда используется HTML.
+    
+    Args:
+        telegram_config: Секция telegram конфигурации
+        
+    Returns:
+        str: HTML или MarkdownV2
+    """
+    if telegram_config.get('digest', {}).get('enabled'):
+        return 'HTML'
+    return telegram_config.get('parse_mode', 'HTML')
+
+
+def build_rate_limiter(rate_limit: Dict) -> TelegramRateLimiter:
+    """
+    Создание ограничителя частоты Telegram
+    
+    Args:
+        rate_limit: Секция telegram.rate_limit конфигурации
+        
+    Returns:
+        TelegramRateLimiter: Ограничитель
+    """
+    return TelegramRateLimiter(
+        global_per_second=rate_limit.get('global_per_second', 30),
+        per_chat_per_second=rate_limit.get('per_chat_per_second', 1),
+        per_chat_burst=rate_limit.get('per_chat_burst', 1)
+    )
+
+
+def build_delivery(queue_config: Dict, telegram_sender: TelegramSender) -> Tuple[Optional[DeliveryQueue], Optional[DeliveryWorker]]:
+    """
+    Создание постоянной очереди уведомлений, если она включена
+    
+    Args:
+        queue_config: Секция delivery_queue конфигурации
+        telegram_sender: Отправитель Telegram
+        
+    Returns:
+        Tuple: Очередь и обработчик очереди (или None, None)
+    """
+    if not queue_config.get('enabled'):
+        return None, None
+    
+    delivery_queue = DeliveryQueue(
+        path=queue_config.get('path', 'outbox.db'),
+        max_attempts=queue_config.get('max_attempts', 8),
+        base_delay=queue_config.get('base_delay', 5),
+        max_delay=queue_config.get('max_delay', 3600),
+        lease=queue_config.get('lease', 120)
+    )
+    delivery_worker = DeliveryWorker(
+        delivery_queue,
+        telegram_sender,
+        batch_size=queue_config.get('batch_size', 20)
+    )
+    for state in ('pending', 'inflight', 'dead'):
+        QUEUE_DEPTH.set_function(lambda state=state: delivery_queue.stats()[state], state=state)
+    return delivery_queue, delivery_worker
+
+
+def start_metrics_server(metrics_config: Dict, forwarders: List['AvitoMessageForwarder'],
+                         coordinator: Optional[LeaseCoordinator] = None) -> Optional[MetricsServer]:
+    """
+    Запуск HTTP сервера /metrics и /healthz, если он включен
+    
+    Args:
+        metrics_config: Секция metrics конфигурации
+        forwarders: Аккаунты, состояние которых показывает /healthz
+        coordinator: Координатор экземпляров (в /healthz попадают только арендованные аккаунты)
+        
+    Returns:
+        Optional[MetricsServer]: Запущенный сервер или None
+    """
+    if not metrics_config.get('enabled'):
+        return None
+    
+    endpoint = MetricsEndpoint(
+        health=lambda: {forwarder.name: forwarder.stats['last_success'] for forwarder in forwarders
+                        if coordinator is None or coordinator.owns(forwarder.name)},
+        max_staleness=metrics_config.get('max_staleness', 900)
+    )
+    return MetricsServer(endpoint, metrics_config.get('host', '0.0.0.0'), metrics_config.get('port', 9100)).start()
+
+
+class MessageAcks:
+    """
+    Подтверждение полученных с Avito сообщений после доставки уведомлений
+
+    Сообщение отмечается обработанным, только если приняты все уведомления, в которые оно вошло
+    (отправлены или поставлены в очередь для всех chat_id). Остальные освобождаются и будут получены
+    снова; сообщения, ожидающие в дайджесте, остаются зарезервированными до следующих проходов.
+    """
+
+    def __init__(self, avito_client: AvitoClient):
+        """
+        Args:
+            avito_client: Клиент Avito, выдавший сообщения (iter_messages(auto_finish=False))
+        """
+        self.avito_client = avito_client
+        # ID полученного сообщения -> принято ли каждое уведомление с ним (None - еще не было уведомления)
+        self._outcomes: Dict = {}
+        # ID полученного сообщения -> ID чата Avito
+        self._chats: Dict = {}
+
+    def take(self, message: Dict):
+        """Сообщение получено и ждет подтверждения"""
+        self._outcomes.setdefault(message.get('id'), None)
+        self._chats[message.get('id')] = message.get('chat_id')
+
+    def settle(self, messages: List[Dict], accepted: bool):
+        """Исход уведомления для вошедших в него сообщений"""
+        for message in messages:
+            outcome = self._outcomes.get(message.get('id'))
+            self._outcomes[message.get('id')] = accepted if outcome is None else outcome and accepted
+            self._chats[message.get('id')] = message.get('chat_id')
+
+    def delivered_chats(self) -> Set[str]:
+        """
+        Чаты Avito, которые можно отметить прочитанными: все полученные сообщения чата приняты
+
+        Чат с неотправленным, неотформатированным или ожидающим в дайджесте сообщением не отмечается,
+        чтобы оно не осталось незамеченным ни в Telegram, ни в Avito.
+        """
+        delivered: Dict[str, bool] = {}
+        for message_id, chat_id in self._chats.items():
+            delivered[chat_id] = delivered.get(chat_id, True) and bool(self._outcomes.get(message_id))
+        return {chat_id for chat_id, accepted in delivered.items() if accepted}
+
+    def finish(self, held=()) -> int:
+        """
+        Завершение прохода: принятые сообщения отмечаются обработанными, остальные освобождаются
+
+        Args:
+            held: ID сообщений, которые ждут в дайджесте и еще не вошли ни в одно уведомление
+
+        Returns:
+            int: Количество принятых сообщений
+        """
+        accepted_count = 0
+        for message_id in list(self._outcomes):
+            outcome = self._outcomes[message_id]
+            if outcome is None and message_id in held:
+                continue
+            del self._outcomes[message_id]
+            self._chats.pop(message_id, None)
+            self.avito_client.finish_message(message_id, bool(outcome))
+            accepted_count += bool(outcome)
+        return accepted_count
+
+
 class AvitoMessageForwarder:
     """Класс для пересылки сообщений с Avito в Telegram"""
     
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, transport: Optional[HttpTransport] = None,
+                 telegram_sender: Optional[TelegramSender] = None,
+                 delivery: Optional[Tuple[DeliveryQueue, DeliveryWorker]] = None,
+                 name: str = 'default'):
         """
         Инициализация с конфигурацией
         
         Args:
-            config: Словарь с настройками (telegram, avito)
+            config: Словарь с настройками (telegram, avito, http)
+            transport: Общий HTTP транспорт (для нескольких аккаунтов в одном процессе)
+            telegram_sender: Общий отправитель Telegram
+            delivery: Общие очередь уведомлений и обработчик очереди
+            name: Имя аккаунта для логов и статистики
         """
+        self._configure(config, name)
+        
+        # Общий пул HTTP соединений для Avito и Telegram
+        self.transport = transport or HttpTransport(config.get('http', {}))
+        self._owns_shared = transport is None
+        
+        # Инициализируем клиент Avito
+        self.avito_client = AvitoClient(self.avito_config, transport=self.transport)
+        self.acks = MessageAcks(self.avito_client)
+        
+        # Параллельная отправка: разные chat_id обслуживаются одновременно, порядок в чате сохраняется
+        self.telegram_sender = telegram_sender or build_telegram_sender(self.telegram_config, self.transport)
+        
+        # Постоянная очередь уведомлений: опрос Avito не ждет Telegram, сообщения не теряются
+        self.delivery_queue, self.delivery_worker = delivery or build_delivery(
+            config.get('delivery_queue', {}), self.telegram_sender)
+        self._register_metrics()
+    
+    def _register_metrics(self):
+        """Метрики, которые вычисляются при запросе /metrics"""
+        DEDUP_SIZE.set_function(lambda: len(self.avito_client.processed_messages), account=self.name)
+    
+    def _configure(self, config: Dict, name: str):
+        """Настройки, не зависящие от способа работы с сетью (общие для sync и async режимов)"""
         self.config = config
+        self.name = name
         self.telegram_config = config.get('telegram', {})
         self.avito_config = config.get('avito', {})
-        
-        # Инициализируем клиент Avito
-        self.avito_client = AvitoClient(self.avito_config)
+        # Отмечать чаты Avito прочитанными после доставки уведомления
+        self.mark_read = bool(self.avito_config.get('mark_read', False))
         
         # Telegram настройки
         self.bot_token = self.telegram_config.get('bot_token')
@@ -48,60 +285,76 @@ class AvitoMessageForwarder:
         if not self.chat_ids and self.telegram_config.get('chat_id'):
             self.chat_ids = [self.telegram_config.get('chat_id')]
         
+        # Шаблон уведомлений разбирается один раз (ошибка в шаблоне видна сразу при запуске)
+        parse_mode = telegram_parse_mode(self.telegram_config)
+        if parse_mode != self.telegram_config.get('parse_mode', 'HTML'):
+            logger.warning(f"Дайджест формируется в HTML, parse_mode "
+                           f"{self.telegram_config.get('parse_mode')} не используется")
+        self.template: MessageTemplate = build_template({**self.telegram_config, 'parse_mode': parse_mode})
+        
+        # Режим дайджеста: несколько сообщений Avito в одном сообщении Telegram
+        digest_config = self.telegram_config.get('digest', {})
+        self.digest = None
+        if digest_config.get('enabled'):
+            self.digest = DigestBuilder(
+                group_by=digest_config.get('group_by', 'ad'),
+                max_wait=digest_config.get('max_wait', 0),
+                max_messages=digest_config.get('max_messages', 50)
+            )
+        
+        # Адаптивный интервал опроса (чаще после активности, реже в тишине и при ошибках)
+        schedule_config = config.get('schedule', {})
+        self.scheduler = None
+        if schedule_config.get('adaptive', True):
+            self.scheduler = AdaptiveScheduler(
+                min_interval=schedule_config.get('min_interval', 30),
+                max_interval=schedule_config.get('max_interval', 300),
+                backoff_factor=schedule_config.get('backoff_factor', 2.0),
+                jitter=schedule_config.get('jitter', 0.1),
+                error_interval=schedule_config.get('error_interval', 60),
+                max_error_interval=schedule_config.get('max_error_interval', 900),
+                requests_per_hour=schedule_config.get('requests_per_hour')
+            )
+        self._cycle_new_messages = 0
+        self.check_interval = 300
+        self.stats = {'cycles': 0, 'new_messages': 0, 'failed_cycles': 0,
+                      'last_cycle_seconds': None, 'last_success': None}
 
-    
-    def send_telegram_message(self, message: str) -> bool:
+    def send_telegram_message(self, message: str) -> DeliveryReport:
         """
-        Отправка сообщения в Telegram на все настроенные chat_id
+        Отправка сообщения в Telegram на все настроенные chat_id (параллельно)
         
         Args:
             message: Текст сообщения
             
         Returns:
-            bool: Успешность отправки (True если хотя бы одно сообщение отправлено)
+            DeliveryReport: Результаты по каждому chat_id (истина, если хотя бы одно сообщение отправлено)
         """
         if not self.chat_ids:
             logger.error("Не настроены chat_ids для Telegram")
-            return False
-            
-        success_count = 0
-        total_count = len(self.chat_ids)
-        
-        for chat_id in self.chat_ids:
-            try:
-                url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
-                data = {
-                    'chat_id': chat_id,
-                    'text': message,
-                    'parse_mode': 'HTML'
-                }
-                
-                response = requests.post(url, data=data)
-                response.raise_for_status()
-                
-                logger.info(f"Telegram сообщение отправлено успешно в chat_id: {chat_id}")
-                success_count += 1
-                
-            except Exception as e:
-                logger.error(f"Ошибка отправки Telegram сообщения в chat_id {chat_id}: {e}")
+            return DeliveryReport()
         
-        if success_count > 0:
-            logger.info(f"Telegram сообщения отправлены в {success_count} из {total_count} чатов")
-            return True
+        report = self.telegram_sender.submit(message, self.chat_ids).wait()
+        self._log_delivery(report)
+        return report
+    
+    def _log_delivery(self, report: DeliveryReport):
+        """Итоговая запись в лог по результатам отправки"""
+        if report:
+            logger.info("Telegram сообщения отправлены в %s из %s чатов", report.success_count, len(report.results))
         else:
             logger.error("Не удалось отправить Telegram сообщения ни в один чат")
-            return False
     
-    def get_avito_messages(self) -> List[Dict]:
+    def get_avito_messages(self) -> List[AvitoMessage]:
         """
         Получение сообщений с Avito
         
         Returns:
-            List[Dict]: Список сообщений
+            List[AvitoMessage]: Список сообщений
         """
         try:
             messages = self.avito_client.get_messages()
-            logger.info(f"Получено {len(messages)} сообщений с Avito")
+            logger.info("Получено %s сообщений с Avito", len(messages))
             return messages
             
         except Exception as e:
@@ -110,6 +363,26 @@ class AvitoMessageForwarder:
     
 
     
+    def iter_avito_messages(self) -> Iterator[AvitoMessage]:
+        """
+        Потоковое получение сообщений с Avito
+        
+        Сообщения подтверждаются через self.acks после доставки уведомлений (см. _finish_messages).
+        
+        Yields:
+            AvitoMessage: Новое сообщение
+        """
+        try:
+            for message in self.avito_client.iter_messages(auto_finish=False):
+                self.acks.take(message)
+                self._cycle_new_messages += 1
+                MESSAGES_RECEIVED.inc(account=self.name)
+                if self.scheduler is not None:
+                    self.scheduler.observe_message(message.get('chat_id'), message.get('timestamp'))
+                yield message
+        except Exception as e:
+            logger.error(f"Ошибка получения сообщений Avito: {e}")
+    
     def format_message_for_telegram(self, avito_message: Dict) -> str:
         """
         Форматирование сообщения для Telegram
@@ -120,92 +393,874 @@ class AvitoMessageForwarder:
         Returns:
             str: Отформатированное сообщение
         """
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return self.template.render(avito_message)
+    
+    def format_messages_for_telegram(self, avito_messages: List[Dict]) -> List[str]:
+        """
+        Форматирование пачки сообщений для Telegram за один проход
         
-        message = f"""
-🔔 <b>Новое сообщение с Avito</b>
-
-📅 <b>Время:</b> {timestamp}
-👤 <b>От:</b> {avito_message.get('sender', 'Неизвестно')}
-📋 <b>Объявление:</b> {avito_message.get('ad_title', 'Неизвестно')}
-
-💬 <b>Сообщение:</b>
-{avito_message.get('text', 'Пустое сообщение')}
-
----
-<i>Отправлено автоматически</i>
-        """.strip()
+        Args:
+            avito_messages: Сообщения с Avito
+            
+        Returns:
+            List[str]: Отформатированные сообщения в том же порядке
+        """
+        return self.template.render_many(avito_messages)
+    
+    def process_messages(self) -> int:
+        """
+        Основной метод обработки сообщений
         
-        return message
+        Returns:
+            int: Количество новых сообщений с Avito
+        """
+        with span('forwarder.process_messages', account=self.name) as cycle_span:
+            new_messages = self._process_messages()
+            cycle_span.set_attribute('messages', new_messages)
+        return new_messages
     
-    def process_messages(self):
-        """Основной метод обработки сообщений"""
+    def _process_messages(self) -> int:
         logger.info("Начинаем проверку новых сообщений...")
+        self._cycle_new_messages = 0
         
-        # Получаем сообщения с Avito
-        messages = self.get_avito_messages()
+        if not self.chat_ids:
+            logger.error("Не настроены chat_ids для Telegram")
+        
+        try:
+            if self.delivery_queue is not None:
+                self._enqueue_messages()
+            else:
+                self._send_messages()
+        finally:
+            self._finish_messages()
+        return self._cycle_new_messages
+    
+    def _send_messages(self):
+        """Отправка уведомлений в Telegram с ожиданием доставки"""
+        pending = []
+        
+        # Ставим сообщения в очередь отправки по мере получения с Avito
+        for message_key, telegram_message, messages in self.iter_notifications():
+            try:
+                pending.append((messages, self.telegram_sender.submit(telegram_message, self.chat_ids)))
+            except Exception as e:
+                self.acks.settle(messages, False)
+                logger.error(f"Ошибка обработки сообщения: {e}")
         
-        if not messages:
+        if not pending:
             logger.info("Новых сообщений не найдено")
             return
         
-        logger.info(f"Найдено {len(messages)} новых сообщений")
-        
-        # Обрабатываем каждое сообщение
-        for message in messages:
-            try:
-                # Отправляем в Telegram
-                telegram_message = self.format_message_for_telegram(message)
-                telegram_sent = self.send_telegram_message(telegram_message)
-                
-                if telegram_sent:
+        # Дожидаемся доставки всех сообщений
+        delivered = 0
+        with span('forwarder.wait_delivery', notifications=len(pending)):
+            for messages, ticket in pending:
+                report = ticket.wait()
+                self._log_delivery(report)
+                self.acks.settle(messages, bool(report))
+                if report:
+                    delivered += 1
+                    MESSAGES_FORWARDED.inc(account=self.name)
                     logger.info("Сообщение успешно переслано в Telegram")
                 else:
                     logger.error("Не удалось отправить сообщение в Telegram")
-                    
+        
+        logger.info(f"Переслано {delivered} из {len(pending)} новых сообщений")
+        self._mark_read(self.acks.delivered_chats())
+    
+    def _finish_messages(self):
+        """Подтверждение сообщений прохода: непринятые будут получены снова, ожидающие в дайджесте - ждут"""
+        held = self.digest.pending_ids() if self.digest is not None else ()
+        self.acks.finish(held)
+    
+    def _mark_read(self, avito_chats):
+        """Отметка прочитанными чатов Avito, все сообщения которых доставлены (один запрос на чат)"""
+        if self.mark_read and avito_chats:
+            self.avito_client.mark_chats_read(avito_chats)
+    
+    def iter_notifications(self) -> Iterator[Tuple[str, str, List[AvitoMessage]]]:
+        """
+        Тексты уведомлений для Telegram по новым сообщениям Avito
+        
+        В режиме дайджеста сообщения группируются и упаковываются в минимум сообщений Telegram.
+        Исход каждого уведомления нужно передать в self.acks.settle; сообщения, которые не удалось
+        отформатировать, в уведомления не попадают и освобождаются в конце прохода.
+        
+        Yields:
+            Tuple[str, str, List[AvitoMessage]]: Ключ уведомления (ID сообщения или дайджеста), текст
+                и сообщения Avito, вошедшие в уведомление
+        """
+        for message in self.iter_avito_messages():
+            try:
+                if self.digest is None:
+                    with span('forwarder.format', chat_id=message.get('chat_id')):
+                        text = self.format_message_for_telegram(message)
+                    yield str(message.get('id')), text, [message]
+                else:
+                    with span('forwarder.format', chat_id=message.get('chat_id')):
+                        packed = self.digest.add(message)
+                    yield from self._digest_notifications(packed)
             except Exception as e:
-                logger.error(f"Ошибка обработки сообщения: {e}")
+                logger.error(f"Ошибка форматирования сообщения: {e}")
+        
+        if self.digest is not None:
+            yield from self._digest_notifications(self.digest.flush())
+    
+    @staticmethod
+    def _digest_notifications(packed: List[Tuple[List[Dict], str]]) -> Iterator[Tuple[str, str, List[Dict]]]:
+        """Ключи для упакованных дайджестов (по ID вошедших в них сообщений)"""
+        for messages, text in packed:
+            ids = ','.join(str(message.get('id')) for message in messages)
+            digest_key = hashlib.sha1(f"{ids}|{text}".encode('utf-8')).hexdigest()
+            yield f"digest:{digest_key}", text, messages
+    
+    def _enqueue_messages(self):
+        """Постановка новых сообщений в постоянную очередь уведомлений"""
+        queued = 0
+        for message_key, telegram_message, messages in self.iter_notifications():
+            # Уведомление принято, только если оно поставлено в очередь для каждого chat_id
+            accepted = False
+            try:
+                for chat_id in self.chat_ids:
+                    self.delivery_queue.enqueue(chat_id, telegram_message, message_key=message_key)
+                accepted = bool(self.chat_ids)
+            except Exception as e:
+                logger.error(f"Ошибка постановки сообщения в очередь: {e}")
+            self.acks.settle(messages, accepted)
+            queued += accepted
+        
+        # Сообщение в постоянной очереди будет доставлено - чат можно отметить прочитанным
+        self._mark_read(self.acks.delivered_chats())
+        
+        if not queued:
+            logger.info("Новых сообщений не найдено")
+        else:
+            logger.info(f"В очередь отправки поставлено {queued} уведомлений")
+        
+        if self.delivery_worker.is_running():
+            self.delivery_worker.notify()
+        else:
+            # Однократный запуск без фонового потока - отправляем сразу
+            self.delivery_worker.drain()
+    
+    def handle_webhook_message(self, value: Dict):
+        """
+        Немедленная пересылка сообщения, пришедшего через webhook Avito
+        
+        Args:
+            value: Поле payload.value уведомления Avito
+        """
+        message = self.avito_client.handle_webhook_message(value)
+        if message is None:
+            return
+        
+        # Сообщение отмечается обработанным только после доставки (или постановки в очередь):
+        # иначе его подберет сверка опросом
+        accepted = False
+        try:
+            accepted = self._deliver_webhook_message(message)
+        finally:
+            self.avito_client.finish_message(message.get('id'), accepted)
+        if accepted:
+            self._record_success()
+            self._mark_read([message.get('chat_id')])
+    
+    def _deliver_webhook_message(self, message: AvitoMessage) -> bool:
+        """Отправка сообщения из webhook; True, если оно доставлено или поставлено в очередь"""
+        telegram_message = self.format_message_for_telegram(message)
+        return self._deliver_notification(str(message.get('id')), telegram_message)
+    
+    def _deliver_notification(self, message_key: str, telegram_message: str) -> bool:
+        """
+        Постановка уведомления в очередь или отправка с ожиданием результата
+        
+        Args:
+            message_key: Ключ уведомления (ID сообщения или дайджеста)
+            telegram_message: Текст уведомления
+            
+        Returns:
+            bool: True, если уведомление поставлено в очередь для всех chat_id или доставлено
+        """
+        if self.delivery_queue is not None:
+            for chat_id in self.chat_ids:
+                self.delivery_queue.enqueue(chat_id, telegram_message, message_key=message_key)
+            self.delivery_worker.notify()
+            return bool(self.chat_ids)
+        
+        report = self.telegram_sender.submit(telegram_message, self.chat_ids).wait()
+        self._log_delivery(report)
+        if report:
+            MESSAGES_FORWARDED.inc(account=self.name)
+        return bool(report)
+    
+    def _flush_digest(self):
+        """
+        Отправка всех групп дайджеста, ожидающих max_wait, при остановке
+        
+        Сообщения в дайджесте зарезервированы, но не отмечены обработанными: неотправленные
+        будут получены снова после перезапуска.
+        """
+        if self.digest is None or not self.digest.pending_count():
+            return
+        logger.info(f"Отправка дайджеста перед остановкой: {self.digest.pending_count()} сообщений")
+        try:
+            for message_key, telegram_message, messages in self._digest_notifications(self.digest.flush(force=True)):
+                accepted = False
+                try:
+                    accepted = self._deliver_notification(message_key, telegram_message)
+                except Exception as e:
+                    logger.error(f"Ошибка отправки дайджеста: {e}")
+                self.acks.settle(messages, accepted)
+            self._mark_read(self.acks.delivered_chats())
+        finally:
+            self._finish_messages()
+    
+    def run_webhook(self):
+        """
+        Запуск в режиме приема webhook: сообщения пересылаются сразу после уведомления Avito,
+        а опрос API выполняется редко и только для сверки пропущенных уведомлений
+        """
+        webhook_config = self.config.get('webhook', {})
+        reconcile_interval = webhook_config.get('reconcile_interval', 3600)
+        logger.info(f"Запуск в режиме webhook (сверка опросом каждые {reconcile_interval} сек)")
+        
+        if self.delivery_worker is not None:
+            self.delivery_worker.start()
+        
+        try:
+            asyncio.run(self._serve_webhook(webhook_config, reconcile_interval))
+        except KeyboardInterrupt:
+            logger.info("Остановка программы по запросу пользователя")
+        finally:
+            self.close()
+    
+    async def _serve_webhook(self, webhook_config: Dict, reconcile_interval: float):
+        """Работа HTTP сервера и периодическая сверка опросом"""
+        loop = asyncio.get_running_loop()
+        server = AsyncHttpServer(webhook_config.get('host', '0.0.0.0'), webhook_config.get('port', 8080))
+        receiver = AvitoWebhookReceiver(
+            self.handle_webhook_message,
+            path=webhook_config.get('path', '/avito/webhook'),
+            secret=webhook_config.get('secret')
+        )
+        receiver.attach(server)
+        await server.start()
+        
+        public_url = webhook_config.get('public_url')
+        if public_url:
+            if webhook_config.get('secret'):
+                separator = '&' if '?' in public_url else '?'
+                public_url = f"{public_url}{separator}token={webhook_config['secret']}"
+            await loop.run_in_executor(None, self.avito_client.register_webhook, public_url)
+        else:
+            logger.warning("webhook.public_url не задан, webhook нужно зарегистрировать в Avito вручную")
+        
+        try:
+            while True:
+                # Сверка - обычный цикл опроса: статистика и last_success для /healthz обновляются так же
+                await loop.run_in_executor(None, self.run_cycle)
+                await asyncio.sleep(reconcile_interval)
+        finally:
+            await server.stop()
+    
+    def close(self):
+        """Остановка фоновых потоков и закрытие соединений"""
+        self._flush_digest()
+        self.avito_client.close()
+        if not self._owns_shared:
+            # Общие ресурсы закрывает владелец (MultiAccountForwarder)
+            return
+        if self.delivery_worker is not None:
+            self.delivery_worker.stop()
+        self.telegram_sender.close()
+        if self.delivery_queue is not None:
+            self.delivery_queue.close()
+        self.transport.close()
+    
+    def run_cycle(self) -> Tuple[float, str]:
+        """
+        Один цикл проверки с расчетом паузы до следующего
+        
+        Returns:
+            Tuple[float, str]: Пауза в секундах и причина
+        """
+        started = time.time()
+        stats_before = self.avito_client.get_stats()
+        try:
+            new_messages = self.process_messages()
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка: {e}")
+            return self._failed_cycle()
+        return self._finish_cycle(started, stats_before, new_messages)
+    
+    def _failed_cycle(self) -> Tuple[float, str]:
+        """Пауза после цикла, завершившегося исключением"""
+        self.stats['failed_cycles'] += 1
+        if self.scheduler is None:
+            return 60, "ошибка"  # Ждем минуту перед повторной попыткой
+        return self.scheduler.next_delay(0, 0, 1)
+    
+    def _record_success(self):
+        """Отметка успешной работы аккаунта (для /healthz и метрики last_success)"""
+        self.stats['last_success'] = time.time()
+        LAST_SUCCESS.set(self.stats['last_success'], account=self.name)
+    
+    def _finish_cycle(self, started: float, stats_before: Dict, new_messages: int) -> Tuple[float, str]:
+        """Учет статистики завершенного цикла и расчет паузы до следующего"""
+        stats_after = self.avito_client.get_stats()
+        errors = stats_after['errors'] - stats_before['errors']
+        
+        elapsed = time.time() - started
+        self.stats['cycles'] += 1
+        self.stats['new_messages'] += new_messages
+        self.stats['last_cycle_seconds'] = round(elapsed, 3)
+        CYCLE_SECONDS.observe(elapsed, account=self.name)
+        if errors:
+            self.stats['failed_cycles'] += 1
+        else:
+            self._record_success()
+        
+        if self.scheduler is None:
+            return self.check_interval, "фиксированный интервал"
+        return self.scheduler.next_delay(
+            new_messages,
+            stats_after['requests'] - stats_before['requests'],
+            errors
+        )
+    
+    def get_stats(self) -> Dict:
+        """
+        Статистика работы аккаунта
+        
+        Returns:
+            Dict: Циклы, новые сообщения, длительность цикла, запросы к API и кэш токена
+        """
+        return {'name': self.name, **self.stats, 'avito': self.avito_client.get_stats()}
     
     def run_continuous(self, check_interval: int = 300):
         """
         Запуск в режиме постоянной проверки
         
         Args:
-            check_interval: Интервал проверки в секундах (по умолчанию 5 минут)
+            check_interval: Интервал проверки в секундах (по умолчанию 5 минут).
+                В адаптивном режиме - максимальный интервал в тишине
         """
         logger.info(f"Запуск в режиме постоянной проверки (интервал: {check_interval} сек)")
+        self.configure_interval(check_interval)
+        
+        if self.delivery_worker is not None:
+            self.delivery_worker.start()
         
         while True:
             try:
-                self.process_messages()
-                time.sleep(check_interval)
+                delay, reason = self.run_cycle()
+                self._sleep_until_next(delay, reason)
             except KeyboardInterrupt:
                 logger.info("Остановка программы по запросу пользователя")
+                self.close()
                 break
+    
+    def configure_interval(self, check_interval: int):
+        """Установка базового интервала проверки"""
+        self.check_interval = check_interval
+        if self.scheduler is not None and 'max_interval' not in self.config.get('schedule', {}):
+            self.scheduler.max_interval = max(check_interval, self.scheduler.min_interval)
+    
+    @staticmethod
+    def _log_next_check(delay: float, reason: str):
+        """Запись в лог времени и причины следующей проверки"""
+        wakeup = datetime.fromtimestamp(time.time() + delay).strftime("%H:%M:%S")
+        logger.info(f"Следующая проверка в {wakeup} (через {delay:.0f} сек): {reason}")
+    
+    @classmethod
+    def _sleep_until_next(cls, delay: float, reason: str):
+        """Пауза до следующей проверки с записью в лог времени и причины"""
+        cls._log_next_check(delay, reason)
+        time.sleep(delay)
+
+
+class AsyncMessageForwarder(AvitoMessageForwarder):
+    """
+    Пересылка на asyncio: опрос Avito, отправка в Telegram и ожидание следующей проверки
+    выполняются корутинами в одном потоке с общим пулом соединений
+    
+    Тысячи чатов Avito и получателей Telegram обслуживаются конкурентно без пула потоков.
+    Постоянная очередь уведомлений и режим webhook в этом режиме не используются.
+    """
+    
+    def __init__(self, config: Dict, name: str = 'default'):
+        """
+        Инициализация с конфигурацией
+        
+        Args:
+            config: Словарь с настройками (telegram, avito, http)
+            name: Имя аккаунта для логов и статистики
+        """
+        self._configure(config, name)
+        self.http = AsyncHttpClient(config.get('http', {}))
+        self.avito_client = AsyncAvitoClient(self.avito_config, self.http)
+        self.acks = MessageAcks(self.avito_client)
+        
+        rate_limit = self.telegram_config.get('rate_limit', {})
+        self.telegram_sender = AsyncTelegramSender(
+            self.bot_token,
+            self.chat_ids,
+            self.http,
+            parse_mode=self.template.parse_mode,
+            api_url=self.telegram_config.get('api_url', 'https://api.telegram.org'),
+            rate_limiter=build_rate_limiter(rate_limit),
+            max_retries=rate_limit.get('max_retries', 5)
+        )
+        
+        self.delivery_queue = self.delivery_worker = None
+        if config.get('delivery_queue', {}).get('enabled'):
+            logger.warning("Очередь уведомлений не поддерживается в асинхронном режиме, сообщения отправляются сразу")
+        self._register_metrics()
+    
+    async def send_telegram_message(self, message: str) -> DeliveryReport:
+        """
+        Отправка сообщения в Telegram на все настроенные chat_id (одновременно)
+        
+        Args:
+            message: Текст сообщения
+            
+        Returns:
+            DeliveryReport: Результаты по каждому chat_id
+        """
+        if not self.chat_ids:
+            logger.error("Не настроены chat_ids для Telegram")
+            return DeliveryReport()
+        
+        report = await self.telegram_sender.send(message, self.chat_ids)
+        self._log_delivery(report)
+        return report
+    
+    async def iter_notifications(self) -> AsyncIterator[Tuple[str, str, List[AvitoMessage]]]:
+        """
+        Тексты уведомлений для Telegram по новым сообщениям Avito (с учетом режима дайджеста)
+        
+        Yields:
+            Tuple[str, str, List[AvitoMessage]]: Ключ уведомления, текст и вошедшие в него сообщения Avito
+        """
+        async for message in self.avito_client.iter_new_messages(auto_finish=False):
+            self.acks.take(message)
+            self._cycle_new_messages += 1
+            MESSAGES_RECEIVED.inc(account=self.name)
+            if self.scheduler is not None:
+                self.scheduler.observe_message(message.get('chat_id'), message.get('timestamp'))
+            try:
+                if self.digest is None:
+                    with span('forwarder.format', chat_id=message.get('chat_id')):
+                        text = self.format_message_for_telegram(message)
+                    yield str(message.get('id')), text, [message]
+                else:
+                    with span('forwarder.format', chat_id=message.get('chat_id')):
+                        packed = self.digest.add(message)
+                    for notification in self._digest_notifications(packed):
+                        yield notification
             except Exception as e:
-                logger.error(f"Неожиданная ошибка: {e}")
-                time.sleep(60)  # Ждем минуту перед повторной попыткой
+                logger.error(f"Ошибка форматирования сообщения: {e}")
+        
+        if self.digest is not None:
+            for notification in self._digest_notifications(self.digest.flush()):
+                yield notification
+    
+    async def process_messages(self) -> int:
+        """
+        Один проход: отправка каждого уведомления начинается сразу, не дожидаясь остальных чатов
+        
+        Returns:
+            int: Количество новых сообщений с Avito
+        """
+        with span('forwarder.process_messages', account=self.name) as cycle_span:
+            new_messages = await self._process_messages()
+            cycle_span.set_attribute('messages', new_messages)
+        return new_messages
+    
+    async def _process_messages(self) -> int:
+        logger.info("Начинаем проверку новых сообщений...")
+        self._cycle_new_messages = 0
+        
+        if not self.chat_ids:
+            logger.error("Не настроены chat_ids для Telegram")
+        
+        try:
+            await self._send_messages()
+        finally:
+            self._finish_messages()
+        return self._cycle_new_messages
+    
+    async def _send_messages(self):
+        """Отправка уведомлений: каждое начинается сразу, исходы собираются в конце прохода"""
+        pending = []
+        notification_messages = []
+        async for message_key, telegram_message, messages in self.iter_notifications():
+            pending.append(asyncio.ensure_future(self.telegram_sender.send(telegram_message, self.chat_ids)))
+            notification_messages.append(messages)
+        
+        if not pending:
+            logger.info("Новых сообщений не найдено")
+            return
+        
+        delivered = 0
+        with span('forwarder.wait_delivery', notifications=len(pending)):
+            reports = await asyncio.gather(*pending)
+        for messages, report in zip(notification_messages, reports):
+            self._log_delivery(report)
+            self.acks.settle(messages, bool(report))
+            if report:
+                delivered += 1
+                MESSAGES_FORWARDED.inc(account=self.name)
+        
+        logger.info(f"Переслано {delivered} из {len(pending)} новых сообщений")
+        await self._mark_read(self.acks.delivered_chats())
+    
+    async def run_cycle(self) -> Tuple[float, str]:
+        """
+        Один цикл проверки с расчетом паузы до следующего
+        
+        Returns:
+            Tuple[float, str]: Пауза в секундах и причина
+        """
+        started = time.time()
+        stats_before = self.avito_client.get_stats()
+        try:
+            new_messages = await self.process_messages()
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка: {e}")
+            return self._failed_cycle()
+        return self._finish_cycle(started, stats_before, new_messages)
+    
+    def run_continuous(self, check_interval: int = 300):
+        """
+        Запуск в режиме постоянной проверки на event loop
+        
+        Args:
+            check_interval: Интервал проверки в секундах (в адаптивном режиме - максимальный)
+        """
+        logger.info(f"Запуск в асинхронном режиме постоянной проверки (интервал: {check_interval} сек)")
+        self.configure_interval(check_interval)
+        try:
+            asyncio.run(self._run_forever())
+        except KeyboardInterrupt:
+            logger.info("Остановка программы по запросу пользователя")
+    
+    async def _run_forever(self):
+        try:
+            while True:
+                delay, reason = await self.run_cycle()
+                self._log_next_check(delay, reason)
+                await asyncio.sleep(delay)
+        finally:
+            await self._flush_digest()
+            self.close()
+            await self.http.close()
+    
+    async def _flush_digest(self):
+        """Отправка всех групп дайджеста, ожидающих max_wait, при остановке"""
+        if self.digest is None or not self.digest.pending_count():
+            return
+        logger.info(f"Отправка дайджеста перед остановкой: {self.digest.pending_count()} сообщений")
+        try:
+            for message_key, telegram_message, messages in self._digest_notifications(self.digest.flush(force=True)):
+                report = await self.send_telegram_message(telegram_message)
+                self.acks.settle(messages, bool(report))
+                if report:
+                    MESSAGES_FORWARDED.inc(account=self.name)
+            await self._mark_read(self.acks.delivered_chats())
+        finally:
+            self._finish_messages()
+    
+    async def _mark_read(self, avito_chats):
+        """Отметка прочитанными чатов Avito, все сообщения которых доставлены (один запрос на чат)"""
+        if self.mark_read and avito_chats:
+            await self.avito_client.mark_chats_read(avito_chats)
+    
+    def close(self):
+        """Закрытие хранилища обработанных сообщений"""
+        self.avito_client.close()
+
+
+class MultiAccountForwarder:
+    """Несколько аккаунтов Avito в одном процессе: у каждого свой клиент, кэш токена, дедупликация и расписание"""
+    
+    def __init__(self, config: Dict):
+        """
+        Инициализация
+        
+        Args:
+            config: Конфигурация со списком аккаунтов в avito_accounts
+        """
+        self.config = config
+        self.telegram_config = config.get('telegram', {})
+        
+        # Соединения, лимиты Telegram и очередь уведомлений общие для всех аккаунтов
+        self.transport = HttpTransport(config.get('http', {}))
+        self.telegram_sender = build_telegram_sender(self.telegram_config, self.transport)
+        self.delivery = build_delivery(config.get('delivery_queue', {}), self.telegram_sender)
+        
+        # Совместная работа нескольких экземпляров: аренда аккаунтов и общая дедупликация
+        coordination_config = config.get('coordination', {})
+        self.coordinator = None
+        
+        default_chat_ids = self.telegram_sender.chat_ids
+        self.forwarders: List[AvitoMessageForwarder] = []
+        for index, account in enumerate(config.get('avito_accounts', [])):
+            name = account.get('name') or f"account-{index + 1}"
+            account_config = dict(config)
+            account_config['avito'] = account
+            if coordination_config.get('enabled') and 'dedup' not in account:
+                # ID захватываются в общем файле на время пересылки: после смены аренды посреди цикла
+                # сообщение пересылает только один экземпляр
+                account_config['avito'] = {**account, 'dedup': {
+                    'backend': 'sqlite',
+                    'path': coordination_config.get('dedup_path', coordination_config.get('path', 'coordination.db')),
+                    'claim_ttl': coordination_config.get('claim_ttl', 600)
+                }}
+            account_config['telegram'] = {**self.telegram_config,
+                                          'chat_ids': account.get('chat_ids', default_chat_ids)}
+            if 'schedule' in account:
+                account_config['schedule'] = {**config.get('schedule', {}), **account['schedule']}
+            self.forwarders.append(AvitoMessageForwarder(
+                account_config,
+                transport=self.transport,
+                telegram_sender=self.telegram_sender,
+                delivery=self.delivery,
+                name=name
+            ))
+        
+        self.workers = config.get('account_workers', min(32, max(1, len(self.forwarders))))
+        self.stats_interval = config.get('stats_interval', 600)
+        
+        if coordination_config.get('enabled'):
+            self.coordinator = LeaseCoordinator(
+                coordination_config.get('path', 'coordination.db'),
+                [forwarder.name for forwarder in self.forwarders],
+                instance_id=coordination_config.get('instance_id'),
+                lease_ttl=coordination_config.get('lease_ttl', 60)
+            )
+    
+    def get_stats(self) -> List[Dict]:
+        """
+        Статистика по каждому аккаунту
+        
+        Returns:
+            List[Dict]: Статистика аккаунтов
+        """
+        return [forwarder.get_stats() for forwarder in self.forwarders]
+    
+    def log_stats(self):
+        """Запись статистики аккаунтов в лог"""
+        for stats in self.get_stats():
+            avito = stats['avito']
+            logger.info(
+                f"[{stats['name']}] циклов: {stats['cycles']}, новых сообщений: {stats['new_messages']}, "
+                f"неудачных циклов: {stats['failed_cycles']}, последний цикл: {stats['last_cycle_seconds']} сек, "
+                f"запросов к API: {avito['requests']}, запросов токена: {avito['token']['fetches']}"
+            )
+    
+    def run_continuous(self, check_interval: int = 300):
+        """
+        Обслуживание всех аккаунтов пулом потоков
+        
+        Каждый аккаунт выполняется в пуле по своему расписанию, медленный аккаунт
+        занимает один поток и не задерживает остальные.
+        
+        Args:
+            check_interval: Базовый интервал проверки в секундах
+        """
+        logger.info(f"Запуск обслуживания {len(self.forwarders)} аккаунтов Avito ({self.workers} потоков)")
+        if not self.forwarders:
+            logger.error("Список avito_accounts пуст")
+            return
+        
+        for forwarder in self.forwarders:
+            forwarder.configure_interval(check_interval)
+        
+        delivery_worker = self.delivery[1]
+        if delivery_worker is not None:
+            delivery_worker.start()
+        
+        if self.coordinator is not None:
+            self.coordinator.start()
+            logger.info(f"Экземпляр {self.coordinator.instance_id}, арендованы аккаунты: "
+                        f"{', '.join(sorted(self.coordinator.owned())) or 'нет'}")
+        
+        # Очередь (время запуска, номер аккаунта)
+        schedule = [(time.monotonic(), index) for index in range(len(self.forwarders))]
+        heapq.heapify(schedule)
+        running = {}
+        next_stats = time.monotonic() + self.stats_interval
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='account')
+        
+        try:
+            while True:
+                now = time.monotonic()
+                while schedule and schedule[0][0] <= now:
+                    _, index = heapq.heappop(schedule)
+                    forwarder = self.forwarders[index]
+                    if self.coordinator is not None and not self.coordinator.begin_cycle(forwarder.name):
+                        # Аккаунт обслуживает другой экземпляр - проверим аренду позже
+                        heapq.heappush(schedule, (now + self.coordinator.heartbeat_interval, index))
+                        continue
+                    running[executor.submit(self._run_cycle, forwarder)] = index
+                
+                timeout = max(0.0, schedule[0][0] - now) if schedule else None
+                if now >= next_stats:
+                    self.log_stats()
+                    next_stats = now + self.stats_interval
+                
+                if not running:
+                    time.sleep(timeout or 1)
+                    continue
+                
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    forwarder = self.forwarders[index]
+                    try:
+                        delay, reason = future.result()
+                    except Exception as e:
+                        delay, reason = 60, f"ошибка: {e}"
+                    logger.info(f"[{forwarder.name}] следующая проверка через {delay:.0f} сек: {reason}")
+                    heapq.heappush(schedule, (time.monotonic() + delay, index))
+        except KeyboardInterrupt:
+            logger.info("Остановка программы по запросу пользователя")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.log_stats()
+            self.close()
+    
+    def _run_cycle(self, forwarder: AvitoMessageForwarder) -> Tuple[float, str]:
+        """Цикл аккаунта; аренда не отдается другому экземпляру, пока цикл не завершен"""
+        try:
+            return forwarder.run_cycle()
+        finally:
+            if self.coordinator is not None:
+                self.coordinator.end_cycle(forwarder.name)
+    
+    def close(self):
+        """Остановка фоновых потоков и закрытие соединений"""
+        if self.coordinator is not None:
+            self.coordinator.stop()
+        for forwarder in self.forwarders:
+            forwarder.close()
+        delivery_queue, delivery_worker = self.delivery
+        if delivery_worker is not None:
+            delivery_worker.stop()
+        self.telegram_sender.close()
+        if delivery_queue is not None:
+            delivery_queue.close()
+        self.transport.close()
 
 
 def main():
     """Главная функция"""
+    parser = argparse.ArgumentParser(description='Пересылка сообщений Avito в Telegram')
+    parser.add_argument('--engine', choices=['sync', 'async'],
+                        help='sync - потоки и requests, async - asyncio с общим пулом соединений '
+                             '(по умолчанию значение "engine" из config.json или sync)')
+    subparsers = parser.add_subparsers(dest='command')
+    diagnose_parser = subparsers.add_parser(
+        'diagnose', help='Проверка подключения к Avito и Telegram с временем этапов запросов')
+    diagnose_parser.add_argument('--checks', default=','.join(CHECKS),
+                                 help=f"Группы проверок через запятую (по умолчанию {','.join(CHECKS)})")
+    diagnose_parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                                 help='Предельное время одной проверки в секундах')
+    diagnose_parser.add_argument('--format', choices=['table', 'json'], default='table',
+                                 help='Вывод таблицей или JSON')
+    args = parser.parse_args()
+    
     # Загружаем конфигурацию
     try:
         with open('config.json', 'r', encoding='utf-8') as f:
             config = json.load(f)
     except FileNotFoundError:
         logger.error("Файл config.json не найден. Создайте его с необходимыми настройками.")
-        return
+        config = None
     except json.JSONDecodeError:
         logger.error("Ошибка в формате файла config.json")
+        config = None
+    if config is None:
+        # Для healthcheck отсутствие конфигурации - ошибка
+        if args.command == 'diagnose':
+            sys.exit(1)
+        return
+    
+    if args.command == 'diagnose':
+        checks = tuple(check.strip() for check in args.checks.split(',') if check.strip())
+        unknown = [check for check in checks if check not in CHECKS]
+        if unknown:
+            parser.error(f"Неизвестные проверки: {', '.join(unknown)} (доступны: {', '.join(CHECKS)})")
+        sys.exit(run_diagnostics(config, checks, args.timeout, args.format))
+    
+    logging_pipeline = configure_logging(config.get('logging'))
+    configure_tracing(config.get('tracing', {}))
+    try:
+        run(config, args.engine or config.get('engine', 'sync'))
+    finally:
+        TRACER.close()
+        if logging_pipeline is not None:
+            logging_pipeline.stop()
+
+
+def run(config: Dict, engine: str):
+    """
+    Запуск форвардера в выбранном режиме
+    
+    Args:
+        config: Конфигурация
+        engine: 'sync' или 'async'
+    """
+    if engine == 'async':
+        if config.get('avito_accounts') or config.get('coordination', {}).get('enabled') \
+                or config.get('webhook', {}).get('enabled'):
+            logger.warning("Асинхронный режим поддерживает один аккаунт без webhook и координации, "
+                           "используется синхронный режим")
+        else:
+            forwarder = AsyncMessageForwarder(config)
+            metrics_server = start_metrics_server(config.get('metrics', {}), [forwarder])
+            forwarder.run_continuous()
+            if metrics_server is not None:
+                metrics_server.stop()
+            return
+    
+    # Несколько экземпляров с одним аккаунтом: аккаунт обслуживает только арендатор
+    if config.get('coordination', {}).get('enabled') and not config.get('avito_accounts'):
+        config['avito_accounts'] = [{'name': 'default', **config.get('avito', {})}]
+    
+    # Несколько аккаунтов Avito в одном процессе
+    if config.get('avito_accounts'):
+        if config.get('webhook', {}).get('enabled'):
+            logger.warning("Режим webhook поддерживает один аккаунт без координации, "
+                           "для avito_accounts и coordination используется опрос")
+        multi_forwarder = MultiAccountForwarder(config)
+        metrics_server = start_metrics_server(config.get('metrics', {}), multi_forwarder.forwarders,
+                                              multi_forwarder.coordinator)
+        multi_forwarder.run_continuous()
+        if metrics_server is not None:
+            metrics_server.stop()
         return
     
     # Создаем и запускаем форвардер
     forwarder = AvitoMessageForwarder(config)
+    metrics_config = config.get('metrics', {})
+    webhook_config = config.get('webhook', {})
+    if webhook_config.get('enabled'):
+        # Без входящих сообщений опрос идет только раз в reconcile_interval - это не простой
+        metrics_config = {**metrics_config, 'max_staleness': metrics_config.get('max_staleness', 900)
+                          + webhook_config.get('reconcile_interval', 3600)}
+    metrics_server = start_metrics_server(metrics_config, [forwarder])
     
     # Можно запустить однократную проверку или в режиме постоянной работы
     # forwarder.process_messages()  # Однократная проверка
-    forwarder.run_continuous()  # Постоянная работа
+    if webhook_config.get('enabled'):
+        forwarder.run_webhook()  # Прием webhook со сверкой опросом
+    else:
+        forwarder.run_continuous()  # Постоянная работа
+    
+    if metrics_server is not None:
+        metrics_server.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Метрики форвардера в текстовом формате Prometheus и служебные endpoint /metrics и /healthz
+"""
+
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from http_server import AsyncHttpServer, Request, Response, json_response, text_response
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов гистограмм длительности (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    """Общая часть метрик: имя, описание, метки и блокировка"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Строки значений в текстовом формате Prometheus"""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, value: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Gauge(_Metric):
+    """Текущее значение: задается напрямую или вычисляется функцией при каждом запросе /metrics"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, func: Callable[[], float], **labels):
+        """Значение будет вычисляться func() в момент чтения метрик"""
+        with self._lock:
+            self._functions[self._key(labels)] = func
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, func in functions:
+            try:
+                values[key] = func()
+            except Exception as e:
+                logger.debug(f"Не удалось вычислить метрику {self.name}: {e}")
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items()) if value is not None]
+
+
+class Histogram(_Metric):
+    """Распределение значений по бакетам (для длительностей)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики бакетов..., сумма, количество]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def time(self, **labels) -> '_Timer':
+        """Контекстный менеджер, измеряющий длительность блока"""
+        return _Timer(self, labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(data)) for key, data in self._values.items())
+        lines = []
+        for key, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {int(data[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(data[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {int(data[-1])}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> '_Timer':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Метрики процесса (общие для всех аккаунтов, различаются метками)
+REGISTRY = MetricsRegistry()
+
+TOKEN_FETCHES = REGISTRY.counter(
+    'avito_token_fetches_total', 'Запросы access token Avito', ['result'])
+TOKEN_FETCH_SECONDS = REGISTRY.histogram(
+    'avito_token_fetch_seconds', 'Длительность запроса access token Avito')
+AVITO_REQUESTS = REGISTRY.counter(
+    'avito_api_requests_total', 'Запросы к API Avito', ['endpoint', 'status'])
+AVITO_REQUEST_SECONDS = REGISTRY.histogram(
+    'avito_api_request_seconds', 'Длительность запросов к API Avito', ['endpoint'])
+MESSAGES_RECEIVED = REGISTRY.counter(
+    'forwarder_messages_received_total', 'Новые сообщения Avito', ['account'])
+MESSAGES_FORWARDED = REGISTRY.counter(
+    'forwarder_messages_forwarded_total', 'Уведомления, доставленные хотя бы одному получателю', ['account'])
+TELEGRAM_SENDS = REGISTRY.counter(
+    'telegram_sends_total', 'Отправки в Telegram по результату', ['outcome'])
+TELEGRAM_SEND_SECONDS = REGISTRY.histogram(
+    'telegram_send_seconds', 'Длительность запроса sendMessage')
+CYCLE_SECONDS = REGISTRY.histogram(
+    'forwarder_cycle_seconds', 'Длительность цикла опроса', ['account'],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+LAST_SUCCESS = REGISTRY.gauge(
+    'forwarder_last_success_timestamp_seconds', 'Время последнего успешного цикла опроса', ['account'])
+QUEUE_DEPTH = REGISTRY.gauge(
+    'delivery_queue_depth', 'Записи очереди уведомлений по состояниям', ['state'])
+DEDUP_SIZE = REGISTRY.gauge(
+    'dedup_store_size', 'Количество ID в хранилище обработанных сообщений', ['account'])
+
+
+class MetricsEndpoint:
+    """Маршруты /metrics и /healthz для AsyncHttpServer"""
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY,
+                 health: Optional[Callable[[], Dict[str, Optional[float]]]] = None,
+                 max_staleness: float = 900):
+        """
+        Args:
+            registry: Набор метрик
+            health: Функция, возвращающая {аккаунт: время последнего успешного цикла или None}
+            max_staleness: Через сколько секунд без успешного цикла /healthz возвращает 503
+        """
+        self.registry = registry
+        self.health = health
+        self.max_staleness = max_staleness
+        self.started = time.time()
+
+    def attach(self, server: AsyncHttpServer):
+        """Регистрация маршрутов на сервере"""
+        server.add_route('GET', '/metrics', self.handle_metrics)
+        server.add_route('GET', '/healthz', self.handle_health)
+
+    async def handle_metrics(self, request: Request) -> Response:
+        text = await asyncio.get_running_loop().run_in_executor(None, self.registry.render)
+        return text_response(200, text, 'text/plain; version=0.0.4; charset=utf-8')
+
+    async def handle_health(self, request: Request) -> Response:
+        """
+        Состояние опроса: сколько секунд прошло с последнего успешного цикла каждого аккаунта
+
+        Пока не было ни одного успешного цикла, отсчет идет от запуска процесса.
+        """
+        now = time.time()
+        accounts = {}
+        healthy = True
+        for name, last_success in (self.health() if self.health else {}).items():
+            since = now - (last_success or self.started)
+            account_ok = since <= self.max_staleness
+            healthy = healthy and account_ok
+            accounts[name] = {'ok': account_ok, 'seconds_since_success': round(since, 1),
+                              'last_success': last_success}
+        return json_response(200 if healthy else 503, {'ok': healthy, 'accounts': accounts})
+
+
+class MetricsServer:
+    """HTTP сервер метрик в отдельном потоке со своим event loop (не зависит от режима работы)"""
+
+    def __init__(self, endpoint: MetricsEndpoint, host: str = '0.0.0.0', port: int = 9100):
+        self.endpoint = endpoint
+        self.server = AsyncHttpServer(host, port)
+        endpoint.attach(self.server)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'MetricsServer':
+        """Запуск сервера (возвращается после того, как порт открыт)"""
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self.server.start())
+            except Exception as e:
+                logger.error(f"Не удалось запустить сервер метрик: {e}")
+                started.set()
+                return
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='metrics-http', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self.server.stop(), self._loop)
+        try:
+            future.result(timeout=5)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальный заменитель Avito API и Telegram Bot API для бенчмарков (без обращений к настоящим серверам)
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+CHATS_RE = re.compile(r'^/messenger/v\d+/accounts/([^/]+)/chats$')
+CHAT_RE = re.compile(r'^/messenger/v\d+/accounts/([^/]+)/chats/([^/]+)$')
+MESSAGES_RE = re.compile(r'^/messenger/v\d+/accounts/([^/]+)/chats/([^/]+)/messages$')
+READ_RE = re.compile(r'^/messenger/v\d+/accounts/([^/]+)/chats/([^/]+)/(?:messages/([^/]+)/)?read$')
+ITEMS_RE = re.compile(r'^/core/v1/accounts/([^/]+)/items$')
+SEND_RE = re.compile(r'^/bot([^/]+)/sendMessage$')
+BOT_INFO_RE = re.compile(r'^/bot([^/]+)/(getMe|getChat)$')
+# Номер сообщения в тексте по умолчанию ("Сообщение 17") - по нему уведомление связывается с сообщением Avito
+MESSAGE_NUMBER_RE = re.compile(r'Сообщение (\d+)')
+
+
+class MockState:
+    """Данные и параметры поведения mock сервера"""
+
+    def __init__(self, chats: int = 10, messages_per_chat: int = 5,
+                 latency: float = 0.0, error_rate: float = 0.0,
+                 user_id: str = 'mock-user', seed: int = 42,
+                 telegram_latency: float = 0.0, telegram_429_rate: float = 0.0,
+                 telegram_storm_seconds: float = 0.0, retry_after: float = 1,
+                 ad_context_rate: float = 1.0, list_users: bool = True):
+        """
+        Инициализация состояния
+
+        Args:
+            chats: Количество чатов
+            messages_per_chat: Количество сообщений в каждом чате
+            latency: Задержка ответа в секундах
+            error_rate: Доля ответов 500 (0.0 - 1.0)
+            user_id: ID аккаунта продавца
+            seed: Зерно генератора случайных чисел
+            telegram_latency: Задержка ответа sendMessage в секундах
+            telegram_429_rate: Доля ответов 429 на sendMessage (0.0 - 1.0)
+            telegram_storm_seconds: Сколько секунд после первого sendMessage отвечать 429 на все запросы
+            retry_after: Значение parameters.retry_after в ответах 429
+            ad_context_rate: Доля чатов, в контексте которых есть название и ссылка объявления
+            list_users: Отдавать участников (users) в списке чатов; без них - только в /chats/{chat_id}
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.user_id = user_id
+        self.telegram_latency = telegram_latency
+        self.telegram_429_rate = telegram_429_rate
+        self.telegram_storm_seconds = telegram_storm_seconds
+        self.retry_after = retry_after
+        self.list_users = list_users
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_counts: Dict[str, int] = {}
+        self.chats: List[Dict] = []
+        self.messages: Dict[str, List[Dict]] = {}
+        self._chat_index: Dict[str, Dict] = {}
+        self._next_message = 0
+        # Время появления сообщений и доставки уведомлений (для задержки "от Avito до Telegram")
+        self.created_at: Dict[int, float] = {}
+        self.deliveries: List[Tuple[int, str, float]] = []
+        self.telegram_sent = 0
+        self._storm_started: Optional[float] = None
+
+        # ID объявления -> данные для /core/v1/accounts/{user_id}/items
+        self.items: Dict[str, Dict] = {}
+        for i in range(chats):
+            chat_id = f'chat-{i}'
+            item = {
+                'id': 1000 + i,
+                'title': f'Объявление {i}',
+                'url': f'https://www.avito.ru/item/{1000 + i}',
+                'price': 1000 * (i % 50 + 1),
+                'status': 'active'
+            }
+            self.items[str(item['id'])] = item
+            chat = {
+                'id': chat_id,
+                'created': 1700000000 + i,
+                'updated': 1700000000 + i,
+                'context': {
+                    'type': 'item',
+                    'value': ({'id': item['id'], 'title': item['title'], 'url': item['url']}
+                              if ad_context_rate >= 1 or self.random.random() < ad_context_rate
+                              else {'id': item['id']})
+                },
+                'users': [
+                    {'id': self.user_id, 'name': 'Продавец'},
+                    {'id': f'buyer-{i}', 'name': f'Покупатель {i}',
+                     'public_user_profile': {'user_id': f'buyer-{i}',
+                                             'url': f'https://www.avito.ru/user/buyer-{i}/profile'}}
+                ]
+            }
+            self.chats.append(chat)
+            self._chat_index[chat_id] = chat
+            self.messages[chat_id] = []
+            for _ in range(messages_per_chat):
+                self.add_message(chat_id)
+
+    def add_message(self, chat_id: str, text: Optional[str] = None) -> Dict:
+        """
+        Добавление входящего сообщения в чат
+
+        Args:
+            chat_id: ID чата
+            text: Текст сообщения
+
+        Returns:
+            Dict: Созданное сообщение
+        """
+        with self.lock:
+            self._next_message += 1
+            created = int(time.time())
+            index = int(chat_id.rsplit('-', 1)[-1]) if chat_id.rsplit('-', 1)[-1].isdigit() else 0
+            message = {
+                'id': f'msg-{self._next_message}',
+                'author_id': f'buyer-{index}',
+                'created': created,
+                'type': 'text',
+                'content': {'text': text or f'Сообщение {self._next_message}'}
+            }
+            self.messages.setdefault(chat_id, []).append(message)
+            self.created_at[self._next_message] = time.time()
+            chat = self._chat_index.get(chat_id)
+            if chat is not None:
+                chat['updated'] = created
+                chat['last_message'] = message
+            return message
+
+    def count(self, name: str):
+        """Учет обращения к endpoint"""
+        with self.lock:
+            self.request_counts[name] = self.request_counts.get(name, 0) + 1
+
+    def telegram_throttled(self) -> bool:
+        """Нужно ли ответить 429 на очередной sendMessage"""
+        with self.lock:
+            now = time.time()
+            if self._storm_started is None:
+                self._storm_started = now
+            if now - self._storm_started < self.telegram_storm_seconds:
+                return True
+            return bool(self.telegram_429_rate) and self.random.random() < self.telegram_429_rate
+
+    def record_delivery(self, chat_id: str, text: str):
+        """Учет доставленного уведомления и сообщений Avito, упомянутых в нем"""
+        received = time.time()
+        with self.lock:
+            self.telegram_sent += 1
+            for number in MESSAGE_NUMBER_RE.findall(text):
+                self.deliveries.append((int(number), chat_id, received))
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов mock сервера"""
+
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят отдельными записями - без TCP_NODELAY второй пакет ждет подтверждения (~40 мс)
+    disable_nagle_algorithm = True
+    state: MockState = None
+
+    def log_message(self, format, *args):
+        """Отключаем вывод каждого запроса в stderr"""
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _simulate(self) -> bool:
+        """Задержка и случайная ошибка. Возвращает False, если ответ уже отправлен"""
+        state = self.state
+        if state.latency:
+            time.sleep(state.latency)
+        if state.error_rate and state.random.random() < state.error_rate:
+            self._send_json(500, {'error': 'mock error'})
+            return False
+        return True
+
+    def do_POST(self):
+        body = self._read_body()
+        path = urlsplit(self.path).path
+        state = self.state
+
+        if SEND_RE.match(path):
+            self._send_message(body)
+            return
+
+        if path == '/token':
+            state.count('token')
+            if self._simulate():
+                self._send_json(200, {'access_token': 'mock-token', 'expires_in': 86400,
+                                      'token_type': 'Bearer'})
+            return
+
+        if READ_RE.match(path):
+            state.count('read')
+            if self._simulate():
+                self._send_json(200, {'ok': True})
+            return
+
+        self._send_json(404, {'error': 'not found'})
+
+    def _send_message(self, body: bytes):
+        """Telegram sendMessage: задержка, 429 с retry_after, учет доставки"""
+        state = self.state
+        state.count('sendMessage')
+        if state.telegram_latency:
+            time.sleep(state.telegram_latency)
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            fields = json.loads(body.decode('utf-8') or '{}')
+        else:
+            fields = {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+        if state.telegram_throttled():
+            state.count('sendMessage_429')
+            self._send_json(429, {'ok': False, 'error_code': 429,
+                                  'description': f'Too Many Requests: retry after {state.retry_after}',
+                                  'parameters': {'retry_after': state.retry_after}})
+            return
+        state.record_delivery(str(fields.get('chat_id')), fields.get('text', ''))
+        self._send_json(200, {'ok': True, 'result': {'message_id': state.telegram_sent,
+                                                     'chat': {'id': fields.get('chat_id')}}})
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        state = self.state
+
+        match = CHATS_RE.match(parts.path)
+        if match:
+            state.count('chats')
+            if self._simulate():
+                limit = int(query.get('limit', [len(state.chats) or 1])[0])
+                offset = int(query.get('offset', [0])[0])
+                page = state.chats[offset:offset + limit]
+                if not state.list_users:
+                    page = [{key: value for key, value in chat.items() if key != 'users'} for chat in page]
+                self._send_json(200, {'chats': page})
+            return
+
+        match = CHAT_RE.match(parts.path)
+        if match:
+            state.count('chat')
+            if self._simulate():
+                chat = state._chat_index.get(match.group(2))
+                if chat is None:
+                    self._send_json(404, {'error': 'chat not found'})
+                else:
+                    self._send_json(200, chat)
+            return
+
+        match = BOT_INFO_RE.match(parts.path)
+        if match:
+            state.count(match.group(2))
+            if match.group(2) == 'getMe':
+                self._send_json(200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'username': 'mock_bot'}})
+            else:
+                chat_id = query.get('chat_id', [''])[0]
+                self._send_json(200, {'ok': True, 'result': {'id': chat_id, 'type': 'private',
+                                                             'first_name': f'Получатель {chat_id}'}})
+            return
+
+        if parts.path == '/core/v1/accounts/self':
+            state.count('self')
+            if self._simulate():
+                self._send_json(200, {'id': state.user_id, 'name': 'Продавец'})
+            return
+
+        if ITEMS_RE.match(parts.path):
+            state.count('items')
+            if self._simulate():
+                ids = ','.join(query.get('ids', [''])).split(',')
+                self._send_json(200, {'resources': [state.items[i] for i in ids if i in state.items]})
+            return
+
+        match = MESSAGES_RE.match(parts.path)
+        if match:
+            state.count('messages')
+            if self._simulate():
+                chat_messages = state.messages.get(match.group(2), [])
+                limit = int(query.get('limit', [len(chat_messages) or 1])[0])
+                offset = int(query.get('offset', [0])[0])
+                # Как и в Avito, новые сообщения идут первыми
+                ordered = list(reversed(chat_messages))
+                self._send_json(200, {'messages': ordered[offset:offset + limit]})
+            return
+
+        self._send_json(404, {'error': 'not found'})
+
+
+class MockServer:
+    """Mock сервер в фоновом потоке"""
+
+    def __init__(self, state: Optional[MockState] = None, host: str = '127.0.0.1', port: int = 0):
+        """
+        Инициализация сервера
+
+        Args:
+            state: Состояние с данными (по умолчанию MockState())
+            host: Адрес для прослушивания
+            port: Порт (0 - выбрать свободный)
+        """
+        self.state = state or MockState()
+        handler = type('BoundMockHandler', (MockHandler,), {'state': self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'MockServer':
+        """Запуск сервера"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановка сервера"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> 'MockServer':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Компактные неизменяемые модели чата и сообщения Avito (вместо словаря на каждое сообщение)
+
+Модели - именованные кортежи: сообщение занимает втрое меньше памяти, чем словарь на 7 ключей,
+а данные объявления хранятся один раз на чат, данные автора - один раз на пользователя.
+"""
+
+import sys
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+_intern_str = sys.intern
+# Создание кортежа без вызова сгенерированного NamedTuple.__new__ (без лишнего вызова функции на каждое сообщение)
+_tuple_new = tuple.__new__
+
+
+def _intern(value):
+    """Одна копия повторяющейся строки (названия и ссылки объявлений, ID авторов) на весь процесс"""
+    return _intern_str(value) if value.__class__ is str else value
+
+
+class AdInfo(NamedTuple):
+    """Данные объявления из контекста чата или из списка объявлений аккаунта"""
+
+    id: int
+    title: Optional[str] = None
+    url: Optional[str] = None
+    price: Optional[str] = None
+    status: Optional[str] = None
+
+    @classmethod
+    def from_api(cls, value: Dict) -> 'AdInfo':
+        """
+        Разбор объявления: context.value чата или элемент ответа /core/v1/.../items
+
+        Args:
+            value: Объявление в формате API
+
+        Returns:
+            AdInfo: Данные объявления
+        """
+        price = value.get('price_string') or value.get('price')
+        status = value.get('status') or value.get('status_id')
+        return cls(value.get('id'), _intern(value.get('title')), _intern(value.get('url')),
+                   None if price is None else _intern(str(price)),
+                   None if status is None else _intern(str(status)))
+
+
+class AvitoChat(NamedTuple):
+    """Чат Avito и объявление, к которому он относится"""
+
+    id: str
+    ad_id: Optional[int] = None
+    ad_title: str = 'Неизвестно'
+    ad_url: str = ''
+    ad_price: Optional[str] = None
+    ad_status: Optional[str] = None
+
+    @classmethod
+    def from_api(cls, chat: Dict) -> 'AvitoChat':
+        """
+        Разбор чата из ответа /chats или /chats/{chat_id}
+
+        Args:
+            chat: Чат в формате API
+
+        Returns:
+            AvitoChat: Чат
+        """
+        value = (chat.get('context') or {}).get('value') or {}
+        return cls(chat.get('id'), value.get('id'),
+                   _intern(value.get('title', 'Неизвестно')), _intern(value.get('url', '')))
+
+    def with_ad(self, ad: AdInfo) -> 'AvitoChat':
+        """Чат с данными объявления из кэша (пустые поля объявления не заменяют имеющиеся)"""
+        return self._replace(
+            ad_title=ad.title or self.ad_title,
+            ad_url=ad.url or self.ad_url,
+            ad_price=ad.price or self.ad_price,
+            ad_status=ad.status or self.ad_status
+        )
+
+
+class AvitoUser(NamedTuple):
+    """Участник чата Avito: имя и ссылка на профиль"""
+
+    id: str
+    name: Optional[str] = None
+    url: Optional[str] = None
+
+    @classmethod
+    def from_api(cls, user: Dict) -> 'AvitoUser':
+        """
+        Разбор элемента users чата
+
+        Args:
+            user: Пользователь в формате API ({"id", "name", "public_user_profile": {"url"}})
+
+        Returns:
+            AvitoUser: Пользователь
+        """
+        profile = user.get('public_user_profile')
+        return _tuple_new(cls, (_intern(user.get('id')), user.get('name') or None,
+                                profile.get('url') or None if profile else None))
+
+
+class AvitoMessage(NamedTuple):
+    """
+    Входящее сообщение Avito
+
+    Поля объявления хранятся в общем для всех сообщений чата AvitoChat, данные автора -
+    в общем для всех его сообщений AvitoUser. Для совместимости с кодом, работавшим
+    со словарями, поддерживается message.get('text').
+    """
+
+    id: str
+    text: str
+    author: AvitoUser
+    timestamp: Optional[int]
+    chat: AvitoChat
+
+    @classmethod
+    def from_api(cls, message: Dict, chat: AvitoChat, author: Optional[AvitoUser] = None) -> 'AvitoMessage':
+        """
+        Разбор сообщения из ответа API или webhook
+
+        Args:
+            message: Сообщение в формате API
+            chat: Чат сообщения (один объект на все сообщения чата)
+            author: Автор из кэша пользователей (если не передан - только ID из author_id)
+
+        Returns:
+            AvitoMessage: Сообщение
+        """
+        content = message.get('content')
+        if author is None:
+            author_id = message.get('author_id')
+            author = _tuple_new(AvitoUser, (_intern_str(author_id) if author_id.__class__ is str
+                                            else author_id, None, None))
+        return _tuple_new(cls, (message.get('id'), content.get('text', '') if content else '',
+                                author, message.get('created'), chat))
+
+    @property
+    def sender(self) -> Optional[str]:
+        """Имя автора, если известно, иначе его ID"""
+        return self.author.name or self.author.id
+
+    @property
+    def sender_id(self) -> Optional[str]:
+        return self.author.id
+
+    @property
+    def sender_url(self) -> Optional[str]:
+        return self.author.url
+
+    @property
+    def chat_id(self) -> str:
+        return self.chat.id
+
+    @property
+    def ad_title(self) -> str:
+        return self.chat.ad_title
+
+    @property
+    def ad_url(self) -> str:
+        return self.chat.ad_url
+
+    @property
+    def ad_price(self) -> Optional[str]:
+        return self.chat.ad_price
+
+    @property
+    def ad_status(self) -> Optional[str]:
+        return self.chat.ad_status
+
+    def get(self, key: str, default=None):
+        """Поле по имени, как у словаря (см. FIELDS)"""
+        return getattr(self, key) if key in _FIELD_SET else default
+
+    def to_dict(self) -> Dict:
+        """Сообщение в виде словаря (поля FIELDS)"""
+        return {key: getattr(self, key) for key in FIELDS}
+
+
+FIELDS: Tuple[str, ...] = ('id', 'text', 'sender', 'sender_id', 'sender_url', 'timestamp', 'chat_id',
+                           'ad_title', 'ad_url', 'ad_price', 'ad_status')
+_FIELD_SET = frozenset(FIELDS)
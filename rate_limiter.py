@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ограничение частоты запросов: token bucket и лимиты Telegram (общий и на каждый чат)
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity в запасе"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: Скорость пополнения, токенов в секунду
+            capacity: Размер запаса (по умолчанию max(1, rate))
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Резервирование одного токена
+
+        Returns:
+            float: Сколько секунд нужно подождать перед запросом
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def acquire(self) -> float:
+        """
+        Ожидание своей очереди
+
+        Returns:
+            float: Сколько секунд пришлось ждать
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        """Ожидание своей очереди без блокировки event loop"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float):
+        """Запрет запросов на seconds секунд (например, по retry_after)"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class TelegramRateLimiter:
+    """Общий лимит бота и отдельный лимит на каждый chat_id"""
+
+    def __init__(self, global_per_second: float = 30, per_chat_per_second: float = 1,
+                 per_chat_burst: float = 1):
+        """
+        Args:
+            global_per_second: Сообщений в секунду на бота
+            per_chat_per_second: Сообщений в секунду в один чат
+            per_chat_burst: Сколько сообщений можно отправить в чат подряд без ожидания
+        """
+        self.global_bucket = TokenBucket(global_per_second)
+        self.per_chat_per_second = per_chat_per_second
+        self.per_chat_burst = per_chat_burst
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            with self._lock:
+                bucket = self._chat_buckets.setdefault(
+                    chat_id, TokenBucket(self.per_chat_per_second, self.per_chat_burst))
+        return bucket
+
+    def acquire(self, chat_id: str) -> float:
+        """
+        Ожидание разрешения на отправку в чат
+
+        Сначала ждем лимит чата, затем общий, чтобы не занимать общий токен впустую.
+
+        Args:
+            chat_id: ID чата Telegram
+
+        Returns:
+            float: Суммарное время ожидания в секундах
+        """
+        return self._chat_bucket(str(chat_id)).acquire() + self.global_bucket.acquire()
+
+    async def acquire_async(self, chat_id: str) -> float:
+        """Асинхронный вариант acquire для корутин"""
+        return await self._chat_bucket(str(chat_id)).acquire_async() + await self.global_bucket.acquire_async()
+
+    def retry_after(self, chat_id: str, seconds: float):
+        """
+        Учет ответа 429 с parameters.retry_after
+
+        Args:
+            chat_id: ID чата, для которого получен 429
+            seconds: Пауза, которую запросил Telegram
+        """
+        self._chat_bucket(str(chat_id)).pause(seconds)
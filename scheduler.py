@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Адаптивный интервал опроса Avito: чаще после активности, реже в тишине и при ошибках
+"""
+
+import logging
+import random
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveScheduler:
+    """Расчет времени следующего опроса с учетом активности чатов и бюджета запросов к API"""
+
+    def __init__(self, min_interval: float = 30, max_interval: float = 300,
+                 backoff_factor: float = 2.0, jitter: float = 0.1,
+                 error_interval: float = 60, max_error_interval: float = 900,
+                 requests_per_hour: Optional[float] = None):
+        """
+        Args:
+            min_interval: Минимальный интервал (сразу после новых сообщений)
+            max_interval: Максимальный интервал в тишине
+            backoff_factor: Во сколько раз увеличивать интервал после пустого цикла
+            jitter: Случайное отклонение интервала (доля, 0.1 = ±10%)
+            error_interval: Интервал после первой ошибки
+            max_error_interval: Максимальный интервал при повторяющихся ошибках
+            requests_per_hour: Бюджет запросов к API в час (None - без ограничения)
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.error_interval = error_interval
+        self.max_error_interval = max_error_interval
+        self.requests_per_hour = requests_per_hour
+
+        self.interval = min_interval
+        self.consecutive_errors = 0
+        self.requests_per_cycle: Optional[float] = None
+        # chat_id -> {'last': время последнего сообщения, 'gap': сглаженный интервал между сообщениями}
+        self.chat_activity: Dict[str, Dict[str, float]] = {}
+
+    def observe_message(self, chat_id: str, timestamp: Optional[float] = None):
+        """
+        Учет нового сообщения для оценки частоты сообщений в чате
+
+        Args:
+            chat_id: ID чата Avito
+            timestamp: Время сообщения (unix time)
+        """
+        timestamp = float(timestamp or time.time())
+        activity = self.chat_activity.get(chat_id)
+        if activity is None:
+            self.chat_activity[chat_id] = {'last': timestamp, 'gap': None}
+            return
+        gap = timestamp - activity['last']
+        if gap <= 0:
+            return
+        activity['gap'] = gap if activity['gap'] is None else 0.7 * activity['gap'] + 0.3 * gap
+        activity['last'] = timestamp
+
+    def chat_interval(self, chat_id: str) -> Optional[float]:
+        """
+        Рекомендуемый интервал опроса для чата по наблюдаемой частоте сообщений
+
+        Returns:
+            Optional[float]: Интервал в секундах или None, если данных мало
+        """
+        activity = self.chat_activity.get(chat_id)
+        if not activity or activity['gap'] is None:
+            return None
+        return min(self.max_interval, max(self.min_interval, activity['gap'] / 2))
+
+    def _predicted_wakeup(self, now: float) -> Optional[Tuple[float, str]]:
+        """Ближайший ожидаемый ответ в активных чатах"""
+        best = None
+        for chat_id, activity in list(self.chat_activity.items()):
+            interval = self.chat_interval(chat_id)
+            if interval is None:
+                continue
+            # Чат давно молчит - прогноз по нему больше не актуален
+            if now - activity['last'] > 4 * activity['gap']:
+                del self.chat_activity[chat_id]
+                continue
+            delay = max(self.min_interval, activity['last'] + interval - now)
+            if best is None or delay < best[0]:
+                best = (delay, chat_id)
+        return best
+
+    def next_delay(self, new_messages: int, requests_made: int, errors: int) -> Tuple[float, str]:
+        """
+        Расчет паузы до следующего опроса после завершенного цикла
+
+        Args:
+            new_messages: Сколько новых сообщений найдено в цикле
+            requests_made: Сколько запросов к API сделано в цикле
+            errors: Сколько ошибок API было в цикле
+
+        Returns:
+            Tuple[float, str]: Пауза в секундах и причина
+        """
+        now = time.time()
+        if requests_made:
+            self.requests_per_cycle = (requests_made if self.requests_per_cycle is None
+                                       else 0.7 * self.requests_per_cycle + 0.3 * requests_made)
+
+        if errors:
+            self.consecutive_errors += 1
+            delay = min(self.max_error_interval,
+                        self.error_interval * self.backoff_factor ** (self.consecutive_errors - 1))
+            reason = f"ошибки API ({self.consecutive_errors} подряд)"
+        else:
+            self.consecutive_errors = 0
+            if new_messages:
+                self.interval = self.min_interval
+                reason = f"активность ({new_messages} новых сообщений)"
+            else:
+                self.interval = min(self.max_interval, self.interval * self.backoff_factor)
+                reason = "тишина"
+            delay = self.interval
+
+            predicted = self._predicted_wakeup(now)
+            if predicted is not None and predicted[0] < delay:
+                delay = predicted[0]
+                reason = f"ожидается сообщение в чате {predicted[1]}"
+
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+
+        # Не превышаем бюджет запросов к API
+        if self.requests_per_hour and self.requests_per_cycle:
+            budget_delay = self.requests_per_cycle * 3600 / self.requests_per_hour
+            if budget_delay > delay:
+                delay = budget_delay
+                reason += f", ограничено бюджетом {self.requests_per_hour:g} запросов/час"
+        return delay, reason
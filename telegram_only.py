@@ -4,12 +4,13 @@
 Упрощенная версия для тестирования только Telegram функциональности
 """
 
-import requests
 import json
 import logging
 from datetime import datetime
 import time
 
+from http_transport import HttpTransport
+
 # Настройка логирования
 logging.basicConfig(
     level=logging.INFO,
@@ -21,9 +22,10 @@ logger = logging.getLogger(__name__)
 class TelegramForwarder:
     """Упрощенный класс только для Telegram"""
     
-    def __init__(self, bot_token, chat_ids):
+    def __init__(self, bot_token, chat_ids, http_config=None):
         self.bot_token = bot_token
         self.chat_ids = chat_ids
+        self.transport = HttpTransport(http_config)
     
     def send_telegram_message(self, message: str) -> bool:
         """Отправка сообщения в Telegram на все chat_id"""
@@ -38,7 +40,7 @@ class TelegramForwarder:
                     'parse_mode': 'HTML'
                 }
                 
-                response = requests.post(url, data=data)
+                response = self.transport.post(url, data=data)
                 response.raise_for_status()
                 
                 logger.info(f"✅ Сообщение отправлено в chat_id: {chat_id}")
@@ -93,7 +95,7 @@ def main():
         return
     
     # Создаем форвардер
-    forwarder = TelegramForwarder(bot_token, chat_ids)
+    forwarder = TelegramForwarder(bot_token, chat_ids, config.get('http', {}))
     
     # Отправляем тестовое сообщение
     print("📤 Отправляем тестовое сообщение...")
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Параллельная отправка сообщений в Telegram с сохранением порядка внутри каждого чата
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+import metrics
+from rate_limiter import TelegramRateLimiter
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SendResult:
+    """Результат отправки одного сообщения в один chat_id"""
+    chat_id: str
+    ok: bool
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+    message_id: Optional[int] = None
+
+
+@dataclass
+class DeliveryReport:
+    """Результаты отправки сообщения по всем получателям. В логическом контексте - "доставлено хоть кому-то\""""
+    results: Dict[str, SendResult] = field(default_factory=dict)
+
+    @property
+    def success_count(self) -> int:
+        return sum(1 for result in self.results.values() if result.ok)
+
+    @property
+    def failed(self) -> List[SendResult]:
+        return [result for result in self.results.values() if not result.ok]
+
+    def __bool__(self) -> bool:
+        return self.success_count > 0
+
+
+class DeliveryTicket:
+    """Ожидание результатов сообщения, поставленного в очередь отправки"""
+
+    def __init__(self, futures: Dict[str, Future]):
+        self.futures = futures
+
+    def wait(self) -> DeliveryReport:
+        """
+        Ожидание отправки во все чаты
+
+        Returns:
+            DeliveryReport: Результаты по каждому chat_id
+        """
+        return DeliveryReport({chat_id: future.result() for chat_id, future in self.futures.items()})
+
+
+class TelegramBotApi:
+    """Общая часть отправителей Telegram (sync и async): запрос sendMessage и разбор ответа Bot API"""
+
+    def __init__(self, bot_token: str, chat_ids: List[str], parse_mode: str = 'HTML',
+                 api_url: str = 'https://api.telegram.org',
+                 rate_limiter: Optional[TelegramRateLimiter] = None, max_retries: int = 5):
+        """
+        Args:
+            bot_token: Токен бота
+            chat_ids: Список chat_id получателей
+            parse_mode: Режим разметки Telegram
+            api_url: Адрес Bot API
+            rate_limiter: Ограничитель частоты (по умолчанию лимиты Telegram: 30/с и 1/с на чат)
+            max_retries: Сколько раз повторять отправку после ответа 429
+        """
+        self.bot_token = bot_token
+        self.chat_ids = [str(chat_id) for chat_id in chat_ids]
+        self.parse_mode = parse_mode
+        self.api_url = api_url.rstrip('/')
+        self.rate_limiter = rate_limiter or TelegramRateLimiter()
+        self.max_retries = max_retries
+
+    def _send_url(self) -> str:
+        return f"{self.api_url}/bot{self.bot_token}/sendMessage"
+
+    def _send_data(self, chat_id: str, text: str) -> Dict:
+        return {
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': self.parse_mode
+        }
+
+    def _send_result(self, chat_id: str, response, attempt: int) -> Optional[SendResult]:
+        """
+        Результат отправки по ответу sendMessage
+
+        Args:
+            chat_id: ID чата Telegram
+            response: Ответ Bot API
+            attempt: Номер попытки (с нуля)
+
+        Returns:
+            Optional[SendResult]: Результат или None, если Telegram ограничил частоту и отправку нужно
+                повторить (пауза уже передана ограничителю)
+        """
+        if response.status_code == 200:
+            metrics.TELEGRAM_SENDS.inc(outcome='ok')
+            payload = response.json()
+            logger.info("Telegram сообщение отправлено успешно в chat_id: %s", chat_id)
+            return SendResult(chat_id, True, 200,
+                              message_id=payload.get('result', {}).get('message_id'))
+
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        description = payload.get('description', response.text)
+
+        if response.status_code == 429 and attempt < self.max_retries:
+            metrics.TELEGRAM_SENDS.inc(outcome='rate_limited')
+            # Telegram просит подождать - откладываем отправку, а не теряем сообщение
+            retry_after = self._parse_retry_after(response, payload)
+            logger.warning(f"Telegram ограничил частоту для chat_id {chat_id}, "
+                           f"повтор через {retry_after} сек")
+            self.rate_limiter.retry_after(chat_id, retry_after)
+            return None
+
+        metrics.TELEGRAM_SENDS.inc(outcome='error')
+        logger.error(f"Ошибка отправки Telegram сообщения в chat_id {chat_id}: "
+                     f"{response.status_code} {description}")
+        return SendResult(chat_id, False, response.status_code, error=description)
+
+    @staticmethod
+    def _send_failed(chat_id: str, error: Exception) -> SendResult:
+        """Результат отправки, прерванной исключением"""
+        metrics.TELEGRAM_SENDS.inc(outcome='exception')
+        logger.error(f"Ошибка отправки Telegram сообщения в chat_id {chat_id}: {error}")
+        return SendResult(chat_id, False, error=str(error))
+
+    @staticmethod
+    def _parse_retry_after(response, payload: Dict) -> float:
+        """Пауза из parameters.retry_after или заголовка Retry-After (по умолчанию 1 сек)"""
+        retry_after = (payload.get('parameters') or {}).get('retry_after')
+        if retry_after is None:
+            retry_after = response.headers.get('Retry-After')
+        try:
+            return max(float(retry_after), 0.0)
+        except (TypeError, ValueError):
+            return 1.0
+
+
+class TelegramSender(TelegramBotApi):
+    """Отправка в Telegram: получатели обслуживаются параллельно, сообщения в один чат - по очереди"""
+
+    def __init__(self, bot_token: str, chat_ids: List[str], transport,
+                 workers: int = 4, parse_mode: str = 'HTML',
+                 api_url: str = 'https://api.telegram.org',
+                 rate_limiter: Optional[TelegramRateLimiter] = None,
+                 max_retries: int = 5):
+        """
+        Инициализация отправителя
+
+        Args:
+            bot_token: Токен бота
+            chat_ids: Список chat_id получателей
+            transport: HTTP транспорт с методом post()
+            workers: Количество потоков отправки
+            parse_mode: Режим разметки Telegram
+            api_url: Адрес Bot API
+            rate_limiter: Ограничитель частоты (по умолчанию лимиты Telegram: 30/с и 1/с на чат)
+            max_retries: Сколько раз повторять отправку после ответа 429
+        """
+        super().__init__(bot_token, chat_ids, parse_mode, api_url, rate_limiter, max_retries)
+        self.transport = transport
+        self.workers = max(1, int(workers))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='telegram-send')
+        # Очередь каждого чата и признак того, что ее уже обрабатывает поток
+        self._lanes: Dict[str, Deque[Tuple[str, Future, contextvars.Context]]] = {}
+        self._active: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def send_to_chat(self, chat_id: str, text: str) -> SendResult:
+        """
+        Синхронная отправка сообщения в один чат
+
+        Args:
+            chat_id: ID чата Telegram
+            text: Текст сообщения
+
+        Returns:
+            SendResult: Результат отправки
+        """
+        with span('telegram.send', chat_id=chat_id, text_length=len(text)) as send_span:
+            result = self._send_to_chat(chat_id, text)
+            send_span.set_attribute('http.status_code', result.status_code or 0)
+            send_span.set_attribute('ok', result.ok)
+        return result
+
+    def _send_to_chat(self, chat_id: str, text: str) -> SendResult:
+        url = self._send_url()
+        data = self._send_data(chat_id, text)
+        try:
+            for attempt in range(self.max_retries + 1):
+                self.rate_limiter.acquire(chat_id)
+                started = time.perf_counter()
+                response = self.transport.post(url, data=data)
+                metrics.TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - started)
+                result = self._send_result(chat_id, response, attempt)
+                if result is not None:
+                    return result
+        except Exception as e:
+            return self._send_failed(chat_id, e)
+
+    def submit(self, text: str, chat_ids: Optional[List[str]] = None) -> DeliveryTicket:
+        """
+        Постановка сообщения в очередь отправки всем получателям
+
+        Args:
+            text: Текст сообщения
+            chat_ids: Получатели (по умолчанию все настроенные)
+
+        Returns:
+            DeliveryTicket: Объект для ожидания результатов
+        """
+        futures = {}
+        for chat_id in (chat_ids or self.chat_ids):
+            chat_id = str(chat_id)
+            future: Future = Future()
+            futures[chat_id] = future
+            with self._lock:
+                # Контекст вызывающего (текущий span трассировки) переносится в поток отправки
+                self._lanes.setdefault(chat_id, deque()).append((text, future, contextvars.copy_context()))
+                if self._active.get(chat_id):
+                    continue
+                self._active[chat_id] = True
+            self._executor.submit(self._drain, chat_id)
+        return DeliveryTicket(futures)
+
+    def _drain(self, chat_id: str):
+        """Последовательная отправка всех сообщений из очереди чата"""
+        lane = self._lanes[chat_id]
+        while True:
+            with self._lock:
+                if not lane:
+                    self._active[chat_id] = False
+                    return
+                text, future, context = lane.popleft()
+            try:
+                future.set_result(context.run(self.send_to_chat, chat_id, text))
+            except Exception as e:
+                future.set_result(SendResult(chat_id, False, error=str(e)))
+
+    def send(self, text: str) -> DeliveryReport:
+        """
+        Отправка сообщения всем получателям параллельно
+
+        Args:
+            text: Текст сообщения
+
+        Returns:
+            DeliveryReport: Результаты по каждому chat_id
+        """
+        return self.submit(text).wait()
+
+    def send_many(self, texts: List[str]) -> List[DeliveryReport]:
+        """
+        Отправка нескольких сообщений всем получателям
+
+        Args:
+            texts: Тексты сообщений (в каждый чат уходят в этом порядке)
+
+        Returns:
+            List[DeliveryReport]: Результаты для каждого сообщения
+        """
+        tickets = [self.submit(text) for text in texts]
+        return [ticket.wait() for ticket in tickets]
+
+    def close(self):
+        """Остановка потоков отправки после доставки очереди"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Шаблоны уведомлений Telegram: разбор шаблона один раз при запуске, экранирование
+подставляемых значений для HTML и MarkdownV2, форматирование пачки сообщений за один проход
+"""
+
+import re
+import string
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+PARSE_MODES = ('HTML', 'MarkdownV2')
+
+DEFAULT_TEMPLATES = {
+    'HTML': (
+        "🔔 <b>Новое сообщение с Avito</b>\n"
+        "\n"
+        "📅 <b>Время:</b> {time}\n"
+        "👤 <b>От:</b> {sender}\n"
+        "📋 <b>Объявление:</b> {ad_title}\n"
+        "\n"
+        "💬 <b>Сообщение:</b>\n"
+        "{text}\n"
+        "\n"
+        "---\n"
+        "<i>Отправлено автоматически</i>"
+    ),
+    'MarkdownV2': (
+        "🔔 *Новое сообщение с Avito*\n"
+        "\n"
+        "📅 *Время:* {time}\n"
+        "👤 *От:* {sender}\n"
+        "📋 *Объявление:* {ad_title}\n"
+        "\n"
+        "💬 *Сообщение:*\n"
+        "{text}\n"
+        "\n"
+        "\\-\\-\\-\n"
+        "_Отправлено автоматически_"
+    ),
+}
+
+DEFAULT_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Символы, которые в MarkdownV2 должны экранироваться обратной косой чертой
+_MARKDOWN_V2_RE = re.compile(r'([_*\[\]()~`>#+\-=|{}.!\\])')
+# В адресе ссылки MarkdownV2 [текст](адрес) экранируются только ) и \
+_MARKDOWN_V2_URL_RE = re.compile(r'([)\\])')
+# Шаблон до поля заканчивается незакрытым "](" - поле стоит в адресе ссылки
+_MARKDOWN_V2_OPEN_URL_RE = re.compile(r'\]\((?:[^)\\]|\\.)*$')
+
+
+def escape_html(text: str) -> str:
+    """Экранирование текста для parse_mode HTML (кавычки - для значений атрибутов, например href)"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+def escape_markdown_v2(text: str) -> str:
+    """Экранирование текста для parse_mode MarkdownV2"""
+    # Функция замены заметно быстрее шаблона r'\\\1' (шаблон разбирается при каждой подстановке)
+    return _MARKDOWN_V2_RE.sub(_backslash, text)
+
+
+def escape_markdown_v2_url(url: str) -> str:
+    """Экранирование адреса внутри (...) ссылки MarkdownV2"""
+    return _MARKDOWN_V2_URL_RE.sub(_backslash, url)
+
+
+def _backslash(match: 're.Match') -> str:
+    return '\\' + match.group()
+
+
+ESCAPERS: Dict[str, Callable[[str], str]] = {
+    'HTML': escape_html,
+    'MarkdownV2': escape_markdown_v2,
+}
+
+
+@lru_cache(maxsize=4096)
+def _format_timestamp(timestamp: int, time_format: str) -> str:
+    # В пачке сообщений время часто совпадает до секунды - strftime вызывается один раз
+    return datetime.fromtimestamp(timestamp).strftime(time_format)
+
+
+def _message_time(message: Dict, time_format: str) -> str:
+    """Время сообщения Avito (поле created, unix time); текущее время, если его нет"""
+    timestamp = message.get('timestamp')
+    try:
+        return _format_timestamp(int(float(timestamp)), time_format)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return _format_timestamp(int(time.time()), time_format)
+
+
+def _field(name: str, default: str) -> Callable[[Dict], str]:
+    def get(message: Dict) -> str:
+        value = message.get(name)
+        return default if value is None or value == '' else str(value)
+    return get
+
+
+# Поля, доступные в шаблоне: {имя} -> значение из сообщения форвардера
+FIELDS: Dict[str, Callable[[Dict], str]] = {
+    'text': _field('text', 'Пустое сообщение'),
+    'sender': _field('sender', 'Неизвестно'),
+    'sender_id': _field('sender_id', ''),
+    'sender_url': _field('sender_url', ''),
+    'ad_title': _field('ad_title', 'Неизвестно'),
+    'ad_url': _field('ad_url', ''),
+    'ad_price': _field('ad_price', ''),
+    'ad_status': _field('ad_status', ''),
+    'chat_id': _field('chat_id', ''),
+    'id': _field('id', ''),
+}
+
+
+class MessageTemplate:
+    """Разобранный шаблон уведомления"""
+
+    def __init__(self, template: Optional[str] = None, parse_mode: str = 'HTML',
+                 time_format: str = DEFAULT_TIME_FORMAT):
+        """
+        Разбор шаблона
+
+        Разметка шаблона не экранируется, экранируются только подставляемые значения.
+
+        Args:
+            template: Текст шаблона с полями {time}, {sender}, {sender_id}, {sender_url}, {ad_title},
+                {ad_url}, {ad_price}, {ad_status}, {text}, {chat_id}, {id} (по умолчанию - стандартный
+                шаблон для parse_mode)
+            parse_mode: HTML или MarkdownV2
+            time_format: Формат {time} для strftime
+
+        Raises:
+            ValueError: Неизвестный parse_mode, поле или ошибка синтаксиса шаблона
+        """
+        if parse_mode not in ESCAPERS:
+            raise ValueError(f"Неизвестный parse_mode: {parse_mode} (поддерживаются {', '.join(PARSE_MODES)})")
+        self.parse_mode = parse_mode
+        self.template = DEFAULT_TEMPLATES[parse_mode] if template is None else template
+        self.time_format = time_format
+        self._escape = ESCAPERS[parse_mode]
+        self._format, self._fields = self._compile(self.template)
+
+    def _compile(self, template: str) -> Tuple[str, List[Tuple[Callable[[Dict], str], str, Callable[[str], str]]]]:
+        """Шаблон -> строка формата с позиционными полями, функции получения и экранирования значений"""
+        parts = []
+        fields = []
+        preceding = ''  # Разметка шаблона до текущего поля
+        for literal, name, format_spec, conversion in string.Formatter().parse(template):
+            parts.append(literal.replace('{', '{{').replace('}', '}}'))
+            preceding += literal
+            if name is None:
+                continue
+            if name == 'time':
+                time_format = self.time_format
+                getter = lambda message, time_format=time_format: _message_time(message, time_format)
+            elif name in FIELDS:
+                getter = FIELDS[name]
+            else:
+                raise ValueError(f"Неизвестное поле шаблона: {{{name}}} "
+                                 f"(доступны: time, {', '.join(FIELDS)})")
+            if conversion:
+                raise ValueError(f"Преобразование !{conversion} в поле {{{name}}} не поддерживается")
+            parts.append('{}')
+            fields.append((getter, format_spec or '', self._field_escaper(preceding)))
+            preceding += name
+        return ''.join(parts), fields
+
+    def _field_escaper(self, preceding: str) -> Callable[[str], str]:
+        """Экранирование поля: в адресе ссылки MarkdownV2 [текст]({ad_url}) - только ) и \\"""
+        if self.parse_mode == 'MarkdownV2' and _MARKDOWN_V2_OPEN_URL_RE.search(preceding):
+            return escape_markdown_v2_url
+        return self._escape
+
+    def render(self, message: Dict) -> str:
+        """
+        Текст уведомления для одного сообщения
+
+        Args:
+            message: Сообщение Avito в формате форвардера
+
+        Returns:
+            str: Текст для отправки с parse_mode шаблона
+        """
+        return self._format.format(*[escape(format(get(message), spec) if spec else get(message))
+                                     for get, spec, escape in self._fields])
+
+    def render_many(self, messages: Iterable[Dict]) -> List[str]:
+        """
+        Тексты уведомлений для пачки сообщений за один проход
+
+        Args:
+            messages: Сообщения Avito в формате форвардера
+
+        Returns:
+            List[str]: Тексты в том же порядке
+        """
+        format_string = self._format.format
+        fields = self._fields
+        return [format_string(*[escape(format(get(message), spec) if spec else get(message))
+                                for get, spec, escape in fields])
+                for message in messages]
+
+
+def build_template(telegram_config: Dict) -> MessageTemplate:
+    """
+    Шаблон уведомлений по секции telegram конфигурации
+
+    Args:
+        telegram_config: {"parse_mode": "HTML", "template": "..." или ["строка", ...],
+            "time_format": "%Y-%m-%d %H:%M:%S"}
+
+    Returns:
+        MessageTemplate: Разобранный шаблон
+    """
+    template = telegram_config.get('template')
+    if isinstance(template, list):
+        template = '\n'.join(template)
+    return MessageTemplate(
+        template,
+        parse_mode=telegram_config.get('parse_mode', 'HTML'),
+        time_format=telegram_config.get('time_format', DEFAULT_TIME_FORMAT)
+    )
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Несколько экземпляров с общим файлом SQLite: перераспределение и перехват аренд,
+захват ID сообщений на время пересылки
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avito_client import AvitoClient  # noqa: E402
+from coordination import LeaseCoordinator  # noqa: E402
+from dedup_store import SQLiteDedupStore  # noqa: E402
+
+ACCOUNTS = ['acc1', 'acc2', 'acc3', 'acc4']
+
+
+class LeaseCoordinatorTest(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'coordination.db')
+        self.coordinators = []
+
+    def tearDown(self):
+        for coordinator in self.coordinators:
+            coordinator.stop()
+        self.tmp.cleanup()
+        logging.disable(logging.NOTSET)
+
+    def coordinator(self, name, lease_ttl=60):
+        coordinator = LeaseCoordinator(self.path, ACCOUNTS, instance_id=name, lease_ttl=lease_ttl)
+        self.coordinators.append(coordinator)
+        return coordinator
+
+    def test_rebalance_between_two_instances(self):
+        first = self.coordinator('first')
+        first.heartbeat()
+        self.assertEqual(first.owned(), set(ACCOUNTS))
+
+        second = self.coordinator('second')
+        second.heartbeat()
+        # Все аренды заняты и не истекли - второй экземпляр ждет
+        self.assertEqual(second.owned(), set())
+
+        first.heartbeat()
+        second.heartbeat()
+        self.assertEqual(len(first.owned()), 2)
+        self.assertEqual(len(second.owned()), 2)
+        self.assertEqual(first.owned() | second.owned(), set(ACCOUNTS))
+        for account in ACCOUNTS:
+            self.assertNotEqual(first.owns(account), second.owns(account))
+
+    def test_running_cycle_keeps_lease(self):
+        first = self.coordinator('first')
+        first.heartbeat()
+        for account in ACCOUNTS:
+            self.assertTrue(first.begin_cycle(account))
+
+        second = self.coordinator('second')
+        second.heartbeat()
+        first.heartbeat()
+        # Ни один аккаунт не отдан, пока идут циклы
+        self.assertEqual(first.owned(), set(ACCOUNTS))
+
+        first.end_cycle('acc1')
+        first.end_cycle('acc2')
+        first.heartbeat()
+        second.heartbeat()
+        self.assertEqual(first.owned(), {'acc3', 'acc4'})
+        self.assertEqual(second.owned(), {'acc1', 'acc2'})
+        self.assertFalse(second.begin_cycle('acc3'))
+
+    def test_expired_lease_is_taken_over(self):
+        first = self.coordinator('first', lease_ttl=0.2)
+        first.heartbeat()
+        second = self.coordinator('second', lease_ttl=0.2)
+        second.heartbeat()
+        self.assertEqual(second.owned(), set())
+
+        # Первый экземпляр перестал продлевать аренды
+        time.sleep(0.3)
+        self.assertFalse(first.owns('acc1'))
+        self.assertFalse(first.begin_cycle('acc1'))
+        second.heartbeat()
+        self.assertEqual(second.owned(), set(ACCOUNTS))
+
+
+class MessageClaimTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'dedup.db')
+        self.first = SQLiteDedupStore(self.path, claim_ttl=60)
+        self.second = SQLiteDedupStore(self.path, claim_ttl=60)
+
+    def tearDown(self):
+        self.first.close()
+        self.second.close()
+        self.tmp.cleanup()
+
+    def test_only_one_instance_claims(self):
+        self.assertTrue(self.first.claim('m1'))
+        self.assertFalse(self.second.claim('m1'))
+        self.first.add('m1')
+        self.first.release('m1')
+        self.assertFalse(self.second.claim('m1'))
+
+    def test_released_claim_can_be_taken(self):
+        self.assertTrue(self.first.claim('m1'))
+        # Пересылка не удалась - захват снят, сообщение перешлет любой экземпляр
+        self.first.release('m1')
+        self.assertTrue(self.second.claim('m1'))
+
+    def test_expired_claim_is_taken_over(self):
+        self.first.claim_ttl = 0.1
+        self.assertTrue(self.first.claim('m1'))
+        time.sleep(0.2)
+        self.assertTrue(self.second.claim('m1'))
+
+    def test_clients_share_claims(self):
+        config = {'user_id': 'me', 'api_key': 'secret',
+                  'dedup': {'backend': 'sqlite', 'path': self.path, 'claim_ttl': 60}}
+        first, second = AvitoClient(config), AvitoClient(config)
+        try:
+            self.assertTrue(first.reserve_message('m1'))
+            self.assertFalse(second.reserve_message('m1'))
+            first.finish_message('m1', False)
+            self.assertTrue(second.reserve_message('m1'))
+            second.finish_message('m1', True)
+            self.assertFalse(first.reserve_message('m1'))
+        finally:
+            first.close()
+            second.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
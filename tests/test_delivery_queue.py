@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Очередь уведомлений: ожидание обработчика, когда первая запись чата ждет повтора
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delivery_queue import DeliveryQueue, DeliveryWorker  # noqa: E402
+
+
+class _IdleSender:
+    """Отправитель, который не должен вызываться: в тесте нечего отправлять"""
+
+    def submit(self, text, chat_ids):
+        raise AssertionError("submit не ожидался")
+
+
+class HeadInBackoffTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = DeliveryQueue(os.path.join(self.tmp.name, 'outbox.db'), base_delay=30)
+        # Первая запись чата получила ошибку и ждет повтора, вторая готова, но заблокирована первой
+        self.queue.enqueue('chat-1', 'первое', 'm1')
+        self.queue.enqueue('chat-1', 'второе', 'm2')
+        head = self.queue.claim()[0]
+        self.queue.fail(head['id'], 'timeout')
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp.cleanup()
+
+    def test_next_due_ignores_blocked_rows(self):
+        self.assertEqual(self.queue.claim(), [])
+        next_due = self.queue.next_due()
+        self.assertIsNotNone(next_due)
+        self.assertGreater(next_due, time.time() + 20)
+
+    def test_worker_does_not_spin(self):
+        calls = []
+        claim = self.queue.claim
+
+        def counting_claim(limit=20):
+            calls.append(limit)
+            return claim(limit)
+
+        self.queue.claim = counting_claim
+        worker = DeliveryWorker(self.queue, _IdleSender(), idle_interval=0.2)
+        worker.start()
+        time.sleep(0.5)
+        worker.stop()
+        # Одна проверка на idle_interval, а не тысячи в секунду
+        self.assertLessEqual(len(calls), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
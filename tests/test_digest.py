@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Дайджест: разбиение HTML на части без разрыва тегов и сущностей, упаковка длинных сообщений
+"""
+
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from digest import DigestBuilder, split_html  # noqa: E402
+
+_TAG_RE = re.compile(r'<[^>]*>')
+
+
+def _text(chunks):
+    """Текст частей без разметки, слова через пробел"""
+    return ' '.join(' '.join(_TAG_RE.sub('', chunk).split()) for chunk in chunks)
+
+
+class SplitHtmlTest(unittest.TestCase):
+    def test_short_text_is_not_split(self):
+        self.assertEqual(split_html('<b>коротко</b>', 100), ['<b>коротко</b>'])
+
+    def test_open_tags_are_closed_and_reopened(self):
+        text = '<b>' + 'слово ' * 40 + '</b>'
+        chunks = split_html(text, 40)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 40)
+            self.assertTrue(chunk.startswith('<b>'), chunk)
+            self.assertTrue(chunk.endswith('</b>'), chunk)
+        self.assertEqual(_text(chunks), ' '.join(['слово'] * 40))
+
+    def test_nested_tags(self):
+        text = '<b><i>' + 'a' * 100 + '</i></b> хвост'
+        chunks = split_html(text, 30)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 30)
+            self.assertEqual(chunk.count('<b>'), chunk.count('</b>'), chunk)
+            self.assertEqual(chunk.count('<i>'), chunk.count('</i>'), chunk)
+        self.assertEqual(_text(chunks).replace(' ', ''), 'a' * 100 + 'хвост')
+
+    def test_entities_are_not_split(self):
+        text = 'x' * 7 + '&amp;' * 20 + '&#128512;' + '&lt;'
+        chunks = split_html(text, 10)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 10)
+            # Каждый & начинает целую сущность
+            self.assertIsNone(re.search(r'&(?!amp;|lt;|#128512;)', chunk), chunk)
+        self.assertEqual(''.join(chunks), text)
+
+    def test_tag_is_not_split(self):
+        text = 'текст ' * 5 + '<a href="https://www.avito.ru/item/1">ссылка</a>'
+        for chunk in split_html(text, 50):
+            self.assertLessEqual(len(chunk), 50)
+            self.assertEqual(chunk.count('<'), chunk.count('>'), chunk)
+
+    def test_prefers_line_breaks(self):
+        chunks = split_html('первая строка\nвторая строка', 20)
+        self.assertEqual(chunks[0], 'первая строка')
+
+
+class DigestPackTest(unittest.TestCase):
+    def message(self, message_id, text, title='Диван'):
+        return {'id': message_id, 'chat_id': 'chat-1', 'ad_title': title, 'sender': 'Иван',
+                'text': text, 'timestamp': 0}
+
+    def test_messages_share_one_notification(self):
+        digest = DigestBuilder(max_length=4096)
+        digest.add(self.message('m1', 'первое'))
+        digest.add(self.message('m2', 'второе'))
+        packed = digest.flush()
+        self.assertEqual(len(packed), 1)
+        self.assertEqual([message['id'] for message in packed[0][0]], ['m1', 'm2'])
+
+    def test_overlong_entry_is_split_into_parts(self):
+        digest = DigestBuilder(max_length=200)
+        digest.add(self.message('m1', 'короткое'))
+        digest.add(self.message('m2', 'длинное & <текст> ' * 40))
+        digest.add(self.message('m3', 'после'))
+        packed = digest.flush()
+
+        for messages, text in packed:
+            self.assertLessEqual(len(text), 200)
+            self.assertEqual(text.count('<b>'), text.count('</b>'), text)
+        parts = [text for messages, text in packed if [message['id'] for message in messages] == ['m2']]
+        self.assertGreater(len(parts), 1)
+        self.assertIn('(продолжение)', parts[0])
+        self.assertEqual(_text(parts).count('длинное'), 40)
+        self.assertNotIn('&amp', ''.join(parts).replace('&amp;', ''))
+        # Каждое сообщение входит хотя бы в одно уведомление
+        self.assertEqual({message['id'] for messages, _ in packed for message in messages}, {'m1', 'm2', 'm3'})
+
+    def test_max_wait_holds_messages(self):
+        digest = DigestBuilder(max_wait=3600)
+        digest.add(self.message('m1', 'первое'))
+        self.assertEqual(digest.flush(), [])
+        self.assertEqual(digest.pending_ids(), {'m1'})
+        self.assertEqual(len(digest.flush(force=True)), 1)
+        self.assertEqual(digest.pending_ids(), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Подтверждение сообщений Avito пересыльщиком: сообщение отмечается обработанным,
+только когда его уведомление принято (поставлено в очередь для всех chat_id)
+"""
+
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delivery_queue import DeliveryQueue  # noqa: E402
+from main import AvitoMessageForwarder  # noqa: E402
+
+
+def _message(message_id, created):
+    return {'id': message_id, 'created': created, 'author_id': 'buyer',
+            'content': {'text': f'текст {message_id}'}, 'type': 'text'}
+
+
+class _RunningWorker:
+    """Обработчик очереди, работающий в фоне: тест проверяет только постановку в очередь"""
+
+    def is_running(self):
+        return True
+
+    def notify(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class _ForwarderTestCase(unittest.TestCase):
+    """Пересыльщик с очередью уведомлений и одним чатом Avito из трех сообщений"""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.forwarder = AvitoMessageForwarder(self.make_config())
+        self.forwarder.delivery_worker = _RunningWorker()
+        self.client = self.forwarder.avito_client
+        self.chat = {'id': 'chat-1', 'updated': 300}
+        self.messages = [_message('m3', 300), _message('m2', 200), _message('m1', 100)]
+        self.client._changed_chats([self.chat])
+        self.client.iter_messages = lambda auto_finish=True: self.client._chat_new_messages(
+            self.chat, self.messages, auto_finish)
+
+    def tearDown(self):
+        if self.forwarder is not None:
+            self.forwarder.close()
+        self.tmp.cleanup()
+        logging.disable(logging.NOTSET)
+
+    def make_config(self):
+        return {
+            'telegram': {'bot_token': 'token', 'chat_ids': ['100', '200']},
+            'avito': {'user_id': 'me', 'api_key': 'secret', 'dedup': {'backend': 'memory'}},
+            'delivery_queue': {'enabled': True, 'path': os.path.join(self.tmp.name, 'outbox.db')}
+        }
+
+    def processed(self):
+        return {message_id for message_id in ('m1', 'm2', 'm3') if message_id in self.client.processed_messages}
+
+
+class ForwarderAcksTest(_ForwarderTestCase):
+    def test_all_enqueued_messages_are_processed(self):
+        self.assertEqual(self.forwarder.process_messages(), 3)
+        self.assertEqual(self.processed(), {'m1', 'm2', 'm3'})
+        self.assertEqual(self.forwarder.delivery_queue.stats()['pending'], 6)
+
+    def test_enqueue_error_releases_message(self):
+        enqueue = self.forwarder.delivery_queue.enqueue
+
+        def failing_enqueue(chat_id, text, message_key=None):
+            # Первый chat_id принят, второй - нет: уведомление поставлено не полностью
+            if message_key == 'm2' and chat_id == '200':
+                raise OSError('disk full')
+            return enqueue(chat_id, text, message_key=message_key)
+
+        self.forwarder.delivery_queue.enqueue = failing_enqueue
+        self.forwarder.process_messages()
+        self.assertEqual(self.processed(), {'m1', 'm3'})
+        # Сообщение не зарезервировано и будет получено следующей проверкой
+        self.assertTrue(self.client.reserve_message('m2'))
+        self.assertNotEqual(self.client.chat_watermarks.get('chat-1', {}).get('last_id'), 'm3')
+
+    def test_format_error_releases_message(self):
+        format_message = self.forwarder.format_message_for_telegram
+
+        def failing_format(message):
+            if message.get('id') == 'm2':
+                raise ValueError('шаблон')
+            return format_message(message)
+
+        self.forwarder.format_message_for_telegram = failing_format
+        self.forwarder.process_messages()
+        self.assertEqual(self.processed(), {'m1', 'm3'})
+        self.assertTrue(self.client.reserve_message('m2'))
+
+    def test_mark_read_skips_chats_with_undelivered_messages(self):
+        other_chat = {'id': 'chat-2', 'updated': 400}
+        self.client._changed_chats([other_chat])
+        self.client.iter_messages = lambda auto_finish=True: itertools.chain(
+            self.client._chat_new_messages(self.chat, self.messages, auto_finish),
+            self.client._chat_new_messages(other_chat, [_message('n1', 400)], auto_finish))
+        read_chats = []
+        self.client.mark_chats_read = read_chats.extend
+        self.forwarder.mark_read = True
+        format_message = self.forwarder.format_message_for_telegram
+
+        def failing_format(message):
+            if message.get('id') == 'm2':
+                raise ValueError('шаблон')
+            return format_message(message)
+
+        self.forwarder.format_message_for_telegram = failing_format
+        self.forwarder.process_messages()
+        # В chat-1 сообщение m2 не доставлено - чат остается непрочитанным
+        self.assertEqual(read_chats, ['chat-2'])
+
+    def test_no_chat_ids_nothing_processed(self):
+        self.forwarder.chat_ids = []
+        self.forwarder.process_messages()
+        self.assertEqual(self.processed(), set())
+        self.assertEqual(self.forwarder.delivery_queue.stats()['pending'], 0)
+        self.assertTrue(self.client.reserve_message('m1'))
+
+
+class DigestAcksTest(_ForwarderTestCase):
+    """Сообщения, ожидающие в дайджесте (max_wait), не теряются при остановке"""
+
+    def make_config(self):
+        config = super().make_config()
+        config['telegram']['digest'] = {'enabled': True, 'max_wait': 3600}
+        return config
+
+    def test_held_messages_stay_reserved(self):
+        self.forwarder.process_messages()
+        self.assertEqual(self.processed(), set())
+        self.assertEqual(self.forwarder.digest.pending_ids(), {'m1', 'm2', 'm3'})
+        # Следующая проверка снова загружает чат, но ожидающие сообщения не попадают в дайджест дважды
+        self.assertTrue(self.client._chat_changed(self.chat))
+        self.assertEqual(self.forwarder.process_messages(), 0)
+        self.assertEqual(self.forwarder.digest.pending_count(), 3)
+
+    def test_close_flushes_digest(self):
+        self.forwarder.process_messages()
+        self.assertEqual(self.forwarder.delivery_queue.stats()['pending'], 0)
+        self.forwarder.close()
+        forwarder, self.forwarder = self.forwarder, None
+        self.assertEqual(forwarder.digest.pending_count(), 0)
+        self.assertEqual(self.processed(), {'m1', 'm2', 'm3'})
+        queue = DeliveryQueue(os.path.join(self.tmp.name, 'outbox.db'))
+        try:
+            self.assertEqual(queue.stats()['pending'], 2)
+        finally:
+            queue.close()
+
+    def test_enqueue_error_on_close_releases_messages(self):
+        enqueue = self.forwarder.delivery_queue.enqueue
+
+        def failing_enqueue(chat_id, text, message_key=None):
+            if chat_id == '200':
+                raise OSError('disk full')
+            return enqueue(chat_id, text, message_key=message_key)
+
+        self.forwarder.delivery_queue.enqueue = failing_enqueue
+        self.forwarder.process_messages()
+        self.forwarder.close()
+        self.forwarder = None
+        # Дайджест не поставлен в очередь полностью - сообщения будут получены снова после перезапуска
+        self.assertEqual(self.processed(), set())
+        self.assertTrue(self.client.reserve_message('m2'))
+
+    def test_format_error_releases_message(self):
+        def failing_add(message):
+            raise ValueError('шаблон')
+
+        self.forwarder.digest.add = failing_add
+        self.forwarder.process_messages()
+        self.assertEqual(self.processed(), set())
+        self.assertTrue(self.client.reserve_message('m2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
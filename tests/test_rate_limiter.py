@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ограничение частоты: token bucket и пауза по retry_after из ответа 429 Telegram
+"""
+
+import json
+import logging
+import os
+import sys
+import unittest
+from unittest import mock
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import TelegramRateLimiter, TokenBucket  # noqa: E402
+from telegram_sender import TelegramBotApi  # noqa: E402
+
+
+class _Clock:
+    """Управляемое time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _ClockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        patcher = mock.patch('rate_limiter.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TokenBucketTest(_ClockTestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0.0, 0.0, 0.5, 1.0])
+
+    def test_refill_is_capped_by_capacity(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        bucket.reserve()
+        self.clock.now += 60
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0, 0.0, 1.0])
+
+    def test_pause_delays_requests(self):
+        bucket = TokenBucket(rate=10, capacity=10)
+        bucket.pause(5)
+        self.assertAlmostEqual(bucket.reserve(), 5.0)
+        # Более короткая пауза не сокращает уже запрошенную
+        bucket.pause(1)
+        self.clock.now += 2
+        self.assertAlmostEqual(bucket.reserve(), 3.0)
+        self.clock.now += 3
+        self.assertEqual(bucket.reserve(), 0.0)
+
+
+class TelegramRateLimiterTest(_ClockTestCase):
+    def test_retry_after_pauses_only_that_chat(self):
+        limiter = TelegramRateLimiter(global_per_second=30, per_chat_per_second=1, per_chat_burst=1)
+        limiter.retry_after(100, 7)
+        with mock.patch('rate_limiter.time.sleep') as sleep:
+            self.assertAlmostEqual(limiter.acquire('100'), 7.0)
+            self.assertEqual(limiter.acquire('200'), 0.0)
+        sleep.assert_called_once_with(7.0)
+
+
+def _response(status_code, payload, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(payload).encode('utf-8')
+    response.headers.update(headers or {})
+    return response
+
+
+class RetryAfterTest(_ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.limiter = TelegramRateLimiter()
+        self.api = TelegramBotApi('token', ['100'], rate_limiter=self.limiter, max_retries=2)
+
+    def test_parse_retry_after(self):
+        parse = TelegramBotApi._parse_retry_after
+        self.assertEqual(parse(_response(429, {}), {'parameters': {'retry_after': 7}}), 7.0)
+        self.assertEqual(parse(_response(429, {}, {'Retry-After': '3'}), {}), 3.0)
+        self.assertEqual(parse(_response(429, {}, {'Retry-After': 'soon'}), {}), 1.0)
+        self.assertEqual(parse(_response(429, {}), {'parameters': {'retry_after': -5}}), 0.0)
+
+    def test_429_pauses_chat_and_asks_for_retry(self):
+        response = _response(429, {'ok': False, 'description': 'Too Many Requests',
+                                    'parameters': {'retry_after': 4}})
+        self.assertIsNone(self.api._send_result('100', response, attempt=0))
+        self.assertAlmostEqual(self.limiter._chat_bucket('100').reserve(), 4.0)
+
+    def test_429_after_last_retry_fails(self):
+        response = _response(429, {'ok': False, 'description': 'Too Many Requests',
+                                    'parameters': {'retry_after': 4}})
+        result = self.api._send_result('100', response, attempt=2)
+        self.assertFalse(result.ok)
+        self.assertEqual(result.status_code, 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
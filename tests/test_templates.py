@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Шаблоны уведомлений: экранирование значений для HTML и MarkdownV2, в том числе в адресах ссылок
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from templates import MessageTemplate, escape_html, escape_markdown_v2, escape_markdown_v2_url  # noqa: E402
+
+URL = 'https://www.avito.ru/moskva/divan_(new)?a=1&b="2"'
+
+
+class EscapeTest(unittest.TestCase):
+    def test_escape_html(self):
+        self.assertEqual(escape_html('<b>"Tom" & Jerry</b>'),
+                         '&lt;b&gt;&quot;Tom&quot; &amp; Jerry&lt;/b&gt;')
+
+    def test_escape_html_keeps_apostrophe(self):
+        self.assertEqual(escape_html("it's"), "it's")
+
+    def test_escape_markdown_v2(self):
+        special = '_*[]()~`>#+-=|{}.!\\'
+        self.assertEqual(escape_markdown_v2(special), ''.join('\\' + char for char in special))
+        self.assertEqual(escape_markdown_v2('цена 1.500 руб!'), 'цена 1\\.500 руб\\!')
+
+    def test_escape_markdown_v2_url(self):
+        self.assertEqual(escape_markdown_v2_url('https://a.ru/x_(1)\\y.html'), 'https://a.ru/x_(1\\)\\\\y.html')
+
+
+class TemplateEscapeTest(unittest.TestCase):
+    message = {'ad_title': 'Диван (новый)', 'ad_url': URL, 'text': 'a_b', 'timestamp': 0}
+
+    def test_html_link(self):
+        template = MessageTemplate('<a href="{ad_url}">{ad_title}</a>', parse_mode='HTML')
+        self.assertEqual(template.render(self.message),
+                         '<a href="https://www.avito.ru/moskva/divan_(new)?a=1&amp;b=&quot;2&quot;">'
+                         'Диван (новый)</a>')
+
+    def test_markdown_v2_link(self):
+        template = MessageTemplate('[{ad_title}]({ad_url}) {text}', parse_mode='MarkdownV2')
+        self.assertEqual(template.render(self.message),
+                         '[Диван \\(новый\\)](https://www.avito.ru/moskva/divan_(new\\)?a=1&b="2") a\\_b')
+
+    def test_markdown_v2_field_after_link(self):
+        template = MessageTemplate('[ссылка]({ad_url}) \\({ad_title}\\)', parse_mode='MarkdownV2')
+        rendered = template.render(self.message)
+        self.assertTrue(rendered.endswith(' \\(Диван \\(новый\\)\\)'), rendered)
+
+    def test_render_many_matches_render(self):
+        template = MessageTemplate('[{ad_title}]({ad_url})', parse_mode='MarkdownV2')
+        self.assertEqual(template.render_many([self.message]), [template.render(self.message)])
+
+
+if __name__ == '__main__':
+    unittest.main()
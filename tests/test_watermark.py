@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Отметки чатов Avito: отметка не обгоняет сообщения, которые еще не приняты к доставке
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from avito_client import AvitoClient, MessagePager  # noqa: E402
+
+
+def _message(message_id, created, author_id='buyer'):
+    return {'id': message_id, 'created': created, 'author_id': author_id,
+            'content': {'text': message_id}, 'type': 'text'}
+
+
+class WatermarkTest(unittest.TestCase):
+    def setUp(self):
+        self.client = AvitoClient({'user_id': 'me', 'api_key': 'secret', 'dedup': {'backend': 'memory'}})
+        self.chat = {'id': 'chat-1', 'updated': 300}
+        self.client._changed_chats([self.chat])
+        # Новые первыми, как в ответе API
+        self.messages = [_message('m3', 300), _message('m2', 200), _message('m1', 100)]
+
+    def tearDown(self):
+        self.client.close()
+
+    def _refetched(self):
+        """Сообщения, которые загрузит следующая проверка чата"""
+        if not self.client._chat_changed(self.chat):
+            return []
+        pager = MessagePager(self.client.chat_watermarks.get('chat-1'), 100)
+        pager.add_page(self.messages)
+        return [message['id'] for message in pager.messages]
+
+    def test_accepted_messages_advance_watermark(self):
+        for message in self.client._chat_new_messages(self.chat, self.messages):
+            pass
+        self.assertEqual(self.client.chat_watermarks['chat-1'],
+                         {'last_created': 300, 'last_id': 'm3', 'activity': 300})
+        self.assertEqual(self._refetched(), [])
+
+    def test_rejected_message_is_fetched_again(self):
+        messages = self.client._chat_new_messages(self.chat, self.messages)
+        self.assertEqual(next(messages).id, 'm3')
+        self.assertEqual(next(messages).id, 'm2')
+        # Получатель не принял m2: генератор закрыт, m1 еще не выдан
+        messages.close()
+        self.assertEqual(self.client.chat_watermarks.get('chat-1'), None)
+        self.assertEqual(self._refetched(), ['m3', 'm2', 'm1'])
+
+    def test_watermark_stops_before_unaccepted_message(self):
+        messages = self.client._chat_new_messages(self.chat, self.messages)
+        self.assertEqual(next(messages).id, 'm3')
+        self.assertEqual(next(messages).id, 'm2')
+        self.assertEqual(next(messages).id, 'm1')
+        messages.close()
+        # m3 и m2 приняты, m1 (самое старое) - нет: отметка не двигается вовсе
+        self.assertEqual(self._refetched(), ['m3', 'm2', 'm1'])
+
+    def test_message_held_by_webhook(self):
+        # Webhook зарезервировал m2 раньше опроса: опрос его пропускает
+        self.assertTrue(self.client.reserve_message('m2'))
+        ids = [message.id for message in self.client._chat_new_messages(self.chat, self.messages)]
+        self.assertEqual(ids, ['m3', 'm1'])
+        self.assertEqual(self.client.chat_watermarks['chat-1'], {'last_created': 100, 'last_id': 'm1'})
+
+        # Доставка через webhook не удалась - m2 будет загружено снова
+        self.client.finish_message('m2', False)
+        self.assertEqual(self._refetched(), ['m3', 'm2'])
+
+        # После повторной доставки отметка доходит до последнего сообщения
+        self.assertTrue(self.client.reserve_message('m2'))
+        self.client.finish_message('m2', True)
+        self.assertEqual(self.client.chat_watermarks['chat-1'],
+                         {'last_created': 300, 'last_id': 'm3', 'activity': 300})
+
+    def test_own_messages_do_not_hold_watermark(self):
+        self.messages[0] = _message('m3', 300, author_id='me')
+        ids = [message.id for message in self.client._chat_new_messages(self.chat, self.messages)]
+        self.assertEqual(ids, ['m2', 'm1'])
+        self.assertEqual(self.client.chat_watermarks['chat-1']['last_id'], 'm3')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Необязательная трассировка этапов цикла опроса: span в формате, совместимом с OpenTelemetry (OTLP JSON),
+запись в локальный файл и сводка p50/p95 по этапам
+
+Запуск сводки:
+    python tracing.py summary traces.jsonl
+"""
+
+import argparse
+import contextvars
+import json
+import logging
+import math
+import os
+import queue
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    """Один этап: имя, родитель, время начала и окончания, атрибуты и статус"""
+
+    __slots__ = ('tracer', 'name', 'trace_id', 'span_id', 'parent_id', 'start_ns', 'end_ns',
+                 'attributes', 'error', '_token')
+
+    def __init__(self, tracer: 'Tracer', name: str, parent: Optional['Span'], attributes: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.error: Optional[str] = None
+        self.start_ns = 0
+        self.end_ns = 0
+        self._token = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def __enter__(self) -> 'Span':
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.tracer.export(self)
+
+    def to_dict(self) -> Dict:
+        """Span в виде записи OTLP JSON"""
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'attributes': [{'key': key, 'value': _attribute_value(value)}
+                           for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1}
+        }
+
+
+class _NoopSpan:
+    """Span выключенной трассировки: ничего не записывает и почти ничего не стоит"""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _UnsampledSpan(_NoopSpan):
+    """Корневой span трассы, не попавшей в выборку: дочерние span тоже не записываются"""
+
+    __slots__ = ('_token',)
+
+    def __enter__(self) -> '_UnsampledSpan':
+        self._token = _current_span.set(UNSAMPLED)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+
+
+UNSAMPLED = _NoopSpan()
+
+
+def _attribute_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class JsonFileExporter:
+    """Запись span в файл по одному JSON объекту на строку в фоновом потоке"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: 'queue.Queue[Optional[Dict]]' = queue.Queue()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='trace-export', daemon=True)
+        self._thread.start()
+
+    def export(self, record: Dict):
+        self._queue.put(record)
+
+    def _run(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    f.flush()
+                    return
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+class Tracer:
+    """Создание span с учетом текущего родителя и доли записываемых трасс"""
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 1.0
+        self.exporter: Optional[JsonFileExporter] = None
+
+    def configure(self, path: str, sample_rate: float = 1.0):
+        """
+        Включение трассировки
+
+        Args:
+            path: Файл для записи span (JSON lines)
+            sample_rate: Доля записываемых циклов (0.0 - 1.0)
+        """
+        self.close()
+        self.exporter = JsonFileExporter(path)
+        self.sample_rate = sample_rate
+        self.enabled = True
+        logger.info(f"Трассировка включена, span записываются в {path}")
+
+    def span(self, name: str, **attributes):
+        """
+        Span этапа (контекстный менеджер)
+
+        Корневой span начинает новую трассу с вероятностью sample_rate, дочерние
+        записываются, только если записывается родитель.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        if parent is UNSAMPLED:
+            return NOOP_SPAN
+        if parent is None and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return _UnsampledSpan()
+        return Span(self, name, parent, attributes)
+
+    def export(self, span: Span):
+        if self.exporter is not None:
+            self.exporter.export(span.to_dict())
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
+            self.exporter = None
+        self.enabled = False
+
+
+TRACER = Tracer()
+
+
+def span(name: str, **attributes):
+    """Span этапа у общего трассировщика процесса"""
+    return TRACER.span(name, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    """Текущий записываемый span (None, если трассировка выключена или трасса не в выборке)"""
+    current = _current_span.get()
+    return current if isinstance(current, Span) else None
+
+
+def configure_tracing(tracing_config: Dict):
+    """
+    Включение трассировки по секции tracing конфигурации
+
+    Args:
+        tracing_config: {"enabled": true, "path": "logs/traces.jsonl", "sample_rate": 1.0}
+    """
+    if tracing_config.get('enabled'):
+        TRACER.configure(tracing_config.get('path', 'traces.jsonl'), tracing_config.get('sample_rate', 1.0))
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Метод ближайшего ранга
+    index = min(len(sorted_values) - 1, max(0, math.ceil(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(path: str) -> List[Dict]:
+    """
+    Сводка длительностей по этапам из файла span
+
+    Args:
+        path: Файл, записанный JsonFileExporter
+
+    Returns:
+        List[Dict]: Для каждого имени span: count, errors, p50, p95, max и total в миллисекундах
+    """
+    durations: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            name = record.get('name', '?')
+            duration = (record['endTimeUnixNano'] - record['startTimeUnixNano']) / 1e6
+            durations.setdefault(name, []).append(duration)
+            if record.get('status', {}).get('code') == 2:
+                errors[name] = errors.get(name, 0) + 1
+
+    result = []
+    for name, values in durations.items():
+        values.sort()
+        result.append({
+            'stage': name,
+            'count': len(values),
+            'errors': errors.get(name, 0),
+            'p50_ms': round(_percentile(values, 50), 3),
+            'p95_ms': round(_percentile(values, 95), 3),
+            'max_ms': round(values[-1], 3),
+            'total_ms': round(sum(values), 3)
+        })
+    result.sort(key=lambda row: row['total_ms'], reverse=True)
+    return result
+
+
+def print_summary(rows: List[Dict]):
+    """Вывод сводки таблицей"""
+    width = max([len('stage')] + [len(row['stage']) for row in rows])
+    print(f"{'stage':<{width}} {'count':>7} {'errors':>6} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'total ms':>11}")
+    for row in rows:
+        print(f"{row['stage']:<{width}} {row['count']:>7} {row['errors']:>6} {row['p50_ms']:>10.2f} "
+              f"{row['p95_ms']:>10.2f} {row['max_ms']:>10.2f} {row['total_ms']:>11.2f}")
+
+
+def main():
+    """Сводка по файлу трассировки из командной строки"""
+    parser = argparse.ArgumentParser(description='Сводка трассировки Avito Message Forwarder')
+    parser.add_argument('command', choices=['summary'], help='Команда')
+    parser.add_argument('path', help='Файл span (JSON lines)')
+    parser.add_argument('--json', action='store_true', help='Вывести сводку в формате JSON')
+    args = parser.parse_args()
+
+    rows = summarize(args.path)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print_summary(rows)
+
+
+if __name__ == "__main__":
+    main()
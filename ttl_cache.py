@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ограниченный кэш с временем жизни записей (TTL) и вытеснением давно не использованных (LRU)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar('V')
+
+
+class TTLCache(Generic[V]):
+    """Кэш ключ -> значение: запись живет ttl секунд, сверх max_size вытесняются самые старые по использованию"""
+
+    def __init__(self, max_size: int = 10000, ttl: Optional[float] = 3600):
+        """
+        Args:
+            max_size: Максимальное количество записей
+            ttl: Время жизни записи в секундах (None - без ограничения)
+        """
+        self.max_size = max(1, int(max_size))
+        self.ttl = ttl
+        # ключ -> (значение, время истечения)
+        self._items: 'OrderedDict[Hashable, Tuple[V, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        """Значение по ключу или default, если записи нет или она устарела"""
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] <= now:
+                if item is not None:
+                    del self._items[key]
+                self.stats['misses'] += 1
+                return default
+            self._items.move_to_end(key)
+            self.stats['hits'] += 1
+            return item[0]
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None):
+        """
+        Запись значения
+
+        Args:
+            key: Ключ
+            value: Значение
+            ttl: Время жизни этой записи (по умолчанию - ttl кэша)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl is not None else float('inf')
+        with self._lock:
+            self._items[key] = (value, expires)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def peek(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        """Значение по ключу без учета в статистике и без изменения порядка вытеснения"""
+        with self._lock:
+            item = self._items.get(key)
+            return item[0] if item is not None and item[1] > time.time() else default
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._items.get(key)
+            return item is not None and item[1] > time.time()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, 'size': len(self._items)}
+
+    def save(self, path: str):
+        """
+        Атомарная запись действующих записей в JSON файл (в порядке вытеснения)
+
+        Значения должны сериализоваться в JSON (именованные кортежи записываются списками).
+
+        Args:
+            path: Путь к файлу
+        """
+        now = time.time()
+        with self._lock:
+            entries: List = [[key, value, None if expires == float('inf') else expires]
+                             for key, (value, expires) in self._items.items() if expires > now]
+        tmp_file = f"{path}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_file, path)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить кэш {path}: {e}")
+
+    def load(self, path: str, decode: Callable = lambda value: value) -> int:
+        """
+        Загрузка записей, сохраненных save (устаревшие пропускаются, время жизни сохраняется)
+
+        Args:
+            path: Путь к файлу
+            decode: Восстановление значения из JSON (например, lambda v: Model(*v))
+
+        Returns:
+            int: Количество загруженных записей
+        """
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать кэш {path}: {e}")
+            return 0
+
+        now = time.time()
+        loaded = 0
+        with self._lock:
+            for key, value, expires in entries:
+                expires = float('inf') if expires is None else float(expires)
+                if expires <= now:
+                    continue
+                try:
+                    self._items[key] = (decode(value), expires)
+                except Exception:
+                    continue
+                self._items.move_to_end(key)
+                loaded += 1
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return loaded
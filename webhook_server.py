@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Прием webhook уведомлений Avito Messenger о новых сообщениях
+"""
+
+import asyncio
+import hmac
+import logging
+from typing import Callable, Dict, Optional
+
+from http_server import AsyncHttpServer, Request, Response, json_response
+
+logger = logging.getLogger(__name__)
+
+
+class AvitoWebhookReceiver:
+    """Обработчик POST запросов Avito: проверяет секрет и передает сообщение дальше, не задерживая ответ"""
+
+    def __init__(self, on_message: Callable[[Dict], None], path: str = '/avito/webhook',
+                 secret: Optional[str] = None):
+        """
+        Args:
+            on_message: Функция обработки payload.value (вызывается в пуле потоков)
+            path: Путь webhook
+            secret: Секрет, который должен прийти в параметре ?token= (None - без проверки)
+        """
+        self.on_message = on_message
+        self.path = path
+        self.secret = secret
+        self.stats = {'received': 0, 'accepted': 0, 'rejected': 0}
+
+    def attach(self, server: AsyncHttpServer):
+        """Регистрация маршрутов на сервере"""
+        server.add_route('POST', self.path, self.handle)
+        server.add_route('GET', self.path, self.handle_check)
+
+    async def handle_check(self, request: Request) -> Response:
+        """Ответ на проверку доступности адреса"""
+        return json_response(200, {'ok': True})
+
+    async def handle(self, request: Request) -> Response:
+        """
+        Обработка уведомления Avito
+
+        Args:
+            request: HTTP запрос
+
+        Returns:
+            Response: 200 сразу после проверки, сама пересылка идет в фоне
+        """
+        self.stats['received'] += 1
+
+        if self.secret and not hmac.compare_digest(request.query.get('token', ''), self.secret):
+            self.stats['rejected'] += 1
+            logger.warning("Webhook Avito отклонен: неверный token")
+            return json_response(403, {'ok': False})
+
+        try:
+            data = request.json()
+        except (ValueError, UnicodeDecodeError):
+            self.stats['rejected'] += 1
+            return json_response(400, {'ok': False, 'error': 'invalid json'})
+
+        payload = data.get('payload') if isinstance(data, dict) else None
+        if not isinstance(payload, dict) or not isinstance(payload.get('value'), dict):
+            self.stats['rejected'] += 1
+            return json_response(400, {'ok': False, 'error': 'invalid payload'})
+
+        if payload.get('type', 'message') != 'message':
+            # Прочие события (например, system) не пересылаем, но подтверждаем
+            return json_response(200, {'ok': True})
+
+        self.stats['accepted'] += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, self.on_message, payload['value'])
+        future.add_done_callback(self._log_failure)
+        return json_response(200, {'ok': True})
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Ошибка обработки webhook сообщения: {future.exception()}")